@@ -0,0 +1,245 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+def new_session_id():
+    return uuid.uuid4().hex[:12]
+
+
+class ArtifactStore:
+    """
+    Generated files under artifacts/<a>/<bc>/, sharded by a hash of the artifact
+    name into 4096 directories (about 250 files each at a million artifacts). Names carry the session id
+    (a uuid, not the seed) and a random suffix, so concurrent sessions never collide.
+    A SQLite index maps (session, turn, kind) to paths.
+    """
+
+    def __init__(self, root=None, index_path=None):
+        self.root = root or os.path.join(os.getcwd(), "artifacts")
+        os.makedirs(self.root, exist_ok=True)
+        self.index_path = index_path or os.path.join(self.root, "index.sqlite")
+        self._lock = threading.Lock()
+        self._dirs = set()
+        self._reserved = {}
+        self._db = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS artifacts (
+            path TEXT PRIMARY KEY, session TEXT NOT NULL, turn INTEGER NOT NULL, kind TEXT NOT NULL,
+            tenant TEXT, created REAL NOT NULL) WITHOUT ROWID""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS artifacts_session ON artifacts (session, turn)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS artifacts_created ON artifacts (created, path)")
+
+    def shard_dir(self, name):
+        digest = hashlib.blake2b(name.encode("utf-8"), digest_size=2).hexdigest()
+        return os.path.join(self.root, digest[:1], digest[1:3])
+
+    def _ensure_dir(self, directory):
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        return directory
+
+    def allocate(self, session, turn, kind, ext=".png", tenant=None):
+        """
+        Reserve a unique path for a new artifact; the caller writes it (the image
+        registry's writes are already write-then-rename). The path is indexed only
+        by commit(), once the file exists; discard() drops a failed reservation.
+        """
+        name = f"{session}_{turn}_{kind}_{uuid.uuid4().hex[:8]}{ext}"
+        path = os.path.join(self._ensure_dir(self.shard_dir(name)), name)
+        with self._lock:
+            self._reserved[path] = (str(session), int(turn), kind, tenant)
+        return path
+
+    def allocate_derived(self, parent, kind, ext=".png"):
+        """
+        Reserve a path for a file derived from another artifact (a preview tier), with
+        the parent's session, turn and tenant. None if parent is not a store artifact.
+        """
+        with self._lock:
+            meta = self._reserved.get(parent)
+            if meta is None:
+                row = self._db.execute("SELECT session, turn, kind, tenant FROM artifacts WHERE path = ?",
+                                       (os.path.relpath(parent, self.root),)).fetchone()
+                meta = tuple(row) if row else None
+        if meta is None:
+            return None
+        session, turn, _, tenant = meta
+        return self.allocate(session, turn, kind, ext=ext, tenant=tenant)
+
+    def commit(self, path):
+        """
+        Index a reserved path after its file was written.
+        """
+        with self._lock:
+            session, turn, kind, tenant = self._reserved.pop(path)
+        self._insert([(os.path.relpath(path, self.root), session, turn, kind, tenant, time.time())])
+        return path
+
+    def discard(self, path):
+        with self._lock:
+            self._reserved.pop(path, None)
+
+    def _insert(self, rows):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("COMMIT")
+
+    def lookup(self, session, turn=None, kind=None):
+        """
+        Absolute paths of a session's artifacts (optionally one turn / kind), oldest first.
+        """
+        query, args = "SELECT path FROM artifacts WHERE session = ?", [str(session)]
+        if turn is not None:
+            query, args = query + " AND turn = ?", args + [int(turn)]
+        if kind is not None:
+            query, args = query + " AND kind = ?", args + [kind]
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY turn, created", args).fetchall()
+        return [os.path.join(self.root, row[0]) for row in rows]
+
+    def entries(self, session=None, after=None, limit=None):
+        """
+        (path, session, turn, kind, tenant, created) rows, oldest first. Page with
+        after=(created, path) of the last row seen and a limit, so a scan of the whole
+        index never holds the lock for long.
+        """
+        query, where, args = "SELECT path, session, turn, kind, tenant, created FROM artifacts", [], []
+        if session is not None:
+            where, args = where + ["session = ?"], args + [str(session)]
+        if after is not None:
+            where, args = where + ["(created, path) > (?, ?)"], args + [after[0], os.path.relpath(after[1], self.root)]
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY created, path"
+        if limit is not None:
+            query, args = query + " LIMIT ?", args + [int(limit)]
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [(os.path.join(self.root, row[0]),) + tuple(row[1:]) for row in rows]
+
+    def sessions(self, after=None, limit=None):
+        """
+        {session: (tenant, last artifact time)}, by session id; page with after=<last session>.
+        """
+        query, args = "SELECT session, MAX(tenant), MAX(created) FROM artifacts", []
+        if after is not None:
+            query, args = query + " WHERE session > ?", [str(after)]
+        query += " GROUP BY session ORDER BY session"
+        if limit is not None:
+            query, args = query + " LIMIT ?", args + [int(limit)]
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def remove(self, paths):
+        """
+        Drop index rows (the caller deletes the files).
+        """
+        rows = [(os.path.relpath(path, self.root),) for path in paths]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM artifacts WHERE path = ?", rows)
+            self._db.execute("COMMIT")
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore(os.getenv("ARTIFACT_DIR") or None)
+        return _store
+
+
+# ------------------ Benchmark ------------------
+def benchmark(artifacts=1_000_000, files=100_000, sessions=20_000, lookups=2_000, seed=0):
+    """
+    Index at `artifacts` entries: bulk load, single allocations and per-session lookups.
+    Files on disk at `files` (empty ones): creating them and listing one session's
+    outputs in a flat image/ directory vs the sharded store.
+    """
+    import random
+    import shutil
+    import tempfile
+
+    rng = random.Random(seed)
+    root = tempfile.mkdtemp(prefix="artifact_bench_")
+    try:
+        store = ArtifactStore(os.path.join(root, "store"))
+        start = time.perf_counter()
+        batch = []
+        for i in range(artifacts):
+            session = f"s{i % sessions:06d}"
+            name = f"{session}_{i // sessions}_initial_{i:08x}.png"
+            batch.append((os.path.join(name[:2], name), session, i // sessions, "initial", None, float(i)))
+            if len(batch) == 50_000:
+                store._insert(batch)
+                batch = []
+        if batch:
+            store._insert(batch)
+        load_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(lookups):
+            store.lookup(f"s{rng.randrange(sessions):06d}")
+        lookup_us = (time.perf_counter() - start) / lookups * 1e6
+        start = time.perf_counter()
+        for i in range(lookups):
+            store.commit(store.allocate(f"new{i}", 1, "initial"))
+        allocate_us = (time.perf_counter() - start) / lookups * 1e6
+        print(f"index: {store.count():,} artifacts loaded in {load_s:.1f}s, "
+              f"session lookup {lookup_us:.0f} us, allocate + commit {allocate_us:.0f} us, "
+              f"{os.path.getsize(store.index_path) / 1e6:.0f} MB")
+
+        flat_dir = os.path.join(root, "image")
+        os.makedirs(flat_dir)
+        sharded = ArtifactStore(os.path.join(root, "sharded"))
+        names = [f"s{i % sessions:06d}_{i // sessions}_initial_{i:08x}.png" for i in range(files)]
+        start = time.perf_counter()
+        for name in names:
+            open(os.path.join(flat_dir, name), "wb").close()
+        flat_create = time.perf_counter() - start
+        start = time.perf_counter()
+        rows = []
+        for name in names:
+            directory = sharded._ensure_dir(sharded.shard_dir(name))
+            open(os.path.join(directory, name), "wb").close()
+            rows.append((os.path.relpath(os.path.join(directory, name), sharded.root), name.split("_")[0], 0, "initial", None, 0.0))
+        sharded._insert(rows)
+        sharded_create = time.perf_counter() - start
+        probes = [f"s{rng.randrange(min(sessions, files)):06d}" for _ in range(50)]
+        start = time.perf_counter()
+        for session in probes:
+            [n for n in os.listdir(flat_dir) if n.startswith(session + "_")]
+        flat_list_ms = (time.perf_counter() - start) / len(probes) * 1000
+        start = time.perf_counter()
+        for session in probes:
+            sharded.lookup(session)
+        sharded_list_ms = (time.perf_counter() - start) / len(probes) * 1000
+        print(f"{files:,} files: create flat {flat_create:.1f}s vs sharded {sharded_create:.1f}s; "
+              f"list a session flat {flat_list_ms:.1f} ms vs sharded {sharded_list_ms:.3f} ms")
+        store.close()
+        sharded.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from collections import deque
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import metrics
+
+
+class CircuitOpen(RuntimeError):
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable (circuit open), retry in {retry_in:.0f}s.")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Per-endpoint breaker. Trips (opens) when, over the last `window` calls, the error
+    rate or the slow-call rate reaches its threshold; while open, calls fail immediately.
+    After `open_s` one probe call is let through (half-open): success closes the
+    circuit, failure or a slow response opens it again.
+    """
+
+    def __init__(self, name, window=20, min_calls=5, error_rate=0.5, slow_call_s=30.0, slow_rate=0.5, open_s=30.0):
+        self.name = name
+        self.window = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_s = slow_call_s
+        self.slow_rate = slow_rate
+        self.open_s = open_s
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self.stats = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "trips": 0}
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raises CircuitOpen instead of letting a call through to a dead upstream.
+        """
+        with self._lock:
+            if self.state == "open":
+                waited = time.monotonic() - self.opened_at
+                if waited < self.open_s:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpen(self.name, self.open_s - waited)
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "half_open":
+                if self.probing:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpen(self.name, 0)
+                self.probing = True
+            self.stats["calls"] += 1
+
+    def _trip(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.stats["trips"] += 1
+        print(f"🔌 Circuit for {self.name} opened; failing fast for {self.open_s:.0f}s.")
+
+    def record(self, ok, seconds):
+        slow = seconds >= self.slow_call_s
+        with self._lock:
+            self.stats["failures"] += int(not ok)
+            self.stats["slow"] += int(slow)
+            if self.state == "half_open":
+                if ok and not slow:
+                    self.state = "closed"
+                    self.window.clear()
+                    print(f"🔌 Circuit for {self.name} closed again.")
+                else:
+                    self._trip()
+                return
+            self.window.append((ok, slow))
+            if self.state == "closed" and len(self.window) >= self.min_calls:
+                errors = sum(1 for o, _ in self.window if not o) / len(self.window)
+                slows = sum(1 for _, s in self.window if s) / len(self.window)
+                if errors >= self.error_rate or slows >= self.slow_rate:
+                    self._trip()
+
+    def call(self, fn, is_failure=None):
+        """
+        Run fn through the breaker. is_failure(result) marks returned values (e.g. HTTP
+        5xx responses) as failures; exceptions always count as failures.
+        """
+        self.before_call()
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        self.record(not (is_failure and is_failure(result)), time.monotonic() - start)
+        return result
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name, **kwargs):
+    with _breakers_lock:
+        if name not in _breakers:
+            defaults = {"open_s": float(os.getenv("CIRCUIT_OPEN_S", "30")), "slow_call_s": float(os.getenv("CIRCUIT_SLOW_CALL_S", "30"))}
+            _breakers[name] = CircuitBreaker(name, **{**defaults, **kwargs})
+        return _breakers[name]
+
+
+def report():
+    with _breakers_lock:
+        return {name: {"state": b.state, **b.stats} for name, b in _breakers.items()}
+
+
+metrics.registry.collected("circuit_breaker_open", "1 while a breaker rejects calls (open or probing)",
+                           lambda: {(name,): int(b.state != "closed") for name, b in list(_breakers.items())}, ["breaker"])
+
+
+class LLMCircuitBreaker(BaseCallbackHandler):
+    """
+    Breaker per LLM backend (from the "backend:" tag set by llm_backends.get_llm).
+    raise_error makes the CircuitOpen raised in on_*_start abort the call.
+    """
+
+    raise_error = True
+
+    def __init__(self):
+        self._runs = {}
+
+    def _start(self, run_id, tags):
+        backend = next((t[len("backend:"):] for t in tags or [] if t.startswith("backend:")), "unknown")
+        breaker = breaker_for(f"llm:{backend}", slow_call_s=float(os.getenv("CIRCUIT_LLM_SLOW_CALL_S", "20")))
+        breaker.before_call()
+        self._runs[run_id] = (breaker, time.monotonic())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        self._start(run_id, tags)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        self._start(run_id, tags)
+
+    def _finish(self, run_id, ok):
+        started = self._runs.pop(run_id, None)
+        if started is not None:
+            breaker, start = started
+            breaker.record(ok, time.monotonic() - start)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, True)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, False)
+
+
+llm_breaker = LLMCircuitBreaker()
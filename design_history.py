@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import time
+
+import image_registry
+
+HISTORY_DIR = os.path.join(os.getcwd(), "history")
+
+
+def file_sha256(path):
+    """
+    Hash an image file so history nodes can verify their cached artifact.
+    """
+    return hashlib.sha256(image_registry.registry.get_bytes(path)).hexdigest()
+
+
+class DesignHistory:
+    """
+    Per-session version graph of accepted turns.
+
+    Every accepted turn becomes a node (prompt, params, seed, parent, image hash and a
+    snapshot of the session state). Rolling back or branching only moves the head and
+    restores the snapshot, so navigating history never calls the image API.
+    """
+
+    def __init__(self, session_id, base_dir=None):
+        if base_dir is None:
+            base_dir = HISTORY_DIR
+        os.makedirs(base_dir, exist_ok=True)
+        self.session_id = str(session_id)
+        self.path = os.path.join(base_dir, f"{self.session_id}.json")
+        self.nodes = {}
+        self.head = None
+        self._next_id = 1
+        if os.path.isfile(self.path):
+            self.load()
+
+    # ------------------ Recording ------------------
+    def record(self, intent, prompt, image_path, seed, params=None, state=None):
+        node_id = f"t{self._next_id}"
+        self._next_id += 1
+        self.nodes[node_id] = {
+            "id": node_id,
+            "parent": self.head,
+            "intent": intent,
+            "prompt": prompt,
+            "params": dict(params or {}),
+            "seed": seed,
+            "image_path": image_path,
+            "image_hash": file_sha256(image_path) if image_path and image_registry.registry.exists(image_path) else None,
+            "state": dict(state or {}),
+            "created_at": time.time(),
+        }
+        self.head = node_id
+        self.save()
+        return node_id
+
+    # ------------------ Navigation ------------------
+    def checkout(self, node_id):
+        """
+        Move the head to an existing node and return its session-state snapshot.
+        The next recorded turn becomes a child of this node (i.e. a new branch).
+        """
+        node = self.nodes.get(node_id)
+        if node is None:
+            raise KeyError(f"Unknown history node: {node_id}")
+        image_path = node["image_path"]
+        if not image_path or not image_registry.registry.exists(image_path):
+            raise FileNotFoundError(f"Cached artifact missing for {node_id}: {image_path}")
+        if node["image_hash"] and file_sha256(image_path) != node["image_hash"]:
+            raise ValueError(f"Cached artifact for {node_id} was modified: {image_path}")
+        self.head = node_id
+        self.save()
+        return dict(node["state"])
+
+    def undo(self):
+        if self.head is None or self.nodes[self.head]["parent"] is None:
+            raise KeyError("Nothing to roll back to.")
+        return self.checkout(self.nodes[self.head]["parent"])
+
+    def lineage(self, node_id=None):
+        node_id = node_id or self.head
+        chain = []
+        while node_id is not None:
+            chain.append(node_id)
+            node_id = self.nodes[node_id]["parent"]
+        return list(reversed(chain))
+
+    def children(self, node_id):
+        return [n["id"] for n in self.nodes.values() if n["parent"] == node_id]
+
+    def render(self):
+        lines = []
+
+        def walk(node_id, depth):
+            node = self.nodes[node_id]
+            marker = "*" if node_id == self.head else " "
+            lines.append(f"{marker} {'  ' * depth}{node_id} [{node['intent']}] {(node.get('prompt') or '')[:60]}")
+            for child in self.children(node_id):
+                walk(child, depth + 1)
+
+        for root in self.children(None):
+            walk(root, 0)
+        return "\n".join(lines) if lines else "(empty history)"
+
+    # ------------------ Persistence ------------------
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"head": self.head, "next_id": self._next_id, "nodes": self.nodes}, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        self.nodes = data.get("nodes", {})
+        self.head = data.get("head")
+        self._next_id = data.get("next_id", len(self.nodes) + 1)
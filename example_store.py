@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples")
+STATE_WEIGHT = 0.5
+
+
+class HashingEmbedder:
+    """
+    CPU-only text embedding without a model: word unigrams/bigrams and character
+    trigrams hashed (crc32, stable across runs) into a fixed-size L2-normalized vector.
+    """
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def features(self, text):
+        words = re.findall(r"[a-z0-9]+", str(text).lower())
+        feats = words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            feats.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return feats
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feat in self.features(text):
+                h = zlib.crc32(feat.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-8)
+
+
+class SentenceEmbedder:
+    """
+    Optional local sentence-transformers model (CPU), used when EXAMPLE_EMBEDDING_MODEL is set.
+    """
+
+    def __init__(self, model_name):
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(self, texts):
+        return np.asarray(self.model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+
+_default_embedder = None
+
+
+def default_embedder():
+    global _default_embedder
+    if _default_embedder is None:
+        model_name = os.getenv("EXAMPLE_EMBEDDING_MODEL")
+        if model_name and SentenceTransformer is not None:
+            _default_embedder = SentenceEmbedder(model_name)
+        else:
+            _default_embedder = HashingEmbedder()
+    return _default_embedder
+
+
+class ExampleStore:
+    """
+    Labeled few-shot examples with a brute-force NumPy cosine index.
+
+    Each record is one JSONL line: {"key": text to match on, "text": rendered example,
+    "label": optional class, "state": optional session-state hint}. The key and state
+    are embedded separately and combined, so retrieval follows both the user input and
+    the current session state.
+    """
+
+    def __init__(self, path=None, records=None, embedder=None):
+        self.path = path
+        self.embedder = embedder or default_embedder()
+        self.records = []
+        self._matrix = None
+        self._size = 0
+        if records is None and path and os.path.isfile(path):
+            with open(path, "r") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        if records:
+            self._append(records)
+
+    def __len__(self):
+        return self._size
+
+    def texts(self):
+        return [r["text"] for r in self.records]
+
+    def _vectors(self, keys, states):
+        vecs = self.embedder.embed(keys)
+        if any(states):
+            vecs = vecs + STATE_WEIGHT * self.embedder.embed(states)
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-8)
+        return vecs
+
+    def _append(self, records):
+        vecs = self._vectors([r["key"] for r in records], [r.get("state", "") for r in records])
+        needed = self._size + len(records)
+        if self._matrix is None or needed > self._matrix.shape[0]:
+            grown = np.zeros((max(needed, 2 * self._size, 16), vecs.shape[1]), dtype=np.float32)
+            if self._matrix is not None:
+                grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size:needed] = vecs
+        self.records.extend(records)
+        self._size = needed
+
+    def add(self, key, text, label=None, state=""):
+        record = {"key": key, "text": text, "label": label, "state": state}
+        self._append([record])
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    def search(self, query, k, state="", max_per_label=None):
+        """
+        Return indices of the k nearest records, best first. max_per_label keeps a
+        single label from filling every slot (e.g. eight 'adjust' intent examples).
+        """
+        if self._size == 0:
+            return []
+        q = self._vectors([query], [state])[0]
+        scores = self._matrix[:self._size] @ q
+        pool = min(self._size, k * 4 if max_per_label else k)
+        top = np.argpartition(-scores, pool - 1)[:pool]
+        top = top[np.argsort(-scores[top])]
+        if not max_per_label:
+            return top[:k].tolist()
+        picked, per_label = [], {}
+        for i in top.tolist():
+            label = self.records[i].get("label")
+            if per_label.get(label, 0) >= max_per_label:
+                continue
+            per_label[label] = per_label.get(label, 0) + 1
+            picked.append(i)
+            if len(picked) == k:
+                break
+        return picked
+
+
+def load_store(name):
+    return ExampleStore(os.path.join(EXAMPLES_DIR, f"{name}.jsonl"))
+
+
+# ------------------ Benchmark ------------------
+def benchmark(n=5000, queries=500, k=8):
+    import random
+
+    rng = random.Random(0)
+    vocab = ("add remove change color pattern dog cat flames stars hood door roof red blue silver "
+             "matte neon geometric lines make it pop sleek bold subtle start over done replace").split()
+    records = [{"key": " ".join(rng.choice(vocab) for _ in range(8)), "text": f"example {i}",
+                "label": rng.choice(["initial", "adjust", "edit", "replace", "done"]),
+                "state": f"last intent {rng.choice(['adjust', 'edit'])}"} for i in range(n)]
+    start = time.perf_counter()
+    store = ExampleStore(records=records, embedder=HashingEmbedder())
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        store.search(" ".join(rng.choice(vocab) for _ in range(6)), k, state="last intent edit", max_per_label=3)
+    query_ms = (time.perf_counter() - start) / queries * 1000
+    print(f"index {n} examples: {build_s:.2f} s")
+    print(f"retrieve top-{k}: {query_ms:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -35,6 +35,15 @@ print(f"STABILITY_API_KEY: {stability_api_key[:5]}...") if stability_api_key els
 import img2img_tool as img2img
 import inpainting_tool as inp
 import text2image_tool as txt2img
+from design_history import DesignHistory
+import print_pipeline
+import phash_index
+import image_workers
+import image_registry
+import part_segmentation
+import job_queue
+import stability_client
+import preflight
 from langchain.chat_models import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.agents import Tool, initialize_agent
@@ -44,19 +53,38 @@ from langchain.agents.openai_functions_agent.base import create_openai_functions
 from langchain.agents import AgentExecutor
 from langchain_core.tools import Tool,StructuredTool
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+from prompt_assembly import FewShotPrompt, ExampleSection
+from example_store import load_store
+from llm_backends import get_llm, latency_tracker
+from json_repair import parse_llm_json, parse_stats
+from turn_budget import start_turn, BudgetExceeded
+import circuit_breaker
+import metrics
+import profiler
+import replay
+import artifact_store
+from session_state import SessionState
+import retention
+from warmup import start_warmup
+from suggestion_cache import SuggestionCache, signature, representative_state, all_guidance_keys
+import llm_backends
+import openai
 import requests
 import re
 import random
+import time
 
 # Initialize
-llm = ChatOpenAI(model="gpt-4o", temperature=0.3, openai_api_key=openai_api_key)
+# Per-chain model routing (see llm_backends.DEFAULT_ROUTES); `llm` stays the strong default
+llm = get_llm("default")
 #short_term_memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
 #session_state = {"last_image_url": None, "last_prompt": None,"last_pattern":None,"last_color":None,"last_request":None,"last_part":None}
 
 
 # ------------------ Prompts & Runnables ------------------
-def create_chain(prompt_template):
-    return prompt_template | llm
+def create_chain(prompt_template, chain_name="default"):
+    return prompt_template | get_llm(chain_name)
 
 # ------------------- Prompt Examples -------------------
 example_chain = create_chain(PromptTemplate.from_template(
@@ -69,11 +97,10 @@ Examples:
 2. Geometric lines in silver
 3. Solid matte black color change
 """
-))
+), "example_chain")
 
 # ------------------- Planning & Parsing -------------------
-extract_design_chain = PromptTemplate.from_template(
-    """
+DESIGN_PREFIX = """
 You are an expert car wrap creative assistant.
 
 Based on the user's input, always extract the following **clearly and completely**, even if the user is vague or only expresses a mood or emotion.
@@ -103,114 +130,9 @@ Rules:
 - You MUST always generate a full new design intent when the detected intent is 'initial', regardless of the user only mentioning adding an element or placing it somewhere (e.g., 'add a dog on the door').
 - When intent is 'initial', ignore the casual phrasing and instead infer the most matching pattern, color, style, and request for a new car wrap.
 - If the user only mentions an object like 'dog' or a part like 'door', infer the most logical matching pattern, color, style, and create a holistic design description.
+"""
 
-
-Design principle examples:
-- For corporate, formal, elegant: pattern 'geometric lines' or 'minimal lines', color 'dark blue', 'silver', style 'photographic'.
-- For fun, cute: pattern 'dog and cat illustration', color 'natural fur colors', style 'anime'.
-- For futuristic, tech: pattern 'robot illustration' or 'digital circuit', color 'silver and blue', style 'digital-art'.
-
-Few-shot examples:
-
-Input: "Add a dog on the door"
-Output:
-- Pattern: dog illustration
-- Color: natural fur colors
-- Style: digital-art
-- Request: friendly, playful, modern
-
-Input: "Change color to red"
-Output:
-- Pattern: solid color
-- Color: red
-- Style: tile-texture
-- Request: pure color, clean, no patterns
-
-Input: "Make it green"
-Output:
-- Pattern: solid color
-- Color: green
-- Style: photographic
-- Request: pure color, clean, no patterns
-
-Input: "I like red flames"
-Output:
-- Pattern: flames
-- Color: red
-- Style: digital-art
-- Request: aggressive, high-energy
-
-Input: "geometric lines and blue"
-Output:
-- Pattern: geometric lines
-- Color: blue
-- Style: digital-art
-- Request: sleek, modern
-
-Input: "dog and cat"
-Output:
-- Pattern: dog and cat illustration
-- Color: natural fur colors
-- Style: anime
-- Request: cute, friendly
-
-Input: "sleek luxury look in silver"
-Output:
-- Pattern: minimal lines
-- Color: silver
-- Style: photographic
-- Request: premium, classy
-
-Input: "Corporate business theme with dark blue"
-Output:
-- Pattern: business
-- Color: dark blue
-- Style: photographic
-- Request: professional, serious
-
-Input: "add a robot"
-Output:
-- Pattern: robot illustration
-- Color: metallic silver and blue
-- Style: digital-art
-- Request: futuristic, tech-inspired
-
-Input: "pop more"
-Output:
-- Pattern: abstract swirls
-- Color: neon colors
-- Style: neon-punk
-- Request: vibrant, eye-catching
-
-Input: "too boring, make it bold"
-Output:
-- Pattern: bold geometric shapes
-- Color: bright red and black
-- Style: digital-art
-- Request: bold, aggressive
-
-Input: "Add a dog"
-Output:
-- Pattern: dog illustration
-- Color: natural fur colors
-- Style: digital-art
-- Request: playful, friendly
-
-Input: "Change to red"
-Output:
-- Pattern: abstract waves
-- Color: red
-- Style: digital-art
-- Request: bold, passionate
-
-Input: "sleek look"
-Output:
-- Pattern: minimal lines
-- Color: silver
-- Style: photographic
-- Request: sleek, premium
-
-Input: {input}
+DESIGN_SUFFIX = """Input: {input}
 
 Output:
 - Pattern:
@@ -218,7 +140,18 @@ Output:
 - Style:
 - Request:
 """
-) | llm
+
+# Few-shot examples and design principles live in examples/*.jsonl
+design_prompt = FewShotPrompt(
+    "extract_design_chain",
+    DESIGN_PREFIX,
+    [
+        ExampleSection(load_store("design_principles"), k=3, header="Design principle examples:\n", separator="\n"),
+        ExampleSection(load_store("design_examples"), k=6, header="Few-shot examples:\n\n")
+    ],
+    DESIGN_SUFFIX
+)
+extract_design_chain = RunnableLambda(design_prompt.format) | get_llm("extract_design_chain")
 
 
 
@@ -312,7 +245,7 @@ Output:
 Input: {input}
 Output:
 """
-) | llm
+) | get_llm("extract_adjustment_chain")
 
 
 
@@ -426,28 +359,16 @@ Output:
 Input: {input}
 Output:
 """
-) | llm
+) | get_llm("extract_edit_chain")
 
 
 
 
 
-intent_chain = PromptTemplate.from_template("""
+INTENT_PREFIX = """
 You are an AI assistant specializing in car wrap design.  
 Your task is to detect the user's intent by carefully analyzing both the **user input** and the **session state**.
 
-Session state contains:
-- Last intent: {last_intent}
-- Last pattern: {last_pattern}
-- Last color: {last_color}
-- Last style: {last_style}
-- Last part: {last_part}
-- Last object: {last_object}
-- Last prompt: {last_prompt}
--Last URL: {last_image_url}
-
-Current user input: {input}
-
 Possible intents:
 - initial: The user is starting a new design session, the session_state is empty, or this is the first round of the chat.
 - adjust: The user wants to make minor or global modifications to the existing design (e.g., color, pattern, style, mood changes) across the entire image.
@@ -503,98 +424,33 @@ Respond only with the intent label:
 initial, adjust, edit, replace, done
 
 Examples:
-1. User Input: "Let's begin designing a wrap for my new Tesla Model 3."
-   Intent: initial
-
-2. User Input: "Can we tweak the color scheme to include more red accents?"
-   Intent: adjust
-
-3. User Input: "Change the pattern from lines to circles throughout the entire wrap."
-   Intent: adjust
-
-4. User Input: "Remove all the tropical leaves."
-   Intent: adjust
-
-5. User Input: "Please change the design on the hood to feature a carbon fiber texture."
-   Intent: edit
-
-6. User Input: "Replace the stripes on the door with a geometric pattern."
-   Intent: edit
-
-7. User Input: "I want to scrap the current design and go with a completely different style."
-   Intent: replace
-
-8. User Input: "This design looks perfect. We're done here."
-   Intent: done
-
-9. User Input: "Let's add a cat"
-   Session State: last intent was 'adjust' or 'initial' or 'replace'
-   Intent: adjust
-
-10. User Input: "Add a cat on the door"
-    Session State: last pattern 'pixelated camouflage', last part is 'none'
-    Intent: edit
-
-11. User Input: "I also want to add stars"
-    Session State: last intent was 'edit'
-    Intent: edit
-
-12. User Input: "Add stars on the hood"
-    Intent: edit
-
-13. User Input: "Make the color more pink"
-    Session State: last intent was 'adjust'
-    Intent: adjust
-
-14. User Input: "Remove the stripes"
-    Session State: last pattern 'geometric lines', no part,last intent was 'adjust'
-    Intent: adjust
-
-15. User Input: "Remove the stars on the hood"
-    Intent: edit
-
-16. User Input: "This design is too bright, make it more subtle"
-    Intent: adjust
-
-17. User Input: "Looks boring, can we add some energy?"
-    Intent: adjust
-
-18. User Input: "Make the door area more colorful"
-    Intent: edit
-
-19. User Input: "Can you make the pattern feel more dynamic?"
-    Intent: adjust
-
-20. User Input: "I want to start from scratch"
-    Intent: replace
-
-21. User Input: "Replace the dog with cat"
-    Session State: last part 'hood', last intent 'edit',last object 'dog'
-    Intent: edit
-
-22. User Input: "Replace the logo on the door with our brand logo"
-    Session State: last part 'door',last intent 'edit'
-    Intent: edit
-
-23. User Input: "Scrap everything and start over"
-    Session State: any
-    Intent: replace
-
-24. User Input: "Let's do a completely new design"
-    Intent: replace
+"""
 
-25. User Input: "I do not like it. adding dog instead"
-    Session State: last intent 'edit'
-    Intent: edit
+INTENT_SUFFIX = """Session state contains:
+- Last intent: {last_intent}
+- Last pattern: {last_pattern}
+- Last color: {last_color}
+- Last style: {last_style}
+- Last part: {last_part}
+- Last object: {last_object}
+- Last prompt: {last_prompt}
+-Last URL: {last_image_url}
 
-25. User Input: "I do not like it. adding dog instead"
-    Session State: last intent 'adjust'
-    Intent: adjust
+Current user input: {input}
 
 Input: {input}
 Session state: {session_state}
 Intent:
-""")
+"""
+
+intent_prompt = FewShotPrompt(
+    "intent_chain",
+    INTENT_PREFIX,
+    [ExampleSection(load_store("intent_examples"), k=8, numbered=True, max_per_label=3)],
+    INTENT_SUFFIX,
+    state_keys=("last_intent", "last_part", "last_object")
+)
+intent_chain = RunnableLambda(intent_prompt.format)
 
 
 
@@ -644,7 +500,7 @@ Now generate the prompt for:
 
 Prompt:
 """
-) | llm
+) | get_llm("text2image_prompt_chain")
 
 
 
@@ -728,7 +584,7 @@ Now generate the prompt:
 Prompt:
 """
 
-) | llm
+) | get_llm("img2img_adjust_prompt_chain")
 
 
 
@@ -814,7 +670,7 @@ Prompt:
 Now generate the prompt:
 Prompt:
 """
-) | llm
+) | get_llm("inpaint_prompt_chain")
 
 #------------guidance chain ---------------
 
@@ -872,7 +728,7 @@ Respond strictly in this JSON format:
   "replace_examples": ["..."],
   "done_examples": ["..."]
 }}
-""") | llm
+""") | get_llm("guidance_chain")
 
 
 
@@ -936,18 +792,18 @@ def detect_intent(user_input, forced_intent=None):
     chat_history = short_term_memory.load_memory_variables({})["chat_history"]
 
     # Ensure we unpack session_state correctly
-    return (intent_chain | llm).invoke({
+    return (intent_chain | get_llm("intent_chain")).invoke({
         "chat_history": chat_history,
         "input": user_input,
         "last_color": session_state.get("last_color", "none"),
         "last_intent": session_state.get("last_intent", "none"),
-        "last_object": session_state.get("last_object", "none"),
+        "last_object": session_state.get("last_object_name", "none"),
         "last_part": session_state.get("last_part", "none"),
         "last_pattern": session_state.get("last_pattern", "none"),
         "last_prompt": session_state.get("last_prompt", "none"),
         "last_style": session_state.get("last_style", "none"),
         "last_image_url": session_state.get("last_image_url", "none"),
-        "session_state": session_state  # You can still include the whole for redundancy if your prompt uses it generically
+        "session_state": session_state.compact()  # You can still include the whole for redundancy if your prompt uses it generically
     }).content.strip()
 
 
@@ -967,8 +823,8 @@ def extract_adjust(user_input: str):
     
     # Parse the content directly as JSON
     try:
-        extracted = json.loads(raw_text)
-    except json.JSONDecodeError as e:
+        extracted = parse_llm_json(raw_text)
+    except ValueError as e:
         raise ValueError(f"Invalid JSON returned by extract_adjustment_chain:\n{raw_text}\nError: {str(e)}")
 
     # Enforce 'part' is always None for adjust intent
@@ -992,8 +848,8 @@ def extract_edit(user_input: str):
 
     # Step 2: Parse raw output as JSON
     try:
-        extracted = json.loads(raw_text)
-    except json.JSONDecodeError as e:
+        extracted = parse_llm_json(raw_text)
+    except ValueError as e:
         raise ValueError(f"Invalid JSON returned by extract_edit_chain:\n{raw_text}\nError: {str(e)}")
 
     # Step 3: Enforce required fields are present and not empty (except "use last")
@@ -1117,8 +973,7 @@ generate_inpainting_prompt_tool = StructuredTool.from_function(
 
 # ------------------- Planning & Reflection -------------------
 
-planning_chain = PromptTemplate.from_template(
-    """
+PLANNING_PREFIX = """
 You are a car wrap design planning assistant.
 
 Your task is to carefully analyze the **user input** and **session state**, and plan the next steps.
@@ -1154,69 +1009,9 @@ Your task is to carefully analyze the **user input** and **session state**, and
 - Do NOT wrap the output in any ```json block or text.
 - Do NOT add any explanation before or after the JSON.
 --- Example ---
+"""
 
-Example 1 (Initial):
-User input: "Let's create a new wrap with flames."
-Session state: (empty)
-
-Response:
-{{
-  "intent": "initial",
-  "tool_steps": [
-    "DetectIntent",
-    "ExtractDesignInfo",
-    "GenerateText2ImagePrompt"
-  ],
-  "summary": "Start a new design session by extracting design info and generating a text-to-image prompt."
-}}
-
-Example 2 (Adjust):
-User input: "Make the color more vibrant and pop."
-Session state: last_image_url exists
-
-Response:
-{{
-  "intent": "adjust",
-  "tool_steps": [
-    "DetectIntent",
-    "ExtractAdjustInfo",
-    "GenerateImg2ImgPrompt"
-  ],
-  "summary": "User wants to make global adjustments to the existing design, such as changing the color or pattern."
-}}
-
-Example 3 (Edit):
-User input: "Add a dragon on the hood."
-Session state: last_image_url exists
-
-Response:
-{{
-  "intent": "edit",
-  "tool_steps": [
-    "DetectIntent",
-    "ExtractInpaintingInfo",
-    "GenerateInpaintingPrompt"
-  ],
-  "summary": "User wants to modify specific car parts (like hood) by adding or changing elements."
-}}
-
-Example 4 (Replace):
-User input: "Let's start over with a new design concept."
-Session state: last_image_url exists
-
-Response:
-{{
-  "intent": "replace",
-  "tool_steps": [
-    "DetectIntent",
-    "ExtractDesignInfo",
-    "GenerateText2ImagePrompt"
-  ],
-  "summary": "User wants to discard the current design and start a new concept from scratch."
-}}
-
-
---- Now plan carefully based on below ---
+PLANNING_SUFFIX = """--- Now plan carefully based on below ---
 
 Chat History:
 {chat_history}
@@ -1229,14 +1024,21 @@ Session state:
 
 Respond:
 """
-) | llm
+
+planning_prompt = FewShotPrompt(
+    "planning_chain",
+    PLANNING_PREFIX,
+    [ExampleSection(load_store("planning_examples"), k=3, max_per_label=1)],
+    PLANNING_SUFFIX
+)
+planning_chain = RunnableLambda(planning_prompt.format) | get_llm("planning_chain")
 
 
 def extract_intent_from_plan(plan_text):
     try:
-        plan_json = json.loads(plan_text)  # Always required
-        return plan_json.get("intent", "unknown").lower()
-    except json.JSONDecodeError as e:
+        plan_json = parse_llm_json(plan_text)  # Always required
+        return str(plan_json.get("intent", "unknown")).lower()
+    except (ValueError, AttributeError) as e:
         print(f"[Error]: Failed to parse plan as JSON:\n{plan_text}\nError: {e}")
         return "unknown"
 
@@ -1322,7 +1124,7 @@ OR:
   "hint": "Could you clarify your request? For example, 'sleek geometric lines in silver' or 'floral pattern in pastel pink'."
 }}
 """
-) | llm
+) | get_llm("reflection_chain")
 
 
 
@@ -1417,17 +1219,11 @@ from langchain.memory import ConversationBufferMemory
 
 # Initialize memory and session state
 short_term_memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-session_state = {
-    "last_image_url": None,
-    "last_prompt": None,
-    "last_pattern": None,
-    "last_color": None,
-    "last_request": None,
-    "last_part": None
-}
+# Rendered into prompts as compact JSON of the set fields, rebuilt only after a change
+session_state = SessionState()
 
 # Create agent and executor
-agent = create_openai_functions_agent(llm=llm, tools=reasoning_tools, prompt=system_prompt)
+agent = create_openai_functions_agent(llm=get_llm("agent"), tools=reasoning_tools, prompt=system_prompt)
 agent_executor = AgentExecutor(agent=agent, tools=reasoning_tools, verbose=True, return_intermediate_steps=True)
 
 # Clean output
@@ -1438,48 +1234,290 @@ def clean_agent_output(output_text):
     return cleaned_text.strip()
 
 # Path helper
-def safe_output_path(folder_name, file_name, base_dir=None):
-    if base_dir is None:
-        base_dir = os.getcwd()
-    output_dir = os.path.join(base_dir, folder_name)
-    os.makedirs(output_dir, exist_ok=True)
-    return os.path.join(output_dir, file_name)
-
-def run_agent_par_with_auto_retry(max_retries=5):
-    seed = random.randint(0, 2**32 - 1)
+# Outputs go to the sharded artifact store (ARTIFACT_DIR, default artifacts/), indexed by session and turn
+artifacts = artifact_store.get_store()
+
+def output_path_for(session_id, turn, kind):
+    return artifacts.allocate(session_id, turn, kind, tenant=tenant_id)
+
+def index_output(output_path):
+    # Indexed once the registry's background write has landed, never for a failed job
+    image_registry.registry.when_written(output_path, artifacts.commit, on_error=artifacts.discard)
+
+# Print post-processing (optional panel output, e.g. PRINT_OUTPUT_SIZE=20000x10000 in api.txt)
+print_output_size = print_pipeline.parse_size(os.getenv("PRINT_OUTPUT_SIZE"))
+print_panel_width = int(os.getenv("PRINT_PANEL_WIDTH", "0")) or None
+print_dpi = int(os.getenv("PRINT_DPI", "0")) or None
+
+# Image calls go through the shared job queue: interactive priority, per-tenant
+# fairness, and a newer turn of the same session supersedes a queued call
+tenant_id = os.getenv("TENANT_ID", "local")
+
+def run_image_job(tool, **kwargs):
+    with profiler.phase("image_io"):
+        return job_queue.get_queue().run(tool, tenant_id, priority="interactive", supersede_key=kwargs.get("session_id"), **kwargs)
+
+# Vehicle wrap template (VEHICLE_TEMPLATE=path/to/template.png); its part masks are
+# segmented once and cached under mask/<template>/. Unset: the hand-drawn mask/*.png
+vehicle_template = os.getenv("VEHICLE_TEMPLATE") or None
+
+# Optional mask feathering for inpainting (e.g. MASK_FEATHER_ITERATIONS=5), done in the image worker pool
+mask_feather_iterations = int(os.getenv("MASK_FEATHER_ITERATIONS", "0"))
+
+def feathered_mask(mask_path, init_image_path):
+    _, w, h, _ = preflight.image_info(init_image_path)
+    root, _ = os.path.splitext(mask_path)
+    output_path = f"{root}_feathered{mask_feather_iterations}_{w}x{h}.png"
+    if not os.path.isfile(output_path) or os.path.getmtime(output_path) < os.path.getmtime(mask_path):
+        image_workers.feather_mask(mask_path, output_path, target_size=(w, h), dilation_iterations=mask_feather_iterations,
+                                   blur_kernel_size=(11, 11), kernel_size=11)
+    return output_path
+
+# Perceptual-hash index over every generated image
+near_duplicate_index = phash_index.PerceptualIndex(os.path.join(os.getcwd(), "image", "phash_index.jsonl"))
+
+def find_near_match(prompt, style, intent, input_path=None, part=None):
+    """
+    Closest existing output for a near-identical request (similar prompt, same style,
+    perceptually matching input), looked up before the generation and shown next to
+    its result. Never blocks the turn on a question.
+    """
+    try:
+        return near_duplicate_index.candidate_for(prompt, style, input_path=input_path, intent=intent, part=part)
+    except FileNotFoundError:
+        return None
+
+def show_near_match(candidate):
+    if candidate is not None:
+        print(f"♻️  A similar earlier design while the new one renders: {candidate['path']} (prompt similarity {candidate.get('similarity', 1.0):.0%})")
+
+# A failing upstream surfaces as an open circuit (CircuitOpen), a tool's RuntimeError
+# on a 5xx/429, a requests timeout or connection error, or an OpenAI API/timeout error
+UPSTREAM_ERRORS = (RuntimeError, requests.RequestException, openai.OpenAIError)
+
+def assistant_unavailable(error):
+    print(f"🔌 {error}")
+    print("❓ The design assistant is temporarily unavailable. Please send your request again in a moment.")
+
+def request_rejected(error):
+    """
+    Preflight refused the request (bad style, prompt, seed or input image) before any API call.
+    """
+    print(f"🚫 {error}")
+    print("❓ I could not send that request. Please rephrase it, e.g. pick a different style or part.")
+
+def image_fallback(error, prompt, style, intent, input_path=None, part=None):
+    """
+    The image call failed or its circuit is open: answer at once with the closest
+    existing output for this request, if there is one, instead of retrying a dead upstream.
+    """
+    if isinstance(error, requests.Timeout):
+        print(f"⏱️  The image call ran past this turn's deadline: {error}")
+    else:
+        print(f"🔌 {error}")
+    try:
+        candidate = near_duplicate_index.candidate_for(prompt, style, input_path=input_path, intent=intent, part=part)
+    except FileNotFoundError:
+        candidate = None
+    if candidate is None:
+        print("❓ Image generation is temporarily unavailable. Please try again in a moment, or refine your request meanwhile.")
+        return None
+    print(f"♻️  Showing the closest existing design instead: {candidate['path']}")
+    return candidate["path"]
+
+def postprocess_output(output_path, prompt=None, style=None, intent=None, input_path=None, part=None, session_id=None, turn=None):
+    with profiler.phase("image_io"):
+        try:
+            image_hash = phash_index.hash_file(output_path)
+            for distance, entry in near_duplicate_index.query(image_hash)[:1]:
+                print(f"🔁 Near-duplicate of {entry['path']} (distance {distance})")
+            near_duplicate_index.add(
+                output_path,
+                image_hash=image_hash,
+                prompt_key=phash_index.prompt_key(prompt),
+                style=style,
+                intent=intent,
+                part=part,
+                input_hash=phash_index.hash_file(input_path) if input_path else None
+            )
+        except FileNotFoundError as e:
+            print(f"⚠️  Near-duplicate indexing skipped: {e}")
+        # A blended tile is a store artifact of the same session and turn, kept as long as its output
+        tile_path = output_path_for(session_id, turn, "tile") if session_id is not None else None
+        try:
+            result = print_pipeline.prepare_for_print(output_path, output_size=print_output_size, panel_width=print_panel_width, dpi=print_dpi,
+                                                      tile_path=tile_path)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"⚠️  Print post-processing skipped: {e}")
+            result = None
+        if tile_path is not None:
+            if result is not None and result["tile_path"] == tile_path:
+                index_output(tile_path)
+            else:
+                artifacts.discard(tile_path)
+        return result
+
+# Guidance and start-of-session examples only depend on coarse state, so they are
+# served from a persistent cache (python image_agent.py warm-suggestions fills it)
+suggestions = SuggestionCache()
+metrics.stats_counter("suggestion_cache_lookups_total", "Suggestion cache lookups by result", suggestions.stats)
+metrics.stats_counter("llm_json_parses_total", "LLM JSON outputs by parse result", parse_stats)
+
+def suggest_next_steps(intent):
+    with profiler.phase("guidance"):
+        history = short_term_memory.load_memory_variables({})["chat_history"]
+        state = session_state.compact()
+        compute = lambda: guidance_chain.invoke({"last_intent": intent, "session_state": state, "history": history}).content
+        try:
+            return suggestions.get_or_compute(signature(intent, session_state), compute)
+        except UPSTREAM_ERRORS:
+            return "Adjust the colors or style, edit a part (hood, doors), or describe a new design."
+
+def design_examples():
+    return suggestions.get_or_compute("examples", lambda: example_chain.invoke({}).content)
+
+def populate_suggestions(workers=4):
+    def compute(key):
+        if key == "examples":
+            return example_chain.invoke({}).content
+        intent, state = representative_state(key)
+        return guidance_chain.invoke({"last_intent": intent, "session_state": SessionState(state).compact(), "history": []}).content
+    suggestions.populate(compute, ["examples"] + all_guidance_keys(), workers=workers)
+
+def run_agent_par_with_auto_retry(max_retries=5, input_fn=input, seed=None):
+    """
+    input_fn supplies user input (replay.py feeds recorded sessions through it);
+    seed reproduces a recorded session's file names and prompts.
+    """
+    seed = random.randint(0, 2**32 - 1) if seed is None else seed
     print(f"Random seed: {seed}")
     print("\n--- AI Car Wrap Agent with Reflection Loop (Auto-Retry) ---\n")
 
-    print(example_chain.invoke({}))
+    # Fork the image workers before any session threads exist
+    image_workers.get_pool().start()
+
+    # Prometheus endpoint for live aggregates (METRICS_PORT=9464 in api.txt to enable)
+    if os.getenv("METRICS_PORT"):
+        metrics.serve()
+
+    # Cold-start work (connections, masks, design examples) overlaps the first input()
+    warmup_tasks = {"examples": lambda: print(f"\n{design_examples()}\n\nYou: ", end="", flush=True)}
+    if vehicle_template:
+        warmup_tasks["part_masks"] = lambda: part_segmentation.segment_template(vehicle_template)
+    warmup = start_warmup(llm_backends.routed_models(), extra_tasks=warmup_tasks)
+
+    # Opt-in per-turn sampling profile (PROFILE=wall or PROFILE=cpu), written under profiles/
+    session_profiler = profiler.from_env()
+
+    # RECORD_SESSIONS=1: capture inputs, LLM and Stability traffic for replay.py
+    if os.getenv("RECORD_SESSIONS", "").lower() in ["1", "true", "yes"]:
+        replay.start_recording(f"{time.strftime('%Y%m%d-%H%M%S')}_{seed}").event("session", seed=seed)
+        input_fn = replay.recorder.wrap_input(input_fn)
+
+    # Files, previews and history are namespaced by a per-session id, not the seed:
+    # two sessions that draw (or replay) the same seed must not overwrite each other
+    session_id = artifact_store.new_session_id()
+    history = DesignHistory(session_id)
+
+    # Background clean-up of unreferenced outputs (RETENTION=0 to disable); it waits
+    # while a turn is running and only touches files this session no longer needs
+    retention_manager = retention.get_manager()
+    retention_manager.track(session_id, session_state, history)
+    if os.getenv("RETENTION", "1") != "0":
+        retention_manager.start()
 
     rounds = 1
     while True:
-        user_input = input("\nYou: ")
+        retention_manager.turn_finished()
+        user_input = input_fn("\nYou: ")
+        if warmup is not None:
+            warmup.wait()
+            print(warmup.summary())
+            warmup = None
         if user_input.strip().lower() == "done":
             print("Session complete.")
+            print(latency_tracker.report())
+            print(f"[JSON Parsing]: {parse_stats}")
+            print(f"[Suggestion Cache]: {suggestions.stats}")
+            print(f"[Image Workers]: {image_workers.get_pool().stats()}")
+            image_registry.registry.flush()
+            print(f"[Image Registry]: {image_registry.registry.summary()}")
+            print(f"[Job Queue]: {job_queue.get_queue().report()}")
+            print(f"[Request Coalescing]: {stability_client.in_flight.stats}")
+            print(f"[Circuit Breakers]: {circuit_breaker.report()}")
+            if session_profiler:
+                session_profiler.close()
+            retention_manager.untrack(session_id)
+            print(f"[Retention]: {retention_manager.summary()}")
             break
 
-        plan = planning_chain.invoke({
-            "chat_history": short_term_memory.load_memory_variables({})["chat_history"],
-            "input": user_input,
-            "session_state": session_state
-        }).content
-        print(f"[Planning]: {plan}")
-        plan_json = json.loads(plan)
-
-        detected_intent = extract_intent_from_plan(plan)
-        print(f"[Detected Intent (From Plan)]: {detected_intent}")
-        
+        # History navigation is served from cached artifacts, no generation call
+        command = user_input.strip().lower().split()
+        if command and command[0] in ["history", "undo", "goto"]:
+            try:
+                if command[0] == "history":
+                    print(history.render())
+                    continue
+                if command[0] == "undo":
+                    restored = history.undo()
+                else:
+                    restored = history.checkout(command[1] if len(command) > 1 else "")
+                session_state.clear()
+                session_state.update(restored)
+                session_state.clear_dirty()
+                print(f"↩️  Restored {history.head}: {session_state.get('last_image_url')}")
+            except (KeyError, FileNotFoundError, ValueError) as e:
+                print(f"⚠️  History: {e}")
+            continue
+
+        budget = start_turn()
+        retention_manager.turn_started()
+        if session_profiler:
+            session_profiler.begin_turn(rounds)
+
+        # A failed planning call skips the agent loop but still ends the turn below
+        # (turn metrics, profiler, round counter)
+        plan = None
+        try:
+            with profiler.phase("planning"):
+                plan = planning_chain.invoke({
+                    "chat_history": short_term_memory.load_memory_variables({})["chat_history"],
+                    "input": user_input,
+                    "session_state": session_state.compact()
+                }).content
+        except UPSTREAM_ERRORS as e:
+            assistant_unavailable(e)
+        plan_json = {}
+        if plan is not None:
+            print(f"[Planning]: {plan}")
+            try:
+                plan_json = parse_llm_json(plan)
+            except ValueError:
+                pass
+            if not isinstance(plan_json, dict):
+                plan_json = {}
+            detected_intent = extract_intent_from_plan(plan)
+            print(f"[Detected Intent (From Plan)]: {detected_intent}")
+        plan_json.setdefault("intent", "unknown")
+        plan_json.setdefault("tool_steps", [])
+        turn_intent = plan_json["intent"]
 
         retries = 0
         reflection_reason = None
+        attempt_seconds = 0.0
 
-        while retries < max_retries:
+        while plan is not None and retries < max_retries:
+            # Another agent run must fit in what is left of the turn
+            if budget.exhausted() or (retries > 0 and not budget.can_afford(attempt_seconds)):
+                print(f"⏱️  Turn budget spent ({budget.summary()}).")
+                print("❓ Could you clarify your request? For example, 'sleek geometric lines in silver' or 'floral pattern in pastel pink'.")
+                break
+            attempt_started = budget.elapsed()
             scratchpad = [
                 {"role": "system", "content": f"""You are a car wrap design reasoning agent.
 
 Current Session State:
-{json.dumps(session_state, indent=2)}
+{session_state.compact()}
 
 Rules:
 - Always detect intent first.
@@ -1498,11 +1536,17 @@ Proceed carefully.
                     "content": f"Reflection feedback from last attempt: {reflection_reason}. Fix this specific issue carefully in your next attempt. Do NOT repeat the mistake."
                 })
 
-            result = agent_executor.invoke({
-                "input": user_input,
-                "detected_intent": detected_intent,
-                "agent_scratchpad": scratchpad
-            })
+            agent_executor.max_execution_time = budget.remaining_time()
+            try:
+                with profiler.phase("agent"):
+                    result = agent_executor.invoke({
+                        "input": user_input,
+                        "detected_intent": detected_intent,
+                        "agent_scratchpad": scratchpad
+                    }, config={"callbacks": [profiler.phase_callback] if session_profiler else []})
+            except UPSTREAM_ERRORS as e:
+                assistant_unavailable(e)
+                break
 
             print(f"[Reasoning Result]: {result['output']}")
 
@@ -1518,11 +1562,11 @@ Proceed carefully.
             for step in executed_steps_formatted:
                 print(step)
 
-            cleaned_output = clean_agent_output(result['output'])
-
             try:
-                extracted_info = json.loads(cleaned_output)
-            except json.JSONDecodeError as e:
+                extracted_info = parse_llm_json(result['output'])
+                if not isinstance(extracted_info, dict):
+                    raise ValueError("agent output is not a JSON object")
+            except ValueError as e:
                 print(f"JSON parsing failed: {e}. Retrying...")
                 retries += 1
                 continue
@@ -1531,37 +1575,65 @@ Proceed carefully.
             if extracted_info.get("intent") == "edit":
                 part_for_reflection = extracted_info.get("part", "")
 
-            reflection_json = reflection_chain.invoke({
-                "plan_intent": plan_json["intent"],
-                "plan_steps": plan_json["tool_steps"],
-                "input": user_input,
-                "intent": extracted_info.get("intent", "unknown"),
-                "prompt": extracted_info.get("prompt", ""),
-                "pattern": extracted_info.get("pattern", ""),
-                "color": extracted_info.get("color", ""),
-                "style": extracted_info.get("style", ""),
-                "object_name": extracted_info.get("object_name", ""),
-                "part": extracted_info.get("part", ""),
-                "request": extracted_info.get("request", ""),
-                "last_image_url": session_state.get("last_image_url", None),
-                "executed_steps": executed_steps_formatted,
-                "chat_history": short_term_memory.load_memory_variables({})["chat_history"]
-            }).content.strip()
-
-            print(f"[Reflection Decision]: {reflection_json}")
-
-            try:
-                reflection_result = json.loads(clean_agent_output(reflection_json))
-            except json.JSONDecodeError:
-                print(f"Reflection unrecognized. Forcing retry.\n{reflection_json}")
-                retries += 1
-                continue
-
-            reflection_status = reflection_result.get("result", "retry")
-
-            if reflection_status == "retry":
+            attempt_seconds = budget.elapsed() - attempt_started
+            if budget.nearly_spent():
+                # Not enough budget for a reflection round: trust the agent when it agrees with the plan
+                if plan_json["intent"] in ["unknown", extracted_info.get("intent")]:
+                    print(f"⏱️  Turn budget nearly spent ({budget.summary()}). Skipping reflection, using the planned intent.")
+                    reflection_status = "accept"
+                else:
+                    print(f"⏱️  Turn budget nearly spent ({budget.summary()}) and the agent disagrees with the plan.")
+                    print("❓ Could you clarify your request? For example, 'change the whole design' or 'only the hood'.")
+                    break
+            else:
+                reflection_status = None
+
+            if reflection_status is None:
+                try:
+                    with profiler.phase("reflection"):
+                        reflection_json = reflection_chain.invoke({
+                            "plan_intent": plan_json["intent"],
+                            "plan_steps": plan_json["tool_steps"],
+                            "input": user_input,
+                            "intent": extracted_info.get("intent", "unknown"),
+                            "prompt": extracted_info.get("prompt", ""),
+                            "pattern": extracted_info.get("pattern", ""),
+                            "color": extracted_info.get("color", ""),
+                            "style": extracted_info.get("style", ""),
+                            "object_name": extracted_info.get("object_name", ""),
+                            "part": extracted_info.get("part", ""),
+                            "request": extracted_info.get("request", ""),
+                            "last_image_url": session_state.get("last_image_url", None),
+                            "executed_steps": executed_steps_formatted,
+                            "chat_history": short_term_memory.load_memory_variables({})["chat_history"]
+                        }).content.strip()
+                except UPSTREAM_ERRORS as e:
+                    assistant_unavailable(e)
+                    break
+
+                print(f"[Reflection Decision]: {reflection_json}")
+
+                try:
+                    reflection_result = parse_llm_json(reflection_json)
+                    if not isinstance(reflection_result, dict):
+                        raise ValueError("reflection output is not a JSON object")
+                except ValueError:
+                    print(f"Reflection unrecognized. Forcing retry.\n{reflection_json}")
+                    metrics.reflection_outcomes.inc("unparsed")
+                    retries += 1
+                    continue
+
+                reflection_status = reflection_result.get("result", "retry")
+
+            # Bounded label set: a free-form status from the model would add a series per typo
+            metrics.reflection_outcomes.inc(reflection_status if reflection_status in ["accept", "retry", "clarify"] else "other")
+            if reflection_status not in ["accept", "clarify"]:
+                # "retry", or a status the reflection prompt does not allow: either way, retry
                 retries += 1
-                reflection_reason = reflection_result.get("reason", "Unknown mistake detected.")
+                if reflection_status == "retry":
+                    reflection_reason = reflection_result.get("reason", "Unknown mistake detected.")
+                else:
+                    reflection_reason = f"unrecognized reflection result {reflection_status!r}"
                 print(f"Reflection suggests retrying... Attempt {retries}/{max_retries} - Reason: {reflection_reason}")
                 continue
 
@@ -1573,38 +1645,86 @@ Proceed carefully.
             if reflection_status == "accept":
                 print("Reflection accepted. Updating session state.")
                 intent = extracted_info.get("intent")
+                turn_intent = intent
                 style = extracted_info.get("style")
                 prompt = extracted_info.get("prompt")
 
+                if intent in ["initial", "replace", "adjust", "edit"]:
+                    try:
+                        budget.charge_image_call()
+                    except BudgetExceeded as e:
+                        print(f"⏱️  {e}")
+                        print("❓ Please send the request again, or refine it, and I will generate it in a fresh turn.")
+                        break
+
                 if intent in ["initial", "replace"]:
-                    output_path = safe_output_path("image", f"{seed}_{rounds}_initial.png")  
-                    txt2img.generate_background_image(prompt=prompt, api_key=stability_api_key, output_path=output_path, style_type=style, seed=seed)
+                    near_match = find_near_match(prompt, style, intent)
+                    show_near_match(near_match)
+                    output_path = output_path_for(session_id, rounds, "initial")
+                    try:
+                        run_image_job("text2image", prompt=prompt, api_key=stability_api_key, output_path=output_path, style_type=style, seed=seed, session_id=session_id, timeout=budget.timeout(120))
+                    except UPSTREAM_ERRORS as e:
+                        artifacts.discard(output_path)
+                        output_path = image_fallback(e, prompt, style, intent)
+                        if output_path is None:
+                            break
+                    except ValueError as e:
+                        artifacts.discard(output_path)
+                        request_rejected(e)
+                        break
+                    else:
+                        index_output(output_path)
+                        postprocess_output(output_path, prompt=prompt, style=style, intent=intent, session_id=session_id, turn=rounds)
                     print("Here is what you can do next:")
-                    gudiance = guidance_chain.invoke({"last_intent":intent,"session_state":session_state,"history": short_term_memory.load_memory_variables({})["chat_history"]})
-                    print(gudiance.content)
+                    print(suggest_next_steps(intent))
                     session_state['last_image_url'] = output_path
                 elif intent == 'adjust':
-                    input_image_path = session_state['last_image_url']
-                    output_path = safe_output_path("image", f"{seed}_{rounds}_adjust.png")
-                    img2img.generate_img2img_adjust(input_image_path=input_image_path, prompt=prompt, output_path=output_path, api_key=stability_api_key, style_preset=style, seed=seed)
+                    input_image_path = session_state.get('last_image_url')
+                    near_match = find_near_match(prompt, style, intent, input_path=input_image_path)
+                    show_near_match(near_match)
+                    output_path = output_path_for(session_id, rounds, "adjust")
+                    try:
+                        run_image_job("img2img", input_image_path=input_image_path, prompt=prompt, output_path=output_path, api_key=stability_api_key, style_preset=style, seed=seed, session_id=session_id, timeout=budget.timeout(120))
+                    except UPSTREAM_ERRORS as e:
+                        artifacts.discard(output_path)
+                        output_path = image_fallback(e, prompt, style, intent, input_path=input_image_path)
+                        if output_path is None:
+                            break
+                    except ValueError as e:
+                        artifacts.discard(output_path)
+                        request_rejected(e)
+                        break
+                    else:
+                        index_output(output_path)
+                        postprocess_output(output_path, prompt=prompt, style=style, intent=intent, input_path=input_image_path, session_id=session_id, turn=rounds)
                     print("Here is what you can do next:")
-                    gudiance = guidance_chain.invoke({"last_intent":intent,"session_state":session_state,"history": short_term_memory.load_memory_variables({})["chat_history"]})
-                    print(gudiance.content)
+                    print(suggest_next_steps(intent))
                     session_state['last_image_url'] = output_path
                 elif intent == 'edit':
-                    input_image_path = session_state['last_image_url']
-                    output_path = safe_output_path("image", f"{seed}_{rounds}_edit.png")
+                    input_image_path = session_state.get('last_image_url')
                     edit_part = extracted_info.get("part")
-                    if edit_part == "hood":
-                        mask_image_path = safe_output_path("mask", "hood.png")
-                    elif edit_part in ["doors", "left_door", "right_door"]:
-                        mask_image_path = safe_output_path("mask", "doors.png")
+                    mask_image_path = part_segmentation.mask_for_part(edit_part, template_path=vehicle_template)
+                    if mask_feather_iterations > 0:
+                        mask_image_path = feathered_mask(mask_image_path, input_image_path)
+                    near_match = find_near_match(prompt, style, intent, input_path=input_image_path, part=edit_part)
+                    show_near_match(near_match)
+                    output_path = output_path_for(session_id, rounds, "edit")
+                    try:
+                        run_image_job("inpainting", prompt=prompt, api_key=stability_api_key, save_path=output_path, init_image_path=input_image_path, mask_image_path=mask_image_path, style_preset=style, seed=seed, session_id=session_id, timeout=budget.timeout(120))
+                    except UPSTREAM_ERRORS as e:
+                        artifacts.discard(output_path)
+                        output_path = image_fallback(e, prompt, style, intent, input_path=input_image_path, part=edit_part)
+                        if output_path is None:
+                            break
+                    except ValueError as e:
+                        artifacts.discard(output_path)
+                        request_rejected(e)
+                        break
                     else:
-                        mask_image_path = safe_output_path("mask", "doors_hood.png")
-                    inp.generate_background_image_inpainting(prompt=prompt, api_key=stability_api_key, save_path=output_path, init_image_path=input_image_path, mask_image_path=mask_image_path, style_preset=style, seed=seed)
+                        index_output(output_path)
+                        postprocess_output(output_path, prompt=prompt, style=style, intent=intent, input_path=input_image_path, part=edit_part, session_id=session_id, turn=rounds)
                     print("Here is what you can do next:")
-                    gudiance = guidance_chain.invoke({"last_intent":intent,"session_state":session_state,"history":short_term_memory.load_memory_variables({})["chat_history"]})
-                    print(gudiance.content)
+                    print(suggest_next_steps(intent))
                     session_state['last_image_url'] = output_path
 
                 session_state["last_prompt"] = extracted_info.get("prompt", "")
@@ -1618,12 +1738,53 @@ Proceed carefully.
                     session_state["last_part"] = None
 
                 print(f"[Updated Session State]: {session_state}")
+                print(f"[Turn Budget]: {budget.summary()}")
+                # A turn that changed nothing (same image, same fields) adds no history node
+                if intent in ["initial", "replace", "adjust", "edit"] and session_state.dirty_fields():
+                    node_id = history.record(
+                        intent=intent,
+                        prompt=prompt,
+                        image_path=session_state.get("last_image_url"),
+                        seed=seed,
+                        params={"style": style, "part": extracted_info.get("part")},
+                        state=session_state
+                    )
+                    session_state.clear_dirty()
+                    print(f"🕘 Saved as {node_id} (type 'history', 'undo' or 'goto <id>' to navigate)")
+                elif intent in ["initial", "replace", "adjust", "edit"]:
+                    print(f"🕘 Nothing changed since {history.head}; no new history node.")
                 break
 
         if retries >= max_retries:
             print(f"❗ Exceeded max retries ({max_retries}). Please revise your input.")
 
+        metrics.turn_seconds.observe(turn_intent, value=budget.elapsed())
+        if session_profiler:
+            session_profiler.end_turn()
         rounds += 1
 
+def benchmark_chains(repeats=3):
+    """
+    Latency per chain per backend on fixed sample inputs (python image_agent.py bench-llm).
+    """
+    state = {"last_intent": "adjust", "last_pattern": "flames", "last_color": "red", "last_style": "digital-art",
+             "last_part": "none", "last_object": "none", "last_prompt": "red flames", "last_image_url": "image/1_1_initial.png"}
+    chains = {
+        "example_chain": (example_chain.first, {}),
+        "guidance_chain": (guidance_chain.first, {"last_intent": "adjust", "session_state": state, "history": []}),
+        "extract_adjustment_chain": (extract_adjustment_chain.first, {"input": "make it blue"}),
+        "extract_edit_chain": (extract_edit_chain.first, {"input": "add stars on the hood"}),
+        "extract_design_chain": (extract_design_chain.first, {"input": "red flames"}),
+        "intent_chain": (intent_chain, {"input": "add stars on the hood", "session_state": state, **state}),
+        "planning_chain": (planning_chain.first, {"input": "make it blue", "chat_history": [], "session_state": state}),
+    }
+    llm_backends.benchmark(chains, repeats=repeats)
+
 if __name__ == "__main__":
-    run_agent_par_with_auto_retry()
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "bench-llm":
+        benchmark_chains()
+    elif len(sys.argv) > 1 and sys.argv[1] == "warm-suggestions":
+        populate_suggestions()
+    else:
+        run_agent_par_with_auto_retry()
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import artifact_store
+import image_registry
+import image_workers
+
+# Long edge in pixels for each derived tier; "full" is the original file
+PREVIEW_TIERS = {"medium": 512, "thumb": 128}
+PREVIEW_FORMAT = ".webp"
+PREVIEW_QUALITY = 80
+
+# Previews of images outside the artifact store, one directory per session
+PREVIEW_DIR = os.path.join(os.getcwd(), "preview")
+
+_manifest_lock = threading.Lock()
+
+
+def preview_dir(session_id, base_dir=None):
+    root = PREVIEW_DIR if base_dir is None else os.path.join(base_dir, "preview")
+    output_dir = os.path.join(root, str(session_id))
+    os.makedirs(output_dir, exist_ok=True)
+    return output_dir
+
+
+def _encode(img):
+    ok, buf = cv2.imencode(PREVIEW_FORMAT, img, [cv2.IMWRITE_WEBP_QUALITY, PREVIEW_QUALITY])
+    if ok:
+        return PREVIEW_FORMAT, buf
+    # OpenCV builds without WebP support still ship JPEG
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode preview.")
+    return ".jpg", buf
+
+
+def build_pyramid(img):
+    """
+    Downscale once per tier, each tier derived from the previous (larger) one.
+    """
+    tiers = {}
+    current = img
+    for name, long_edge in sorted(PREVIEW_TIERS.items(), key=lambda kv: -kv[1]):
+        current = image_workers.thumbnail(current, long_edge)
+        tiers[name] = current
+    return tiers
+
+
+def encode_tiers(img):
+    """
+    Pyramid + encoding for every tier; runs in the image worker pool.
+    """
+    return {name: (*_encode(tier), tier.shape[1], tier.shape[0]) for name, tier in build_pyramid(img).items()}
+
+
+def _write_atomic(path, buf):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buf.tobytes())
+    os.replace(tmp_path, path)
+
+
+def write_previews(full_path, session_id, image_bytes=None, base_dir=None, store=None):
+    """
+    Write the thumbnail/medium tiers for a generated image and register them in the
+    session manifest. The image comes from the image registry (decoded once and kept
+    for later turns) unless the caller passes image_bytes explicitly. Tiers of a store
+    artifact are store artifacts themselves (kind preview_<tier>, same session and
+    turn); other images keep them under preview/<session>/.
+    """
+    store = store or artifact_store.get_store()
+    if image_bytes is None:
+        image_bytes = image_registry.registry.get_bytes(full_path)
+        img = image_registry.registry.get_array(full_path)
+    else:
+        img = image_workers.run("image_workers:decode", np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"Could not decode image: {full_path}")
+
+    output_dir = preview_dir(session_id, base_dir)
+    stem = os.path.splitext(os.path.basename(full_path))[0]
+    h, w = img.shape[:2]
+    entry = {"full": {"path": full_path, "width": w, "height": h, "bytes": len(image_bytes)}}
+    for name, (ext, buf, tier_w, tier_h) in image_workers.run("image_previews:encode_tiers", img).items():
+        path = store.allocate_derived(full_path, f"preview_{name}", ext=ext)
+        if path is None:
+            path = os.path.join(output_dir, f"{stem}_{name}{ext}")
+            _write_atomic(path, buf)
+        else:
+            try:
+                _write_atomic(path, buf)
+            except OSError:
+                store.discard(path)
+                raise
+            store.commit(path)
+        entry[name] = {"path": path, "width": tier_w, "height": tier_h, "bytes": int(buf.size)}
+
+    update_manifest(output_dir, stem, entry)
+    return entry
+
+
+def try_write_previews(full_path, session_id):
+    """
+    Previews are a convenience: a failure is reported, never raised, so it cannot
+    lose an image the API already returned (and billed).
+    """
+    try:
+        return write_previews(full_path, session_id)
+    except Exception as e:
+        print(f"⚠️  Previews skipped for {full_path}: {e}")
+        return None
+
+
+def update_manifest(output_dir, key, entry):
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    with _manifest_lock:
+        manifest = load_manifest(output_dir)
+        manifest[key] = entry
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+
+def load_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,196 @@
+import atexit
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import image_workers
+import metrics
+
+
+class _Entry:
+    __slots__ = ("data", "arrays")
+
+    def __init__(self, data):
+        self.data = data
+        self.arrays = {}  # imread flag -> decoded array
+
+    @property
+    def nbytes(self):
+        return len(self.data) + sum(a.nbytes for a in self.arrays.values())
+
+
+class ImageRegistry:
+    """
+    In-process LRU of recently produced images, keyed by absolute path. Holds the
+    encoded bytes plus decoded arrays (per imread flag) under a byte budget, so the
+    next turn uploads and processes the previous output without touching disk.
+    Disk writes happen on a background thread; reads of a path that is still
+    being written are served from memory.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or int(os.getenv("IMAGE_REGISTRY_MB", "256")) * 1024 * 1024
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "writes": 0}
+        self._lock = threading.RLock()
+        self._pending = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-writer")
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def _insert(self, key, entry):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old.nbytes
+        self.entries[key] = entry
+        self.nbytes += entry.nbytes
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            key, entry = next(iter(self.entries.items()))
+            if key == keep:
+                break
+            del self.entries[key]
+            self.nbytes -= entry.nbytes
+            self.stats["evictions"] += 1
+
+    def _write(self, key, data):
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        tmp_path = f"{key}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, key)
+        self.stats["writes"] += 1
+
+    def _write_done(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+        if future.exception() is not None:
+            print(f"⚠️  Background write of {key} failed: {future.exception()}")
+
+    def put(self, path, data, array=None, flags=cv2.IMREAD_COLOR, write=True):
+        """
+        Register encoded image bytes (and optionally an already decoded array) for path.
+        With write=True the file is written to disk in the background.
+        """
+        key = self._key(path)
+        entry = _Entry(bytes(data))
+        if array is not None:
+            entry.arrays[flags] = array
+        with self._lock:
+            self._insert(key, entry)
+            if write:
+                future = self._writer.submit(self._write, key, entry.data)
+                self._pending[key] = future
+                future.add_done_callback(lambda f: self._write_done(key, f))
+        return path
+
+    def when_written(self, path, callback, on_error=None):
+        """
+        callback(path) once path is on disk (at once if no write is pending);
+        on_error(path) if its background write failed.
+        """
+        key = self._key(path)
+        with self._lock:
+            future = self._pending.get(key)
+        def done(ok):
+            if ok:
+                callback(path)
+            elif on_error is not None:
+                on_error(path)
+
+        if future is None:
+            done(os.path.isfile(key))
+        else:
+            future.add_done_callback(lambda f: done(f.exception() is None))
+
+    def cached(self, path):
+        with self._lock:
+            return self._key(path) in self.entries
+
+    def exists(self, path):
+        key = self._key(path)
+        with self._lock:
+            if key in self.entries or key in self._pending:
+                return True
+        return os.path.isfile(key)
+
+    def get_bytes(self, path):
+        key = self._key(path)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.data
+            self.stats["misses"] += 1
+        self.flush(path)
+        with open(key, "rb") as f:
+            data = f.read()
+        with self._lock:
+            self._insert(key, _Entry(data))
+        return data
+
+    def get_array(self, path, flags=cv2.IMREAD_COLOR):
+        """
+        Decoded image, decoded at most once per (path, flags) while it stays cached.
+        Decoding runs in the image worker pool.
+        """
+        data = self.get_bytes(path)
+        key = self._key(path)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and flags in entry.arrays:
+                return entry.arrays[flags]
+        array = image_workers.run("image_workers:decode", np.frombuffer(data, np.uint8), flags)
+        if array is None:
+            raise ValueError(f"Could not decode image: {path}")
+        array.flags.writeable = False  # shared between callers
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.nbytes -= entry.nbytes
+                entry.arrays[flags] = array
+                self.nbytes += entry.nbytes
+                self._evict(keep=key)
+        return array
+
+    def upload(self, path):
+        """
+        (filename, bytes) tuple for a multipart file field.
+        """
+        return os.path.basename(path), self.get_bytes(path)
+
+    def invalidate(self, path):
+        key = self._key(path)
+        with self._lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry.nbytes
+
+    def flush(self, path=None):
+        """
+        Wait for pending background writes (of one path, or all of them).
+        """
+        with self._lock:
+            futures = [self._pending.get(self._key(path))] if path else list(self._pending.values())
+        for future in futures:
+            if future is not None:
+                future.result()
+
+    def summary(self):
+        return f"{len(self.entries)} images, {self.nbytes / 1e6:.1f}/{self.max_bytes / 1e6:.0f} MB, {self.stats}"
+
+
+registry = ImageRegistry()
+atexit.register(registry.flush)
+metrics.stats_counter("image_registry_events_total", "In-memory image registry lookups, evictions and writes", registry.stats, label="event")
@@ -0,0 +1,322 @@
+import asyncio
+import atexit
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import metrics
+
+MAX_SAMPLES = 1000
+
+
+class SharedArray:
+    """
+    Arrays cross the process boundary through shared memory; only this small
+    descriptor (segment name, shape, dtype) is pickled.
+    """
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = str(dtype)
+
+    @classmethod
+    def put(cls, array):
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        shm.close()
+        return cls(shm.name, array.shape, array.dtype)
+
+    def attach(self):
+        """
+        Map the segment and view it as an array, without copying. Returns (segment,
+        view); the caller closes the segment once the view is no longer used.
+        """
+        shm = shared_memory.SharedMemory(name=self.name)
+        return shm, np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    def take(self, unlink=True):
+        """
+        Copy the array out of the segment and (by default) free the segment.
+        """
+        shm = shared_memory.SharedMemory(name=self.name)
+        try:
+            return np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            if unlink:
+                shm.unlink()
+
+    def unlink(self):
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+
+def _pack(value):
+    if isinstance(value, np.ndarray):
+        return SharedArray.put(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(_pack(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _pack(v) for k, v in value.items()}
+    return value
+
+
+def _attach(value, segments):
+    if isinstance(value, SharedArray):
+        shm, view = value.attach()
+        segments.append(shm)
+        return view
+    if isinstance(value, (tuple, list)):
+        return type(value)(_attach(v, segments) for v in value)
+    if isinstance(value, dict):
+        return {k: _attach(v, segments) for k, v in value.items()}
+    return value
+
+
+def _unpack(value, unlink):
+    if isinstance(value, SharedArray):
+        return value.take(unlink=unlink)
+    if isinstance(value, (tuple, list)):
+        return type(value)(_unpack(v, unlink) for v in value)
+    if isinstance(value, dict):
+        return {k: _unpack(v, unlink) for k, v in value.items()}
+    return value
+
+
+def _release(value):
+    if isinstance(value, SharedArray):
+        value.unlink()
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            _release(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _release(v)
+
+
+def _resolve(op):
+    module_name, _, func_name = op.partition(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _worker(op, args, kwargs):
+    """
+    Runs inside the pool: the op reads its inputs as views on the parent's segments
+    (no copy), and its outputs go back through fresh segments (copied out and freed by
+    the parent). An input crosses with one copy, an output with two.
+    """
+    start = time.perf_counter()
+    segments = []
+    views = [_attach(a, segments) for a in args]
+    try:
+        # Packed before the segments close: an op may return its input (thumbnail of a small image)
+        packed = _pack(_resolve(op)(*views, **kwargs))
+    finally:
+        del views
+        for shm in segments:
+            try:
+                shm.close()
+            except BufferError:
+                pass  # a view is still referenced (e.g. by a traceback); freed with it
+    return packed, time.perf_counter() - start
+
+
+# ------------------ Image ops (run in the pool) ------------------
+def feather(mask, target_size=None, dilation_iterations=100, blur_kernel_size=(21, 21), kernel_size=15):
+    """
+    Dilate and Gaussian-blur a binary mask, optionally resizing it to target_size (w, h).
+    """
+    if target_size:
+        mask = cv2.resize(mask, tuple(target_size), interpolation=cv2.INTER_NEAREST)
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    mask = cv2.dilate(mask, kernel=kernel, iterations=dilation_iterations)
+    return cv2.GaussianBlur(mask, tuple(blur_kernel_size), sigmaX=0)
+
+
+def resize(img, size, interpolation=cv2.INTER_AREA):
+    return cv2.resize(img, tuple(size), interpolation=interpolation)
+
+
+def resize_to_file(img, size, path, interpolation=cv2.INTER_AREA, params=()):
+    """
+    Resize and encode straight to path; returns the written (w, h).
+    """
+    resized = cv2.resize(img, tuple(size), interpolation=interpolation)
+    if not cv2.imwrite(path, resized, list(params)):
+        raise ValueError(f"Could not write image: {path}")
+    return resized.shape[1], resized.shape[0]
+
+
+def decode(buf, flags=cv2.IMREAD_COLOR):
+    """
+    Encoded bytes (as a uint8 array) to an image; None if they do not decode.
+    """
+    return cv2.imdecode(buf, flags)
+
+
+def feather_file(mask_path, output_path, **kwargs):
+    mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise FileNotFoundError(f"Mask not found: {mask_path}")
+    if not cv2.imwrite(output_path, feather(mask, **kwargs)):
+        raise ValueError(f"Could not write mask: {output_path}")
+    return output_path
+
+
+def thumbnail(img, long_edge=128):
+    h, w = img.shape[:2]
+    scale = long_edge / float(max(h, w))
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+# ------------------ Pool ------------------
+class ImageWorkerPool:
+    """
+    Process pool for CPU-bound image work, so the agent loop (or an event loop)
+    never blocks on OpenCV. Tracks queue depth and per-op latency.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or int(os.getenv("IMAGE_WORKERS", "0")) or os.cpu_count() or 1
+        # fork: workers must not re-import the agent's __main__ (spawn/forkserver would)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.samples = {}  # op -> [(total_s, run_s)]
+
+    def start(self):
+        """
+        Fork the workers now, before the session starts its own threads.
+        """
+        self.run("image_workers:thumbnail", np.zeros((1, 1), np.uint8))
+        return self
+
+    def _done(self, op, submitted, packed_args, future):
+        for a in packed_args:
+            _release(a)
+        with self._lock:
+            self.queue_depth -= 1
+            if not future.cancelled() and future.exception() is None:
+                run_s = future.result()[1]
+                samples = self.samples.setdefault(op, [])
+                samples.append((time.perf_counter() - submitted, run_s))
+                del samples[:-MAX_SAMPLES]
+
+    def submit(self, op, *args, **kwargs):
+        """
+        op is "module:function"; array arguments (also inside tuples/dicts) go through
+        shared memory. Returns a concurrent Future of the raw packed result; use run()
+        or run_async() to get plain values back.
+        """
+        packed_args = [_pack(a) for a in args]
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        submitted = time.perf_counter()
+        future = self.executor.submit(_worker, op, packed_args, kwargs)
+        future.add_done_callback(lambda f: self._done(op, submitted, packed_args, f))
+        return future
+
+    def run(self, op, *args, **kwargs):
+        packed, _ = self.submit(op, *args, **kwargs).result()
+        return _unpack(packed, unlink=True)
+
+    async def run_async(self, op, *args, **kwargs):
+        packed, _ = await asyncio.wrap_future(self.submit(op, *args, **kwargs))
+        return _unpack(packed, unlink=True)
+
+    def map(self, op, items, **kwargs):
+        futures = [self.submit(op, item, **kwargs) for item in items]
+        return [_unpack(f.result()[0], unlink=True) for f in futures]
+
+    def stats(self):
+        with self._lock:
+            items = sorted(self.samples.items())
+            report = {"workers": self.workers, "queue_depth": self.queue_depth, "max_queue_depth": self.max_queue_depth}
+        for op, values in items:
+            totals = sorted(v[0] for v in values)
+            runs = sorted(v[1] for v in values)
+            report[op] = {
+                "calls": len(values),
+                "p50_ms": round(totals[len(totals) // 2] * 1000, 1),
+                "p95_ms": round(totals[min(len(totals) - 1, int(len(totals) * 0.95))] * 1000, 1),
+                "run_p50_ms": round(runs[len(runs) // 2] * 1000, 1),
+            }
+        return report
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ImageWorkerPool()
+            atexit.register(_pool.shutdown)
+            metrics.registry.collected("image_worker_queue_depth", "Operations waiting for or running in the image worker pool",
+                                       lambda: {(): _pool.queue_depth})
+        return _pool
+
+
+def run(op, *args, **kwargs):
+    return get_pool().run(op, *args, **kwargs)
+
+
+async def run_async(op, *args, **kwargs):
+    return await get_pool().run_async(op, *args, **kwargs)
+
+
+def feather_mask(mask_path, output_path, target_size=None, dilation_iterations=100, blur_kernel_size=(21, 21), kernel_size=15):
+    """
+    File-level feathering (see feature_mask.ipynb); reading, feathering and writing
+    the mask all happen in the worker pool.
+    """
+    return run("image_workers:feather_file", mask_path, output_path, target_size=target_size,
+               dilation_iterations=dilation_iterations, blur_kernel_size=blur_kernel_size, kernel_size=kernel_size)
+
+
+# ------------------ Benchmark ------------------
+def benchmark(jobs=32, size=(1024, 1024), dilation_iterations=20):
+    """
+    Feathering throughput for 1..cpu_count workers.
+    """
+    rng = np.random.default_rng(0)
+    mask = np.zeros(size[::-1], np.uint8)
+    mask[rng.integers(0, size[1], 50), rng.integers(0, size[0], 50)] = 255
+    counts = sorted({1, max(1, (os.cpu_count() or 1) // 2), os.cpu_count() or 1})
+    for workers in counts:
+        pool = ImageWorkerPool(workers=workers).start()
+        start = time.perf_counter()
+        pool.map("image_workers:feather", [mask] * jobs, dilation_iterations=dilation_iterations)
+        elapsed = time.perf_counter() - start
+        stats = pool.stats()["image_workers:feather"]
+        print(f"{workers:>2} workers: {jobs / elapsed:6.1f} masks/s, p50 {stats['p50_ms']} ms (run {stats['run_p50_ms']} ms), "
+              f"max queue depth {pool.max_queue_depth}")
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,26 +1,31 @@
-import requests
-def generate_background_image_inpainting(prompt, api_key, save_path, style_preset, init_image_path, mask_image_path, seed):
+import stability_client
+import image_previews
+import image_registry
+import preflight
+def generate_background_image_inpainting(prompt, api_key, save_path, style_preset, init_image_path, mask_image_path, seed, session_id=None, timeout=None):
+    init_image_path, mask_image_path, prompt, style_preset, seed = preflight.preflight_inpainting(init_image_path, mask_image_path, prompt, style_preset, seed)
     headers = {"Authorization": f"Bearer {api_key}", "Accept": "image/*"}
-    with open(init_image_path, "rb") as init_img, open(mask_image_path, "rb") as mask_img:
-        files = {"image": init_img, "mask": mask_img}
-        data = {
-            "prompt": prompt,
-            "output_format": "png",
-            "seed": seed,
-            "mode": "mask",
-            "masked_content": "latent_noise",
-            "inpaint_area": "only_masked",
-            "grow_mask": 50,
-            "denoising_strength": 0.85,
-            "guidance_scale": 30,
-            "num_inference_steps": 50,
-            "style_preset": style_preset
-        }
-        response = requests.post("https://api.stability.ai/v2beta/stable-image/edit/inpaint", headers=headers, data=data, files=files)
-        if response.status_code == 200:
-            with open(save_path, "wb") as out_file:
-                out_file.write(response.content)
-            print(f"✅ Inpainting result saved to: {save_path}")
-            return save_path
-        else:
-            raise RuntimeError(f"Request failed: {response.status_code} - {response.text}")
\ No newline at end of file
+    registry = image_registry.registry
+    files = {"image": registry.upload(init_image_path), "mask": registry.upload(mask_image_path)}
+    data = {
+        "prompt": prompt,
+        "output_format": "png",
+        "seed": seed,
+        "mode": "mask",
+        "masked_content": "latent_noise",
+        "inpaint_area": "only_masked",
+        "grow_mask": 50,
+        "denoising_strength": 0.85,
+        "guidance_scale": 30,
+        "num_inference_steps": 50,
+        "style_preset": style_preset
+    }
+    response = stability_client.post_multipart("https://api.stability.ai/v2beta/stable-image/edit/inpaint", headers=headers, fields=data, files=files, timeout=timeout)
+    if response.status_code == 200:
+        registry.put(save_path, response.content)
+        print(f"✅ Inpainting result saved to: {save_path}")
+        if session_id is not None:
+            image_previews.try_write_previews(save_path, session_id)
+        return save_path
+    else:
+        raise RuntimeError(f"Request failed: {response.status_code} - {response.text}")
\ No newline at end of file
@@ -0,0 +1,329 @@
+import importlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import metrics
+
+# Image tools the queue can run, by name; any "module:function" also works
+TOOLS = {
+    "text2image": "text2image_tool:generate_background_image",
+    "img2img": "img2img_tool:generate_img2img_adjust",
+    "inpainting": "inpainting_tool:generate_background_image_inpainting",
+}
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Never written to the batch journal; re-injected from the environment on restore
+SECRET_KWARGS = {"api_key": "STABILITY_API_KEY"}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _resolve(tool):
+    module_name, _, func_name = TOOLS.get(tool, tool).partition(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+class Job:
+    def __init__(self, tool, kwargs, tenant, priority="interactive", supersede_key=None, job_id=None, created_at=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'. Use one of: {', '.join(PRIORITIES)}")
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.tool = tool
+        self.kwargs = kwargs
+        self.tenant = str(tenant)
+        self.priority = priority
+        self.supersede_key = supersede_key
+        self.created_at = created_at or time.time()
+        self.enqueued = time.perf_counter()
+        self.started = None
+        self.finished = None
+        self.state = "queued"
+        self.future = Future()
+
+    def record(self):
+        kwargs = {k: v for k, v in self.kwargs.items() if k not in SECRET_KWARGS}
+        return {"id": self.id, "tool": self.tool, "kwargs": kwargs, "tenant": self.tenant, "priority": self.priority,
+                "supersede_key": self.supersede_key, "created_at": self.created_at, "state": self.state}
+
+
+class JobQueue:
+    """
+    Scheduler in front of the image tools: strict priority (interactive before batch),
+    round-robin across tenants within a priority, cancellation of jobs superseded by
+    a newer turn of the same session, and a JSONL journal so batch jobs survive restarts.
+    """
+
+    def __init__(self, workers=2, journal_path=None, restore=True):
+        self.workers = workers
+        self.journal_path = journal_path or os.path.join(os.getcwd(), "jobs", "batch_jobs.jsonl")
+        self._queues = {p: OrderedDict() for p in PRIORITIES}  # priority -> tenant -> deque
+        self._by_supersede = {}
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._stopped = False
+        self.latencies = {p: [] for p in PRIORITIES}  # (wait_s, total_s)
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "superseded": 0}
+        if restore:
+            self.restore()
+        self._threads = [threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    # ------------------ Journal ------------------
+    def _journal(self, job):
+        if job.priority != "batch":
+            return
+        with self._journal_lock:
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps(job.record()) + "\n")
+
+    def restore(self):
+        """
+        Re-enqueue batch jobs whose last journaled state is queued or running, then
+        compact the journal to just those jobs.
+        """
+        if not os.path.isfile(self.journal_path):
+            return 0
+        latest = OrderedDict()
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line after a crash
+                latest[record["id"]] = record
+        pending = [r for r in latest.values() if r["state"] in ["queued", "running"]]
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for record in pending:
+                f.write(json.dumps({**record, "state": "queued"}) + "\n")
+        os.replace(tmp_path, self.journal_path)
+        for record in pending:
+            kwargs = dict(record["kwargs"])
+            for name, env_var in SECRET_KWARGS.items():
+                if os.getenv(env_var):
+                    kwargs[name] = os.getenv(env_var)
+            job = Job(record["tool"], kwargs, record["tenant"], "batch", record.get("supersede_key"),
+                      job_id=record["id"], created_at=record["created_at"])
+            self._enqueue(job, journal=False)
+        if pending:
+            print(f"📥 Restored {len(pending)} batch jobs from {self.journal_path}")
+        return len(pending)
+
+    # ------------------ Submission ------------------
+    def _cancel(self, job, reason):
+        job.state = "cancelled"
+        job.future.set_exception(JobCancelled(reason))
+        self.stats["cancelled"] += 1
+        self._journal(job)
+
+    def _enqueue(self, job, journal=True):
+        with self._cond:
+            if job.supersede_key is not None:
+                previous = self._by_supersede.get(job.supersede_key)
+                if previous is not None and previous.state in ["queued", "running"]:
+                    # A running call cannot be aborted; its result is dropped instead
+                    if previous.state == "queued":
+                        self._queues[previous.priority][previous.tenant].remove(previous)
+                    self.stats["superseded"] += 1
+                    self._cancel(previous, f"Superseded by job {job.id}")
+                self._by_supersede[job.supersede_key] = job
+            self._queues[job.priority].setdefault(job.tenant, deque()).append(job)
+            self.stats["submitted"] += 1
+            self._cond.notify()
+        if journal:
+            self._journal(job)
+        return job
+
+    def submit(self, tool, tenant, priority="interactive", supersede_key=None, **kwargs):
+        return self._enqueue(Job(tool, kwargs, tenant, priority, supersede_key))
+
+    def run(self, tool, tenant, priority="interactive", supersede_key=None, wait_timeout=None, **kwargs):
+        """
+        Submit and wait; raises JobCancelled if a newer job superseded this one.
+        """
+        return self.submit(tool, tenant, priority, supersede_key, **kwargs).future.result(wait_timeout)
+
+    def cancel(self, job_id):
+        with self._cond:
+            for tenants in self._queues.values():
+                for tenant, jobs in tenants.items():
+                    for job in jobs:
+                        if job.id == job_id:
+                            jobs.remove(job)
+                            self._cancel(job, "Cancelled")
+                            return True
+        return False
+
+    def depth(self):
+        with self._cond:
+            return {p: sum(len(q) for q in tenants.values()) for p, tenants in self._queues.items()}
+
+    # ------------------ Scheduling ------------------
+    def _next_job(self):
+        for priority in sorted(PRIORITIES, key=PRIORITIES.get):
+            tenants = self._queues[priority]
+            for _ in range(len(tenants)):
+                tenant, jobs = next(iter(tenants.items()))
+                tenants.move_to_end(tenant)  # round-robin: this tenant goes last
+                if jobs:
+                    return jobs.popleft()
+                del tenants[tenant]
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None and not self._stopped:
+                    self._cond.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+                job.state = "running"
+                job.started = time.perf_counter()
+            self._journal(job)
+            try:
+                result, error = _resolve(job.tool)(**job.kwargs), None
+            except Exception as e:
+                result, error = None, e
+            with self._cond:
+                job.finished = time.perf_counter()
+                if job.state != "running":
+                    continue  # superseded while running: drop the result
+                if error is not None:
+                    job.state = "failed"
+                    self.stats["failed"] += 1
+                    job.future.set_exception(error)
+                else:
+                    job.state = "done"
+                    self.stats["completed"] += 1
+                    job.future.set_result(result)
+                    samples = self.latencies[job.priority]
+                    samples.append((job.started - job.enqueued, job.finished - job.enqueued))
+                    del samples[:-1000]
+            metrics.job_seconds.observe(job.tool, job.priority, job.state, value=job.finished - job.enqueued)
+            self._journal(job)
+
+    def percentile(self, priority, q=0.95, which=1):
+        values = sorted(v[which] for v in self.latencies[priority])
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def report(self):
+        parts = [f"depth {self.depth()}", str(self.stats)]
+        for priority in PRIORITIES:
+            p95 = self.percentile(priority)
+            if p95 is not None:
+                parts.append(f"{priority} p95 {p95 * 1000:.0f} ms (wait p95 {self.percentile(priority, which=0) * 1000:.0f} ms)")
+        return ", ".join(parts)
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """
+        Stop the workers. Pending batch jobs stay in the journal unless cancel_pending.
+        """
+        with self._cond:
+            self._stopped = True
+            if cancel_pending:
+                for tenants in self._queues.values():
+                    for jobs in tenants.values():
+                        while jobs:
+                            self._cancel(jobs.popleft(), "Queue shut down")
+            else:
+                for tenants in self._queues.values():
+                    tenants.clear()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(workers=int(os.getenv("IMAGE_JOB_WORKERS", "2")))
+            metrics.registry.collected("image_job_queue_depth", "Queued image jobs per priority",
+                                       lambda: {(p,): n for p, n in _queue.depth().items()}, ["priority"])
+            metrics.stats_counter("image_jobs_total", "Image jobs by outcome", _queue.stats)
+        return _queue
+
+
+def pending_jobs():
+    """
+    Queued jobs in this process, without starting a queue if none exists.
+    """
+    queue = _queue
+    return sum(queue.depth().values()) if queue is not None else 0
+
+
+# ------------------ Benchmark ------------------
+def simulated_tool(latency_s=0.05, **kwargs):
+    time.sleep(latency_s * random.uniform(0.8, 1.2))
+    return kwargs.get("output_path")
+
+
+def benchmark(workers=4, batch_tenants=3, batch_jobs=60, interactive_tenants=2, interactive_jobs=20, latency_s=0.05):
+    """
+    Interactive p95 while batch tenants flood the queue, compared with plain FIFO
+    (every call competing equally, as when each turn fires its request immediately).
+    """
+    import tempfile
+
+    for label, fifo in [("priority + fairness", False), ("FIFO", True)]:
+        queue = JobQueue(workers=workers, journal_path=os.path.join(tempfile.mkdtemp(), "jobs.jsonl"), restore=False)
+        for i in range(batch_jobs):
+            for t in range(batch_tenants):
+                queue.submit("job_queue:simulated_tool", "all" if fifo else f"batch-{t}",
+                             "interactive" if fifo else "batch", latency_s=latency_s)
+        interactive = []
+        for i in range(interactive_jobs):
+            for t in range(interactive_tenants):
+                interactive.append(queue.submit("job_queue:simulated_tool", "all" if fifo else f"user-{t}", "interactive",
+                                                supersede_key=f"user-{t}-turn-{i}", latency_s=latency_s))
+            time.sleep(latency_s * 2)
+        for job in interactive:
+            job.future.result()
+        totals = sorted(job.finished - job.enqueued for job in interactive)
+        p95 = totals[min(len(totals) - 1, int(len(totals) * 0.95))]
+        print(f"{label:<20} interactive p50 {totals[len(totals) // 2] * 1000:7.0f} ms, p95 {p95 * 1000:7.0f} ms "
+              f"under a {batch_tenants * batch_jobs}-job batch load")
+        queue.shutdown(cancel_pending=True)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "batch":
+        # python job_queue.py batch jobs.jsonl: one {"tool", "tenant", **kwargs} per line;
+        # jobs are journaled, so an interrupted run resumes on the next start
+        queue = get_queue()
+        with open(sys.argv[2], "r") as f:
+            specs = [json.loads(line) for line in f if line.strip()]
+        jobs = []
+        for spec in specs:
+            spec.setdefault("api_key", os.getenv("STABILITY_API_KEY"))
+            jobs.append(queue.submit(spec.pop("tool"), spec.pop("tenant", "batch"), "batch", **spec))
+        for job in jobs:
+            try:
+                print(f"{job.id}: {job.future.result()}")
+            except Exception as e:
+                print(f"{job.id}: failed - {e}")
+        print(queue.report())
+    else:
+        benchmark()
@@ -0,0 +1,264 @@
+import json
+import random
+import re
+
+parse_stats = {"clean": 0, "repaired": 0, "failed": 0}
+
+LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+NUMBER = re.compile(r"^-?\d+(\.\d+)?([eE][+-]?\d+)?$")
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def strip_code_fences(text):
+    text = re.sub(r"```(?:json|JSON)?\s*([\s\S]*?)\s*```", r"\1", text.strip())
+    return text.replace("```json", "").replace("```", "").strip()
+
+
+def _closes_string(text, i):
+    """
+    A quote only ends a string if the next non-space character could follow a JSON
+    string, or if it is followed by another complete string (a missing comma, as in
+    "a" "b"); otherwise it is treated as an unescaped quote inside the text.
+    """
+    j = _skip_blanks(text, i + 1)
+    while j < len(text) and text[j] == '"':
+        k = text.find('"', j + 1)
+        if k < 0:
+            return False
+        j = _skip_blanks(text, k + 1)
+    return j >= len(text) or text[j] in ",:}]\n"
+
+
+def _skip_blanks(text, j):
+    while j < len(text) and text[j] in " \t\r":
+        j += 1
+    return j
+
+
+def repair_json(text):
+    """
+    Single-pass repair of LLM JSON: skips leading/trailing prose, converts single quotes,
+    quotes bare keys and values, maps Python literals, drops trailing commas, inserts
+    missing commas and closes truncated strings/objects/arrays.
+    """
+    start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+    if start < 0:
+        raise ValueError("No JSON object or array found.")
+
+    out = []
+    stack = []  # [bracket, phase]; phase: key, after_key, value, after_value
+    i = start
+    n = len(text)
+
+    def begin_item():
+        if not stack:
+            return
+        top = stack[-1]
+        if top[1] == "after_value":
+            out.append(",")
+            top[1] = "key" if top[0] == "{" else "value"
+        elif top[1] == "after_key":
+            out.append(":")
+            top[1] = "value"
+
+    def end_item():
+        if not stack:
+            return
+        top = stack[-1]
+        top[1] = "after_key" if top[0] == "{" and top[1] == "key" else "after_value"
+
+    def drop_trailing_comma():
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+
+    while i < n:
+        ch = text[i]
+        if ch in "{[":
+            begin_item()
+            if stack:
+                stack[-1][1] = "after_value"
+            stack.append([ch, "key" if ch == "{" else "value"])
+            out.append(ch)
+            i += 1
+        elif ch in "}]":
+            drop_trailing_comma()
+            top = stack.pop()
+            if top[0] == "{" and top[1] == "after_key":
+                out.append(":null")
+            out.append(CLOSERS[top[0]])
+            i += 1
+            if not stack:
+                break  # ignore trailing text after the root value
+        elif ch in "\"'":
+            begin_item()
+            quote = ch
+            string_start = len(out)
+            is_key = stack and stack[-1][0] == "{" and stack[-1][1] == "key"
+            out.append('"')
+            i += 1
+            closed = False
+            while i < n:
+                c = text[i]
+                if c == "\\" and i + 1 < n:
+                    out.append("'" if text[i + 1] == "'" else text[i:i + 2])
+                    i += 2
+                    continue
+                if c == quote and _closes_string(text, i):
+                    closed = True
+                    i += 1
+                    break
+                if c == '"':
+                    out.append('\\"')
+                elif c == "\n":
+                    out.append("\\n")
+                elif c == "\t":
+                    out.append("\\t")
+                else:
+                    out.append(c)
+                i += 1
+            if not closed:
+                if is_key:
+                    del out[string_start:]  # a half-written key carries no value
+                else:
+                    out.append('"')
+                break
+            out.append('"')
+            end_item()
+        elif ch == ":":
+            if stack and stack[-1][1] == "after_key":
+                out.append(":")
+                stack[-1][1] = "value"
+            i += 1
+        elif ch == ",":
+            if stack and stack[-1][1] == "after_value":
+                out.append(",")
+                stack[-1][1] = "key" if stack[-1][0] == "{" else "value"
+            i += 1
+        elif ch == "/" and text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline < 0 else newline
+        elif ch.isspace():
+            out.append(ch)
+            i += 1
+        else:
+            j = i
+            while j < n and text[j] not in ",:{}[]\n\"":
+                j += 1
+            token = text[i:j].strip()
+            i = j
+            if not token:
+                i += 1
+                continue
+            begin_item()
+            is_key = stack and stack[-1][0] == "{" and stack[-1][1] == "key"
+            if not is_key and token in LITERALS:
+                out.append(LITERALS[token])
+            elif not is_key and NUMBER.match(token):
+                out.append(token)
+            else:
+                out.append(json.dumps(token))
+            end_item()
+
+    # Close anything a truncated response left open
+    while stack:
+        top = stack.pop()
+        drop_trailing_comma()
+        if top[0] == "{" and top[1] == "after_key":
+            out.append(":null")
+        elif top[1] == "value" and out and out[-1] == ":":
+            out.append("null")
+        out.append(CLOSERS[top[0]])
+    return "".join(out)
+
+
+def parse_llm_json(text):
+    """
+    json.loads with a repair fallback for typical LLM output damage.
+    Raises ValueError if nothing usable can be recovered.
+    """
+    if not isinstance(text, str):
+        text = getattr(text, "content", str(text))
+    cleaned = strip_code_fences(text)
+    try:
+        value = json.loads(cleaned)
+        parse_stats["clean"] += 1
+        return value
+    except json.JSONDecodeError:
+        pass
+    try:
+        value = json.loads(repair_json(cleaned))
+    except (ValueError, IndexError) as e:
+        parse_stats["failed"] += 1
+        raise ValueError(f"Unrecoverable JSON from LLM: {e}\n{text}")
+    parse_stats["repaired"] += 1
+    return value
+
+
+# ------------------ Fuzz corpus ------------------
+FUZZ_SEEDS = [
+    {"intent": "adjust", "tool_steps": ["DetectIntent", "ExtractAdjustInfo", "GenerateImg2ImgPrompt"],
+     "summary": "User wants a global color change."},
+    {"intent": "edit", "prompt": "Red dragon emblem with subtle flames, print-quality, 1024x1024",
+     "color": "red", "style": "comic-book", "pattern": "flames", "object_name": "dragon", "part": "hood",
+     "request": "bold, mythical"},
+    {"result": "clarify", "reason": "Unclear if the user means one part or the whole wrap.",
+     "hint": "Could you clarify your request? For example, 'sleek geometric lines in silver'."},
+    {"result": "accept"},
+    {"adjustment": "Change the color to red.", "object_name": "use last", "pattern": "solid color",
+     "color": "red", "style": "photographic", "request": "pure color, clean, no patterns"},
+    {"part": "left_door", "object_name": "dragon", "pattern": "dragon", "color": "use last",
+     "style": "comic-book", "request": "bold, mythical", "strength": 0.8, "retry": False, "mask": None},
+]
+
+
+def _mutations(rng, obj):
+    dumped = json.dumps(obj, indent=2)
+    pythonish = repr(obj)
+    return {
+        "fenced": f"```json\n{dumped}\n```",
+        "prose_prefix": f"Sure! Here is the JSON you asked for:\n{dumped}",
+        "prose_suffix": f"{dumped}\n\nLet me know if you need anything else.",
+        "single_quotes": pythonish,
+        "trailing_commas": re.sub(r"(\"|\]|\d|e)\n", r"\1,\n", dumped),
+        "bare_keys": re.sub(r'"(\w+)":', r"\1:", dumped),
+        "missing_commas": dumped.replace(",\n", "\n"),
+        "raw_newline": dumped.replace(", ", ",\n", 1),
+        "truncated": dumped[:rng.randint(len(dumped) // 2, len(dumped) - 1)],
+    }
+
+
+def fuzz(rounds=200, seed=0):
+    rng = random.Random(seed)
+    totals = {}
+    for _ in range(rounds):
+        for obj in FUZZ_SEEDS:
+            for name, damaged in _mutations(rng, obj).items():
+                stat = totals.setdefault(name, {"plain": 0, "repaired": 0, "cases": 0})
+                stat["cases"] += 1
+                try:
+                    json.loads(damaged)
+                    stat["plain"] += 1
+                except ValueError:
+                    pass
+                try:
+                    value = parse_llm_json(damaged)
+                except ValueError:
+                    continue
+                if name == "truncated":
+                    # Partial objects must keep a consistent prefix of the original fields
+                    ok = isinstance(value, dict) and all(k in obj for k in value)
+                elif name == "raw_newline":
+                    ok = isinstance(value, dict) and value.keys() == obj.keys()
+                else:
+                    ok = value == obj
+                stat["repaired"] += int(ok)
+    print(f"{'mutation':<16} {'cases':>6} {'json.loads':>11} {'parse_llm_json':>15}")
+    for name, stat in totals.items():
+        print(f"{name:<16} {stat['cases']:>6} {stat['plain'] / stat['cases']:>10.0%} {stat['repaired'] / stat['cases']:>15.0%}")
+    return totals
+
+
+if __name__ == "__main__":
+    fuzz()
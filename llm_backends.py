@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+
+from langchain.chat_models import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
+
+import metrics
+import replay
+from circuit_breaker import llm_breaker
+from turn_budget import token_meter
+
+# Which backend each chain uses. "light" resolves to the local server when
+# LOCAL_LLM_BASE_URL is configured, otherwise to the small hosted model.
+DEFAULT_ROUTES = {
+    "example_chain": "light",
+    "guidance_chain": "light",
+    "extract_adjustment_chain": "light",
+    "extract_edit_chain": "light",
+    "extract_design_chain": "strong",
+    "intent_chain": "strong",
+    "text2image_prompt_chain": "strong",
+    "img2img_adjust_prompt_chain": "strong",
+    "inpaint_prompt_chain": "strong",
+    "planning_chain": "strong",
+    "reflection_chain": "strong",
+    "agent": "strong",
+}
+
+
+class ChainLatencyTracker(BaseCallbackHandler):
+    """
+    Records wall-clock latency of every LLM call, keyed by (chain, backend) tags.
+    """
+
+    def __init__(self):
+        self._starts = {}
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    @staticmethod
+    def _label(tags, prefix):
+        return next((t[len(prefix):] for t in tags or [] if t.startswith(prefix)), "unknown")
+
+    def _start(self, run_id, tags):
+        self._starts[run_id] = (time.perf_counter(), self._label(tags, "chain:"), self._label(tags, "backend:"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+        self._start(run_id, tags)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        self._start(run_id, tags)
+
+    def _finish(self, run_id):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        start, chain, backend = started
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples.setdefault((chain, backend), []).append(elapsed)
+        metrics.chain_seconds.observe(chain, backend, value=elapsed)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def report(self):
+        lines = [f"{'chain':<30} {'backend':<8} {'calls':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+        with self._lock:
+            items = sorted(self.samples.items())
+        for (chain, backend), values in items:
+            ordered = sorted(values)
+            p50 = ordered[len(ordered) // 2] * 1000
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+            lines.append(f"{chain:<30} {backend:<8} {len(ordered):>5} {p50:>8.0f} {p95:>8.0f} {ordered[-1] * 1000:>8.0f}")
+        return "\n".join(lines)
+
+
+latency_tracker = ChainLatencyTracker()
+_models = {}
+
+# Bounded waits so a stalled backend fails (and trips its breaker) instead of hanging a turn
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+
+def load_routes():
+    """
+    DEFAULT_ROUTES overridden by LLM_ROUTES, e.g. "guidance_chain=local,reflection_chain=strong",
+    or by a JSON object in llm_routes.json.
+    """
+    routes = dict(DEFAULT_ROUTES)
+    if os.path.isfile("llm_routes.json"):
+        with open("llm_routes.json", "r") as f:
+            routes.update(json.load(f))
+    for item in filter(None, os.getenv("LLM_ROUTES", "").split(",")):
+        name, _, backend = item.partition("=")
+        routes[name.strip()] = backend.strip()
+    return routes
+
+
+def resolve_backend(backend):
+    if backend == "light":
+        return "local" if os.getenv("LOCAL_LLM_BASE_URL") else "small"
+    return backend
+
+
+def get_model(backend):
+    backend = resolve_backend(backend)
+    if backend not in _models:
+        if backend == "strong":
+            model = ChatOpenAI(model=os.getenv("STRONG_LLM_MODEL", "gpt-4o"), temperature=0.3,
+                               request_timeout=LLM_TIMEOUT_S, max_retries=LLM_MAX_RETRIES)
+        elif backend == "small":
+            model = ChatOpenAI(model=os.getenv("SMALL_LLM_MODEL", "gpt-4o-mini"), temperature=0.3,
+                               request_timeout=LLM_TIMEOUT_S, max_retries=LLM_MAX_RETRIES)
+        elif backend == "local":
+            # llama.cpp server (or any OpenAI-compatible endpoint) running on CPU
+            model = ChatOpenAI(
+                model=os.getenv("LOCAL_LLM_MODEL", "local-model"),
+                temperature=0.3,
+                openai_api_base=os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1"),
+                openai_api_key=os.getenv("LOCAL_LLM_API_KEY", "not-needed"),
+                request_timeout=LLM_TIMEOUT_S,
+                max_retries=LLM_MAX_RETRIES
+            )
+        else:
+            raise ValueError(f"Unknown LLM backend: {backend}")
+        _models[backend] = model
+    return _models[backend]
+
+
+def routed_models():
+    """
+    Every distinct backend model the current routes use, keyed by resolved backend name.
+    """
+    return {resolve_backend(b): get_model(b) for b in set(load_routes().values())}
+
+
+def get_llm(chain_name, backend=None):
+    """
+    Model for a chain according to the routing config, tagged for latency tracking.
+    Raises circuit_breaker.CircuitOpen while the backend's circuit is open.
+    """
+    backend = resolve_backend(backend or load_routes().get(chain_name, "strong"))
+    return get_model(backend).with_config(tags=[f"chain:{chain_name}", f"backend:{backend}"], callbacks=[llm_breaker, latency_tracker, token_meter, replay.llm_recorder])
+
+
+def benchmark(chains, backends=("strong", "small", "local"), repeats=3):
+    """
+    chains: {chain_name: (prompt_runnable, sample_input)}. Runs every chain on every
+    backend and prints latency per chain per backend.
+    """
+    for backend in backends:
+        for name, (prompt, sample) in chains.items():
+            for _ in range(repeats):
+                try:
+                    (prompt | get_llm(name, backend=backend)).invoke(sample)
+                except Exception as e:
+                    print(f"⚠️  {name} on {backend} failed: {e}")
+                    break
+    print(latency_tracker.report())
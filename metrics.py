@@ -0,0 +1,220 @@
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; spans a cache hit (ms) to a slow generation call (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {labels}")
+        return tuple(str(v) for v in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram; observe() is a bisect plus three additions under a lock.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Collected(_Metric):
+    """
+    Values read at scrape time from state a module already keeps (stats dicts,
+    queue depths): collect() -> {label values tuple: number}. Costs nothing per call.
+    """
+
+    def __init__(self, name, help_text, collect, labels=(), kind="gauge"):
+        super().__init__(name, help_text, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            return [f"# {self.name} collection failed: {_escape(e)}"]
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f"Metric {metric.name} already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def collected(self, name, help_text, collect, labels=(), kind="gauge"):
+        with self._lock:
+            self._metrics[name] = Collected(name, help_text, collect, labels, kind)  # re-registering replaces the source
+            return self._metrics[name]
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ------------------ Hot-path metrics ------------------
+turn_seconds = registry.histogram("agent_turn_seconds", "Wall-clock time of a user turn", ["intent"])
+chain_seconds = registry.histogram("agent_chain_seconds", "LLM call latency per chain", ["chain", "backend"])
+reflection_outcomes = registry.counter("agent_reflection_outcomes_total", "Reflection decisions", ["result"])
+stability_seconds = registry.histogram("stability_request_seconds", "Stability API call latency", ["endpoint", "status"])
+job_seconds = registry.histogram("image_job_seconds", "Image job time from submit to finish", ["tool", "priority", "state"])
+
+
+def stats_counter(name, help_text, stats, label="result"):
+    """
+    Export a module's running stats dict ({"hits": 3, ...}) as one counter per key.
+    """
+    return registry.collected(name, help_text, lambda: {(k,): v for k, v in stats.items()}, [label], kind="counter")
+
+
+# ------------------ HTTP exporter ------------------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/metrics", "/"]:
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would flood the console
+
+
+_server = None
+
+
+def serve(port=None, host="127.0.0.1"):
+    """
+    Start the /metrics endpoint in a daemon thread (METRICS_PORT, default 9464).
+    Binds to localhost only; returns the server, or None when the port is unavailable.
+    """
+    global _server
+    if _server is not None:
+        return _server
+    port = int(port if port is not None else os.getenv("METRICS_PORT", "9464"))
+    try:
+        _server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"⚠️  Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Metrics at http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+if __name__ == "__main__":
+    print(registry.render(), end="")
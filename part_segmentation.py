@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+# Panel regions of the wrap template, as normalized (x0, y0, x1, y1) boxes. A panel
+# (connected component) belongs to a part when its centroid falls inside the box.
+# A template can override these with a "<template>.parts.json" sidecar.
+DEFAULT_PART_REGIONS = {
+    "hood": [0.20, 0.655, 0.80, 0.95],
+    "left_door": [0.12, 0.05, 0.42, 0.655],
+    "right_door": [0.58, 0.05, 0.88, 0.655],
+}
+
+# Parts made of other parts
+COMPOSITE_PARTS = {
+    "doors": ["left_door", "right_door"],
+    "doors_hood": ["left_door", "right_door", "hood"],
+}
+
+PART_ALIASES = {
+    "door": "doors",
+    "side": "doors",
+    "sides": "doors",
+    "front": "hood",
+    "bonnet": "hood",
+    "hood and doors": "doors_hood",
+    "doors and hood": "doors_hood",
+    "doors hood": "doors_hood",
+    "left door": "left_door",
+    "right door": "right_door",
+}
+
+DEFAULT_PART = "doors_hood"
+
+
+def normalize_part(part):
+    text = str(part or "").strip().lower().replace("-", " ")
+    if text in PART_ALIASES:
+        return PART_ALIASES[text]
+    return text.replace(" ", "_")
+
+
+def load_regions(template_path):
+    sidecar = f"{os.path.splitext(template_path)[0]}.parts.json"
+    if os.path.isfile(sidecar):
+        with open(sidecar, "r") as f:
+            return json.load(f)
+    return dict(DEFAULT_PART_REGIONS)
+
+
+def foreground_mask(img):
+    """
+    Template pixels that differ from the background color (estimated from the border).
+    """
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    img = img[:, :, :3].astype(np.int16)
+    border = np.concatenate([img[0], img[-1], img[:, 0], img[:, -1]])
+    background = np.median(border, axis=0)
+    distance = np.abs(img - background).sum(axis=2).astype(np.float32)
+    distance = cv2.GaussianBlur(distance, (5, 5), 0)
+    return (distance > 60).astype(np.uint8)
+
+
+def segment_panels(img, min_area_ratio=0.002, edge_width=3):
+    """
+    Split the template into panels: foreground minus panel outlines (Canny edges),
+    then connected components. Returns (labels, stats, centroids, ids, foreground)
+    for the components that are not tiny specks.
+    """
+    foreground = foreground_mask(img)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (3, 3), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((edge_width, edge_width), np.uint8))
+    panels = foreground & (edges == 0).astype(np.uint8)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(panels, connectivity=4)
+    min_area = min_area_ratio * img.shape[0] * img.shape[1]
+    keep = [i for i in range(1, count) if stats[i, cv2.CC_STAT_AREA] >= min_area]
+    return labels, stats[keep], centroids[keep], keep, foreground
+
+
+def _bbox_inside(stat, region, w, h):
+    x, y, bw, bh = stat[:4]
+    x0, y0, x1, y1 = region
+    return x0 * w <= x and x + bw <= x1 * w + 1 and y0 * h <= y and y + bh <= y1 * h + 1
+
+
+def part_masks(img, regions=None, close_px=9):
+    """
+    Per-part binary masks (0/255) for a template image. A panel lying inside a part's
+    box belongs to it; a panel spanning several boxes (no drawn seam between e.g. a
+    fender and the door strip) is split at the box edges.
+    """
+    regions = regions or DEFAULT_PART_REGIONS
+    labels, stats, _, ids, foreground = segment_panels(img)
+    h, w = labels.shape
+    ys, xs = np.mgrid[0:h, 0:w]
+    xs, ys = xs / float(w), ys / float(h)
+    spanning = [label for label, stat in zip(ids, stats) if not any(_bbox_inside(stat, r, w, h) for r in regions.values())]
+    kernel = np.ones((close_px, close_px), np.uint8)
+    masks = {}
+    for part, region in regions.items():
+        x0, y0, x1, y1 = region
+        members = [label for label, stat in zip(ids, stats) if _bbox_inside(stat, region, w, h)]
+        inside = (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+        mask = (np.isin(labels, members) | (np.isin(labels, spanning) & inside)).astype(np.uint8)
+        # Close the outline gaps between panels of the same part, stay on the vehicle
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel) & cv2.dilate(foreground, kernel)
+        masks[part] = mask * 255
+    for part, members in COMPOSITE_PARTS.items():
+        if all(m in masks for m in members):
+            masks[part] = np.maximum.reduce([masks[m] for m in members])
+    return masks
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def template_mask_dir(template_path, mask_root=None):
+    mask_root = mask_root or os.path.join(os.getcwd(), "mask")
+    return os.path.join(mask_root, os.path.splitext(os.path.basename(template_path))[0])
+
+
+def segment_template(template_path, mask_root=None, force=False):
+    """
+    Derive and cache every part mask for a vehicle template under mask/<template>/.
+    Re-runs only when the template (or its regions sidecar) changed.
+    Returns {part: mask_path}.
+    """
+    output_dir = template_mask_dir(template_path, mask_root)
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    regions = load_regions(template_path)
+    digest = _file_digest(template_path)
+    if not force and os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("template_sha256") == digest and manifest.get("regions") == regions \
+                and all(os.path.isfile(p) for p in manifest["masks"].values()):
+            return manifest["masks"]
+
+    img = cv2.imread(template_path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"Vehicle template not found: {template_path}")
+    start = time.perf_counter()
+    masks = part_masks(img, regions)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for part, mask in masks.items():
+        if not mask.any():
+            print(f"⚠️  No panels found for '{part}' in {template_path}; check its regions.")
+            continue
+        paths[part] = os.path.join(output_dir, f"{part}.png")
+        cv2.imwrite(paths[part], mask)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"template": template_path, "template_sha256": digest, "regions": regions, "masks": paths}, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    print(f"🧩 Segmented {template_path} into {len(paths)} part masks in {time.perf_counter() - start:.2f}s -> {output_dir}")
+    return paths
+
+
+def mask_for_part(part, template_path=None, mask_root=None):
+    """
+    Mask file for an edit part. Without a template, the hand-drawn masks in mask/
+    are used (hood.png, doors.png, doors_hood.png); with one, the segmented masks.
+    Unknown parts fall back to doors_hood.
+    """
+    part = normalize_part(part)
+    mask_root = mask_root or os.path.join(os.getcwd(), "mask")
+    if template_path:
+        masks = segment_template(template_path, mask_root)
+    else:
+        masks = {name: os.path.join(mask_root, f"{name}.png") for name in ["hood", "doors", "doors_hood"]}
+        masks["left_door"] = masks["right_door"] = masks["doors"]
+    if part not in masks:
+        if part not in ["", "none", "null", "unknown"]:
+            print(f"⚠️  No mask for part '{part}', using {DEFAULT_PART}.")
+        part = DEFAULT_PART
+    return masks[part]
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python part_segmentation.py <template.png> [--force]: onboard a new vehicle template
+    if len(sys.argv) < 2:
+        print("Usage: python part_segmentation.py <template.png> [--force]")
+        sys.exit(1)
+    for part, path in segment_template(sys.argv[1], force="--force" in sys.argv).items():
+        mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        print(f"{part:<12} {int((mask > 0).sum()):>9} px  {path}")
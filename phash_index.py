@@ -0,0 +1,248 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from itertools import combinations
+
+import cv2
+import numpy as np
+
+import image_registry
+import image_workers
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+
+# ------------------ Perceptual hashes ------------------
+def phash(img, hash_size=8, highfreq_factor=4):
+    """
+    DCT hash: low-frequency DCT coefficients of a 32x32 thumbnail, thresholded at the median.
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    size = hash_size * highfreq_factor
+    small = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size]
+    bits = (low > np.median(low.flatten()[1:])).flatten()
+    return _bits_to_int(bits)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hash_file(path):
+    try:
+        img = image_registry.registry.get_array(path, cv2.IMREAD_GRAYSCALE)
+    except ValueError:
+        img = None
+    if img is None:
+        raise FileNotFoundError(f"Image not found: {path}")
+    return image_workers.run("phash_index:phash", img)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def prompt_key(prompt):
+    return re.sub(r"[^a-z0-9]+", " ", (prompt or "").lower()).strip()
+
+
+def prompt_similarity(key_a, key_b):
+    """
+    Jaccard similarity of the word sets of two normalized prompts (prompt_key).
+    """
+    words_a, words_b = set((key_a or "").split()), set((key_b or "").split())
+    if not words_a or not words_b:
+        return 1.0 if words_a == words_b else 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+# ------------------ Index ------------------
+class PerceptualIndex:
+    """
+    Near-duplicate index over 64-bit perceptual hashes.
+
+    Uses multi-index hashing instead of a BK-tree: the hash is split into 4 chunks of
+    16 bits, and two hashes within distance r must agree on at least one chunk up to
+    r // 4 flipped bits (pigeonhole). A query therefore only touches the few buckets
+    around its own chunks, which keeps lookups sub-millisecond at 100k+ images.
+    Requests are indexed too: per (style, intent, part), an inverted index from prompt
+    words to entries, so candidate_for() only scores entries that can reach the
+    similarity threshold. Entries are appended to a JSONL file so the index survives restarts.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = []
+        self.tables = [dict() for _ in range(CHUNKS)]
+        self.requests = {}  # (style, intent, part) -> {prompt word: [entry index]}
+        self._lock = threading.Lock()
+        if path and os.path.isfile(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        self._insert(json.loads(line))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _insert(self, entry):
+        idx = len(self.entries)
+        self.entries.append(entry)
+        h = entry["hash"]
+        for i, table in enumerate(self.tables):
+            table.setdefault((h >> (i * CHUNK_BITS)) & CHUNK_MASK, []).append(idx)
+        if entry.get("prompt_key"):
+            postings = self.requests.setdefault((entry.get("style"), entry.get("intent"), entry.get("part")), {})
+            for word in set(entry["prompt_key"].split()):
+                postings.setdefault(word, []).append(idx)
+        return idx
+
+    def add(self, path, image_hash=None, **meta):
+        if image_hash is None:
+            image_hash = hash_file(path)
+        entry = {"hash": image_hash, "path": path, **meta}
+        with self._lock:
+            self._insert(entry)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def query(self, image_hash, max_distance=6):
+        """
+        Return [(distance, entry)] for all entries within max_distance, closest first.
+        """
+        sub_radius = max_distance // CHUNKS
+        flips = [0]
+        for r in range(1, sub_radius + 1):
+            for bits in combinations(range(CHUNK_BITS), r):
+                mask = 0
+                for b in bits:
+                    mask |= 1 << b
+                flips.append(mask)
+
+        seen = set()
+        matches = []
+        for i, table in enumerate(self.tables):
+            chunk = (image_hash >> (i * CHUNK_BITS)) & CHUNK_MASK
+            for flip in flips:
+                for idx in table.get(chunk ^ flip, ()):
+                    if idx in seen:
+                        continue
+                    seen.add(idx)
+                    distance = hamming(image_hash, self.entries[idx]["hash"])
+                    if distance <= max_distance:
+                        matches.append((distance, self.entries[idx]))
+        matches.sort(key=lambda m: m[0])
+        return matches
+
+    def find_near(self, path, max_distance=6):
+        return [m for m in self.query(hash_file(path), max_distance) if m[1]["path"] != path]
+
+    def candidate_for(self, prompt, style, input_path=None, max_distance=6, min_similarity=0.75, intent=None, part=None):
+        """
+        Most similar existing output for a near-identical request: same style, intent
+        and part, a prompt whose word overlap reaches min_similarity (reworded or
+        reordered requests still match) and, for img2img or inpainting, a perceptually
+        matching input image. Returns the entry plus its "similarity", newest first
+        among equals.
+
+        Prefix filtering keeps this indexed: an entry with Jaccard similarity >= t
+        shares at least ceil(t * n) of the prompt's n words, so it must contain one of
+        the prompt's n - ceil(t * n) + 1 rarest words. Only those posting lists are scored.
+        """
+        key = prompt_key(prompt)
+        words = set(key.split())
+        postings = self.requests.get((style, intent, part))
+        if not words or not postings:
+            return None
+        rarest = sorted(words, key=lambda w: len(postings.get(w, ())))
+        prefix = rarest[:len(words) - math.ceil(min_similarity * len(words) - 1e-9) + 1]
+        candidates = set()
+        for word in prefix:
+            candidates.update(postings.get(word, ()))
+
+        input_hash = hash_file(input_path) if input_path else None
+        best, best_similarity = None, min_similarity
+        for idx in sorted(candidates, reverse=True):  # newest first
+            entry = self.entries[idx]
+            similarity = prompt_similarity(entry["prompt_key"], key)
+            if similarity < best_similarity or (best is not None and similarity == best_similarity):
+                continue
+            if input_hash is not None:
+                if entry.get("input_hash") is None or hamming(entry["input_hash"], input_hash) > max_distance:
+                    continue
+            if image_registry.registry.exists(entry["path"]):
+                best, best_similarity = entry, similarity
+                if similarity == 1.0:
+                    break
+        return {**best, "similarity": best_similarity} if best is not None else None
+
+    def dedupe(self, paths, max_distance=6):
+        """
+        Group near-identical images. Returns (kept, duplicates) where duplicates maps
+        each dropped path to the kept path it duplicates.
+        """
+        local = PerceptualIndex()
+        kept, duplicates = [], {}
+        for path in paths:
+            h = hash_file(path)
+            matches = local.query(h, max_distance)
+            if matches:
+                duplicates[path] = matches[0][1]["path"]
+            else:
+                local.add(path, image_hash=h)
+                kept.append(path)
+        return kept, duplicates
+
+
+# ------------------ Benchmark ------------------
+def benchmark(n=100_000, queries=2_000, max_distance=6):
+    rng = random.Random(0)
+    index = PerceptualIndex()
+    start = time.perf_counter()
+    hashes = [rng.getrandbits(HASH_BITS) for _ in range(n)]
+    for i, h in enumerate(hashes):
+        index._insert({"hash": h, "path": f"img_{i}.png"})
+    build_s = time.perf_counter() - start
+
+    probes = []
+    for _ in range(queries):
+        h = rng.choice(hashes)
+        for bit in rng.sample(range(HASH_BITS), rng.randint(0, max_distance)):
+            h ^= 1 << bit
+        probes.append(h)
+
+    start = time.perf_counter()
+    found = sum(1 for h in probes if index.query(h, max_distance))
+    query_s = time.perf_counter() - start
+    print(f"build {n} entries: {build_s:.2f} s")
+    print(f"query (radius {max_distance}): {query_s / queries * 1e6:.0f} us/lookup, {found}/{queries} near-matches found")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        # python phash_index.py <folder>: report near-duplicates among bulk outputs
+        folder = sys.argv[1]
+        paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith((".png", ".jpg", ".webp")))
+        kept, duplicates = PerceptualIndex().dedupe(paths)
+        for dup, original in duplicates.items():
+            print(f"{dup} ~ {original}")
+        print(f"{len(kept)} unique, {len(duplicates)} near-duplicates")
+    else:
+        benchmark()
@@ -0,0 +1,169 @@
+import os
+from functools import lru_cache
+
+import cv2
+
+import image_registry
+import image_workers
+
+# Mirrors the style list the extraction prompts are restricted to
+ALLOWED_STYLE_PRESETS = [
+    "enhance", "anime", "photographic", "digital-art", "comic-book", "fantasy-art", "line-art",
+    "analog-film", "neon-punk", "isometric", "low-poly", "origami", "modeling-compound",
+    "cinematic", "3d-model", "pixel-art", "tile-texture",
+]
+
+# Stability v2beta input limits
+MAX_PROMPT_CHARS = 10000
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MIN_SIDE_PX = 64
+MAX_PIXELS = 9_437_184
+MAX_ASPECT_RATIO = 2.5
+MAX_SEED = 4294967294
+
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"\xff\xd8\xff": "jpeg",
+    b"RIFF": "webp",
+}
+
+
+def check_prompt(prompt):
+    if not prompt or not str(prompt).strip():
+        raise ValueError("Empty prompt.")
+    prompt = str(prompt).strip()
+    if len(prompt) > MAX_PROMPT_CHARS:
+        raise ValueError(f"Prompt is {len(prompt)} characters, limit is {MAX_PROMPT_CHARS}.")
+    return prompt
+
+
+def check_style(style_preset):
+    """
+    No style means no style_preset field (the API default), as before preflight.
+    """
+    style = str(style_preset or "").strip().lower().replace("_", "-").replace(" ", "-")
+    if not style:
+        return None
+    if style not in ALLOWED_STYLE_PRESETS:
+        raise ValueError(f"Invalid style_preset '{style_preset}'. Allowed: {', '.join(ALLOWED_STYLE_PRESETS)}")
+    return style
+
+
+def check_seed(seed):
+    try:
+        seed = int(seed)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid seed: {seed}")
+    if not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"Seed {seed} outside 0..{MAX_SEED}.")
+    return seed
+
+
+def _format(head):
+    fmt = next((name for sig, name in IMAGE_SIGNATURES.items() if head.startswith(sig)), None)
+    if fmt == "webp" and head[8:12] != b"WEBP":
+        fmt = None
+    return fmt
+
+
+def probe(path):
+    """
+    (format, width, height) of an image file; runs in the image worker pool.
+    """
+    with open(path, "rb") as f:
+        fmt = _format(f.read(12))
+    img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return fmt, None, None
+    return fmt, img.shape[1], img.shape[0]
+
+
+@lru_cache(maxsize=256)
+def _image_info(path, mtime, size):
+    return image_workers.run("preflight:probe", path)
+
+
+def image_info(path):
+    """
+    Return (format, width, height, bytes) for an image file; raises ValueError if unusable.
+    Decoding is cached per (path, mtime, size) so repeated turns do not re-read masks;
+    images still held by the image registry are inspected in memory.
+    """
+    registry = image_registry.registry
+    if path and registry.cached(path):
+        data = registry.get_bytes(path)
+        fmt = _format(data[:12])
+        try:
+            h, w = registry.get_array(path, cv2.IMREAD_UNCHANGED).shape[:2]
+        except ValueError:
+            fmt = None
+        if fmt is None:
+            raise ValueError(f"Unsupported or corrupt image (png, jpeg, webp only): {path}")
+        return fmt, w, h, len(data)
+    if not path or not os.path.isfile(path):
+        raise ValueError(f"Image not found or unreadable: {path}")
+    stat = os.stat(path)
+    fmt, w, h = _image_info(path, stat.st_mtime_ns, stat.st_size)
+    if fmt is None or w is None:
+        raise ValueError(f"Unsupported or corrupt image (png, jpeg, webp only): {path}")
+    return fmt, w, h, stat.st_size
+
+
+def check_image(path):
+    """
+    Validate an upload image and downscale it (INTER_AREA) when it exceeds the pixel budget.
+    Returns the path that should be uploaded.
+    """
+    fmt, w, h, size = image_info(path)
+    if min(w, h) < MIN_SIDE_PX:
+        raise ValueError(f"Image {path} is {w}x{h}, each side must be at least {MIN_SIDE_PX}px.")
+    if max(w, h) / min(w, h) > MAX_ASPECT_RATIO:
+        raise ValueError(f"Image {path} aspect ratio {w}x{h} exceeds {MAX_ASPECT_RATIO}:1.")
+    if w * h <= MAX_PIXELS and size <= MAX_UPLOAD_BYTES:
+        return path
+
+    scale = min(1.0, (MAX_PIXELS / float(w * h)) ** 0.5)
+    img = image_registry.registry.get_array(path, cv2.IMREAD_UNCHANGED)
+    root, _ = os.path.splitext(path)
+    normalized_path = f"{root}_preflight.png"
+    new_w, new_h = image_workers.run("image_workers:resize_to_file", img, (int(w * scale), int(h * scale)), normalized_path,
+                                     interpolation=cv2.INTER_AREA, params=(cv2.IMWRITE_PNG_COMPRESSION, 9))
+    if os.path.getsize(normalized_path) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Image {path} is larger than {MAX_UPLOAD_BYTES} bytes even after resizing.")
+    print(f"📐 Resized upload {w}x{h} -> {new_w}x{new_h}: {normalized_path}")
+    return normalized_path
+
+
+def check_mask(mask_path, target_size):
+    """
+    Ensure the mask matches the init image size. A mismatched mask is resized once with
+    INTER_NEAREST (as feather_mask does) and cached next to the original.
+    """
+    _, w, h, _ = image_info(mask_path)
+    target_w, target_h = target_size
+    if (w, h) == (target_w, target_h):
+        return mask_path
+
+    root, _ = os.path.splitext(mask_path)
+    resized_path = f"{root}_{target_w}x{target_h}.png"
+    if not os.path.isfile(resized_path) or os.path.getmtime(resized_path) < os.path.getmtime(mask_path):
+        mask = image_registry.registry.get_array(mask_path, cv2.IMREAD_GRAYSCALE)
+        image_workers.run("image_workers:resize_to_file", mask, (target_w, target_h), resized_path, interpolation=cv2.INTER_NEAREST)
+        print(f"📐 Resized mask {w}x{h} -> {target_w}x{target_h}: {resized_path}")
+    return resized_path
+
+
+# ------------------ Per-endpoint checks ------------------
+def preflight_text2image(prompt, style_preset, seed):
+    return check_prompt(prompt), check_style(style_preset), check_seed(seed)
+
+
+def preflight_img2img(input_image_path, prompt, style_preset, seed):
+    return check_image(input_image_path), check_prompt(prompt), check_style(style_preset), check_seed(seed)
+
+
+def preflight_inpainting(init_image_path, mask_image_path, prompt, style_preset, seed):
+    init_image_path = check_image(init_image_path)
+    _, w, h, _ = image_info(init_image_path)
+    mask_image_path = check_mask(mask_image_path, (w, h))
+    return init_image_path, mask_image_path, check_prompt(prompt), check_style(style_preset), check_seed(seed)
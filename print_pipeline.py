@@ -0,0 +1,266 @@
+import os
+import struct
+import time
+import zlib
+
+import cv2
+import numpy as np
+
+import image_registry
+import image_workers
+
+
+# ------------------ Seamless tile check ------------------
+def seam_score(img):
+    """
+    Mean absolute difference (0..1) between opposite edges of a tile.
+    Returns (horizontal, vertical): left/right columns and top/bottom rows.
+    """
+    img = img.astype(np.float32)
+    horizontal = float(np.mean(np.abs(img[:, 0] - img[:, -1]))) / 255.0
+    vertical = float(np.mean(np.abs(img[0, :] - img[-1, :]))) / 255.0
+    return horizontal, vertical
+
+
+def is_seamless(img, threshold=0.04):
+    horizontal, vertical = seam_score(img)
+    return horizontal <= threshold and vertical <= threshold
+
+
+def blend_edges(img, band=64):
+    """
+    Make a tile seamless by cross-fading each edge band with the opposite side.
+    The tile loses `band` pixels per axis and is resized back to its original size.
+    """
+    h, w = img.shape[:2]
+    band = max(1, min(band, w // 4, h // 4))
+    out = img.astype(np.float32)
+
+    ramp = np.linspace(0.0, 1.0, band, dtype=np.float32)
+    ramp_x = ramp.reshape(1, band, *([1] * (out.ndim - 2)))
+    blended = out[:, :w - band].copy()
+    blended[:, :band] = out[:, :band] * ramp_x + out[:, w - band:] * (1.0 - ramp_x)
+    out = blended
+
+    ramp_y = ramp.reshape(band, 1, *([1] * (out.ndim - 2)))
+    blended = out[:h - band].copy()
+    blended[:band] = out[:band] * ramp_y + out[h - band:] * (1.0 - ramp_y)
+    out = np.clip(blended, 0, 255).astype(np.uint8)
+
+    return cv2.resize(out, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+def upscale(img, scale, interpolation=cv2.INTER_LANCZOS4):
+    if scale == 1:
+        return img
+    h, w = img.shape[:2]
+    return cv2.resize(img, (int(round(w * scale)), int(round(h * scale))), interpolation=interpolation)
+
+
+# ------------------ Chunked PNG output ------------------
+class StreamingPNGWriter:
+    """
+    Write a PNG strip by strip so the full image never has to be held in RAM.
+    Rows are Sub-filtered with NumPy and deflated incrementally into IDAT chunks.
+    Expects BGR/BGRA/gray uint8 strips (OpenCV channel order).
+    """
+
+    COLOR_TYPES = {1: 0, 3: 2, 4: 6}
+
+    def __init__(self, path, width, height, channels=3, compress_level=3, dpi=None):
+        if channels not in self.COLOR_TYPES:
+            raise ValueError(f"Unsupported channel count: {channels}")
+        self.path = path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(path, "wb")
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, self.COLOR_TYPES[channels], 0, 0, 0))
+        if dpi:
+            ppm = int(round(dpi / 0.0254))
+            self._chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1))
+
+    def _chunk(self, tag, payload):
+        self._file.write(struct.pack(">I", len(payload)))
+        self._file.write(tag)
+        self._file.write(payload)
+        self._file.write(struct.pack(">I", zlib.crc32(payload, zlib.crc32(tag)) & 0xFFFFFFFF))
+
+    def write_rows(self, strip):
+        if strip.ndim == 2:
+            strip = strip[:, :, None]
+        rows, width, channels = strip.shape
+        if width != self.width or channels != self.channels:
+            raise ValueError(f"Strip shape {strip.shape} does not match {self.width}x{self.channels}")
+        if self.rows_written + rows > self.height:
+            raise ValueError("Too many rows written.")
+
+        if channels >= 3:
+            strip = strip[:, :, [2, 1, 0] + list(range(3, channels))]  # BGR(A) -> RGB(A)
+        flat = np.ascontiguousarray(strip).reshape(rows, width * channels)
+        filtered = np.empty((rows, width * channels + 1), dtype=np.uint8)
+        filtered[:, 0] = 1  # PNG "Sub" filter
+        filtered[:, 1:channels + 1] = flat[:, :channels]
+        np.subtract(flat[:, channels:], flat[:, :-channels], out=filtered[:, channels + 1:])
+
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += rows
+
+    def abort(self):
+        self._file.close()
+        os.remove(self.path)
+
+    def close(self):
+        if self.rows_written != self.height:
+            raise ValueError(f"Expected {self.height} rows, wrote {self.rows_written}.")
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+        self._file.close()
+
+
+# ------------------ Tiling ------------------
+def tile_to_panel(tile, output_path, width, height, x_offset=0, chunk_rows=512, dpi=None):
+    """
+    Repeat a seamless tile over a width x height panel, streamed in strips of chunk_rows.
+    x_offset keeps the pattern continuous when a wrap is split into several panels.
+    """
+    tile_h, tile_w = tile.shape[:2]
+    channels = 1 if tile.ndim == 2 else tile.shape[2]
+
+    # One horizontally repeated band of the tile, reused for every strip
+    reps_x = (x_offset % tile_w + width) // tile_w + 2
+    band = np.tile(tile, (1, reps_x) + (1,) * (tile.ndim - 2))
+    band = band[:, x_offset % tile_w:x_offset % tile_w + width]
+
+    writer = StreamingPNGWriter(output_path, width, height, channels=channels, dpi=dpi)
+    try:
+        y = 0
+        while y < height:
+            rows = min(chunk_rows, height - y)
+            idx = (np.arange(y, y + rows) % tile_h)
+            writer.write_rows(band[idx])
+            y += rows
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return output_path
+
+
+def render_print_panels(tile, output_dir, total_width, total_height, panel_width, overlap=0, chunk_rows=512, dpi=None):
+    """
+    Split a total wrap size into vertical print panels (e.g. the vinyl roll width),
+    each with `overlap` pixels shared with its neighbour for installation.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    x = 0
+    index = 1
+    while x < total_width:
+        width = min(panel_width, total_width - x)
+        path = os.path.join(output_dir, f"panel_{index:02d}.png")
+        tile_to_panel(tile, path, width, total_height, x_offset=x, chunk_rows=chunk_rows, dpi=dpi)
+        paths.append(path)
+        if x + width >= total_width:
+            break
+        x += width - overlap
+        index += 1
+    return paths
+
+
+# ------------------ Pool ops ------------------
+def make_tile(img, seam_threshold=0.04, ext=".png"):
+    """
+    Seam score of img, plus its blended and encoded tile when it does not tile
+    seamlessly: (score, tile or None, encoded tile or None).
+    """
+    score = seam_score(img)
+    if score[0] <= seam_threshold and score[1] <= seam_threshold:
+        return score, None, None
+    tile = blend_edges(img)
+    ok, buf = cv2.imencode(ext, tile)
+    if not ok:
+        raise ValueError(f"Could not encode tile as {ext}")
+    return score, tile, buf
+
+
+def write_panels(tile, output_dir, total_width, total_height, panel_width, scale=1, overlap=0, dpi=None):
+    return render_print_panels(upscale(tile, scale), output_dir, total_width, total_height, panel_width,
+                               overlap=overlap, dpi=dpi)
+
+
+# ------------------ Pipeline stage ------------------
+def parse_size(value):
+    if not value:
+        return None
+    w, h = value.lower().split("x")
+    return int(w), int(h)
+
+
+def prepare_for_print(image_path, output_size=None, panel_width=None, overlap=0, scale=1, dpi=None, seam_threshold=0.04,
+                      tile_path=None):
+    """
+    Post-process a generated texture for print: check that it tiles seamlessly, blend
+    the edges if not, optionally upscale, and stream the tiled output panels to disk.
+    The seam check, blending, upscaling and panel writing run in the image worker
+    pool. A blended tile goes to tile_path (default <image>_tile.<ext>) through the
+    image registry's atomic write.
+    """
+    try:
+        img = image_registry.registry.get_array(image_path, cv2.IMREAD_UNCHANGED)
+    except ValueError:
+        img = None
+    if img is None:
+        raise FileNotFoundError(f"Image not found: {image_path}")
+
+    root, ext = os.path.splitext(image_path)
+    tile_path = tile_path or f"{root}_tile{ext}"
+    score, tile, buf = image_workers.run("print_pipeline:make_tile", img, seam_threshold, os.path.splitext(tile_path)[1])
+    result = {"image_path": image_path, "seam_score": score, "tile_path": image_path, "panels": []}
+    if tile is not None:
+        img = tile
+        result["tile_path"] = tile_path
+        image_registry.registry.put(tile_path, buf.tobytes(), array=img, flags=cv2.IMREAD_UNCHANGED)
+        print(f"🧵 Blended tile edges (seam score {score}) -> {tile_path}")
+
+    if output_size:
+        total_w, total_h = output_size
+        result["panels"] = image_workers.run("print_pipeline:write_panels", img, f"{root}_print", total_w, total_h,
+                                             panel_width or total_w, scale=scale, overlap=overlap, dpi=dpi)
+        print(f"🖨️  Print panels written: {len(result['panels'])} x {total_h}px high")
+    return result
+
+
+# ------------------ Benchmark ------------------
+def benchmark(width=20000, height=10000, tile_size=1024, output_dir="bench_print"):
+    import resource
+
+    rng = np.random.default_rng(0)
+    tile = rng.integers(0, 255, (tile_size, tile_size, 3), dtype=np.uint8)
+    tile = cv2.GaussianBlur(tile, (0, 0), 8)
+
+    start = time.perf_counter()
+    tile = blend_edges(tile)
+    blend_s = time.perf_counter() - start
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"synthetic_{width}x{height}.png")
+    start = time.perf_counter()
+    tile_to_panel(tile, output_path, width, height)
+    tile_s = time.perf_counter() - start
+
+    raw_mb = width * height * 3 / 1e6
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"blend_edges({tile_size}px): {blend_s * 1000:.1f} ms")
+    print(f"tile_to_panel({width}x{height}): {tile_s:.2f} s, {raw_mb / tile_s:.0f} MB/s raw, "
+          f"{os.path.getsize(output_path) / 1e6:.0f} MB on disk")
+    print(f"raw image {raw_mb:.0f} MB, peak RSS {peak_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    benchmark()
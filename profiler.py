@@ -0,0 +1,223 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Leaf frames that mean the thread is blocked, not running Python: network reads,
+# connection setup, waiting on a job future or a lock
+WAIT_FRAMES = {
+    ("socket.py", "readinto"), ("socket.py", "create_connection"), ("socket.py", "getaddrinfo"),
+    ("ssl.py", "read"), ("ssl.py", "recv_into"), ("ssl.py", "do_handshake"), ("ssl.py", "sendall"),
+    ("selectors.py", "select"), ("threading.py", "wait"), ("_base.py", "result"), ("queue.py", "get"),
+}
+
+# thread ident -> stack of phase names; maintained even when no profiler runs (a list push/pop)
+_phase_stacks = {}
+_active = None
+
+
+class phase:
+    """
+    Attribute everything the current thread does inside the block to `name`
+    (planning, agent, tool:<name>, reflection, image_io, guidance). Phases nest.
+    """
+
+    __slots__ = ("name", "_wall", "_cpu")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _phase_stacks.setdefault(threading.get_ident(), []).append(self.name)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        stack = _phase_stacks.get(threading.get_ident())
+        if stack:
+            stack.pop()
+        if _active is not None:
+            _active.record_phase(self.name, time.perf_counter() - self._wall, time.thread_time() - self._cpu)
+        return False
+
+
+class PhaseCallback(BaseCallbackHandler):
+    """
+    Agent tool calls run inside agent_executor.invoke; this puts each in its own tool:<name> phase.
+    """
+
+    def __init__(self):
+        self._open = {}
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._open[run_id] = phase(f"tool:{(serialized or {}).get('name', 'unknown')}").__enter__()
+
+    def _end(self, run_id):
+        opened = self._open.pop(run_id, None)
+        if opened is not None:
+            opened.__exit__(None, None, None)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+
+phase_callback = PhaseCallback()
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Profiler:
+    """
+    Opt-in sampling profiler for the thread that drives turns.
+    mode "wall": a background thread samples the driver's stack every interval,
+    blocked time included (network waits show up under socket/ssl frames).
+    mode "cpu": SIGPROF (ITIMER_PROF) samples only while the process burns CPU,
+    i.e. Python-side overhead; Unix only and the driver must be the main thread.
+    Each turn is written as collapsed stacks ("turn;[phase];frame;... count"), the
+    input format of flamegraph.pl / speedscope, under profiles/.
+    """
+
+    def __init__(self, mode="wall", interval_s=0.005, output_dir=None, session=None):
+        if mode not in ["wall", "cpu"]:
+            raise ValueError(f"Unknown profiling mode '{mode}'. Use 'wall' or 'cpu'.")
+        if mode == "cpu" and (not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread()):
+            raise ValueError("CPU profiling needs setitimer and must be started from the main thread.")
+        self.mode = mode
+        self.interval_s = interval_s
+        self.session = session or time.strftime("%Y%m%d-%H%M%S")
+        self.output_dir = os.path.join(output_dir or os.path.join(os.getcwd(), "profiles"), self.session)
+        self.target = threading.get_ident()
+        self.turn = None
+        self.samples = Counter()
+        self.session_samples = Counter()
+        self.phase_times = {}  # phase -> [wall_s, cpu_s, count]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ------------------ Sampling ------------------
+    def _record(self, frame):
+        frames = []
+        while frame is not None:
+            frames.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        if not frames:
+            return
+        phases = [f"[{name}]" for name in _phase_stacks.get(self.target) or ["other"]]
+        stack = ";".join([f"turn-{self.turn}"] + phases + frames[::-1])
+        with self._lock:
+            self.samples[stack] += 1
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.target)
+            if frame is not None:
+                self._record(frame)
+            del frame
+
+    def _on_sigprof(self, signum, frame):
+        self._record(frame)
+
+    def record_phase(self, name, wall_s, cpu_s):
+        with self._lock:
+            times = self.phase_times.setdefault(name, [0.0, 0.0, 0])
+            times[0] += wall_s
+            times[1] += cpu_s
+            times[2] += 1
+
+    # ------------------ Turns ------------------
+    def begin_turn(self, turn):
+        global _active
+        if self.turn is not None:
+            self.end_turn()
+        self.turn = turn
+        self.samples = Counter()
+        self.phase_times = {}
+        _active = self
+        if self.mode == "cpu":
+            signal.signal(signal.SIGPROF, self._on_sigprof)
+            signal.setitimer(signal.ITIMER_PROF, self.interval_s, self.interval_s)
+        else:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._thread.start()
+
+    def end_turn(self):
+        """
+        Stop sampling, write the turn's collapsed stacks and print where the time went.
+        """
+        global _active
+        if self.turn is None:
+            return None
+        if self.mode == "cpu":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        else:
+            self._stop.set()
+            self._thread.join()
+        _active = None
+        path = self._write(f"turn-{self.turn}.{self.mode}.folded", self.samples)
+        self.session_samples.update(self.samples)
+        print(f"🔬 {self.summary()}\n   -> {path}")
+        self.turn = None
+        return path
+
+    def close(self):
+        self.end_turn()
+        if self.session_samples:
+            path = self._write(f"session.{self.mode}.folded", self.session_samples)
+            print(f"🔬 Session profile -> {path}")
+
+    def _write(self, name, samples):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, name)
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    # ------------------ Reporting ------------------
+    def breakdown(self, samples=None):
+        """
+        {phase: (samples, wait samples)} from the innermost phase of each stack.
+        """
+        result = {}
+        for stack, count in (samples or self.samples).items():
+            parts = stack.split(";")[1:]
+            phases = [p[1:-1] for p in parts if p.startswith("[")] or ["other"]
+            leaf = tuple(parts[-1].rsplit(":", 1))
+            total, wait = result.get(phases[-1], (0, 0))
+            result[phases[-1]] = (total + count, wait + (count if leaf in WAIT_FRAMES else 0))
+        return result
+
+    def summary(self):
+        total = sum(self.samples.values())
+        parts = []
+        for name, (count, wait) in sorted(self.breakdown().items(), key=lambda kv: -kv[1][0]):
+            text = f"{name} {count * self.interval_s:.2f}s"
+            if self.mode == "wall" and count:
+                text += f" ({wait / count:.0%} waiting)"
+            parts.append(text)
+        timed = ", ".join(f"{name} {wall:.2f}s wall/{cpu:.2f}s cpu" for name, (wall, cpu, _) in sorted(self.phase_times.items()))
+        return f"Turn {self.turn} profile ({self.mode}, {total} samples): {'; '.join(parts) or 'no samples'}" + \
+               (f"\n   phases: {timed}" if timed else "")
+
+
+def from_env():
+    """
+    PROFILE=wall or PROFILE=cpu turns profiling on (PROFILE_INTERVAL_MS, default 5).
+    """
+    mode = os.getenv("PROFILE", "").strip().lower()
+    if not mode or mode in ["0", "off", "false", "no"]:
+        return None
+    return Profiler(mode=mode, interval_s=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000.0)
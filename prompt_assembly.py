@@ -0,0 +1,97 @@
+from langchain.prompts import PromptTemplate
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoder = None
+
+
+def count_tokens(text, model="gpt-4o"):
+    """
+    Token count with tiktoken when available, otherwise the ~4 characters/token estimate.
+    """
+    global _encoder
+    if tiktoken is not None and _encoder is None:
+        try:
+            _encoder = tiktoken.encoding_for_model(model)
+        except Exception:
+            # Unknown model or the BPE file cannot be downloaded (offline host)
+            _encoder = False
+    if not _encoder:
+        return max(1, len(text) // 4)
+    return len(_encoder.encode(text))
+
+
+class ExampleSection:
+    """
+    One retrieved block of the prompt (e.g. few-shot examples) backed by an ExampleStore.
+    """
+
+    def __init__(self, store, k=None, header="", numbered=False, max_per_label=None, separator="\n\n"):
+        self.store = store
+        self.separator = separator
+        self.k = k
+        self.header = header
+        self.numbered = numbered
+        self.max_per_label = max_per_label
+
+    def select(self, query, state):
+        if self.k is None or self.k >= len(self.store):
+            return list(range(len(self.store)))
+        # Keep the stored order so the selected block reads like the full list
+        return sorted(self.store.search(query, self.k, state=state, max_per_label=self.max_per_label))
+
+    def render(self, indices):
+        blocks = []
+        for n, i in enumerate(indices, start=1):
+            text = self.store.records[i]["text"]
+            blocks.append(f"{n}. {text}" if self.numbered else text)
+        return self.header + self.separator.join(blocks)
+
+
+class FewShotPrompt:
+    """
+    Prompt split into a static prefix, retrieved example sections and a dynamic suffix.
+
+    The prefix is rendered once at import and always sent first and byte-identical, so
+    provider-side prompt caching can hit. Each section only contributes the k records
+    nearest to the current input and session state, followed by the per-call suffix.
+    """
+
+    def __init__(self, name, prefix, sections, suffix, query_keys=("input",), state_keys=()):
+        self.name = name
+        self.prefix = PromptTemplate.from_template(prefix).format()
+        self.sections = list(sections)
+        self.suffix = PromptTemplate.from_template(suffix)
+        self.query_keys = query_keys
+        self.state_keys = state_keys
+        self.prefix_tokens = count_tokens(self.prefix)
+        self.stats = {"calls": 0, "tokens_before": 0, "tokens_after": 0}
+        self._counted_sizes = None
+        self._all_examples_tokens = 0
+
+    def all_examples_tokens(self):
+        return sum(count_tokens(section.render(range(len(section.store)))) for section in self.sections)
+
+    def format(self, inputs):
+        query = " ".join(str(inputs.get(key, "")) for key in self.query_keys)
+        state = " ".join(f"{key.replace('_', ' ')} {inputs[key]}" for key in self.state_keys if inputs.get(key))
+        examples = "\n\n".join(section.render(section.select(query, state)) for section in self.sections)
+        suffix = self.suffix.format(**{v: inputs.get(v, "none") for v in self.suffix.input_variables})
+        text = f"{self.prefix}\n{examples}\n\n{suffix}"
+
+        # Full-corpus token count is only recomputed when a store grows
+        sizes = [len(section.store) for section in self.sections]
+        if sizes != self._counted_sizes:
+            self._counted_sizes = sizes
+            self._all_examples_tokens = self.all_examples_tokens()
+        suffix_tokens = count_tokens(suffix)
+        before = self.prefix_tokens + self._all_examples_tokens + suffix_tokens
+        after = self.prefix_tokens + count_tokens(examples) + suffix_tokens
+        self.stats["calls"] += 1
+        self.stats["tokens_before"] += before
+        self.stats["tokens_after"] += after
+        print(f"[Prompt Tokens] {self.name}: {before} -> {after} (static prefix {self.prefix_tokens})")
+        return text
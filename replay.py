@@ -0,0 +1,392 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+RECORDINGS_DIR = os.path.join(os.getcwd(), "recordings")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def prompt_hash(messages):
+    return _digest(json.dumps([message_to_dict(m) for m in messages], sort_keys=True).encode("utf-8"))[:16]
+
+
+def _label(tags, prefix):
+    return next((t[len(prefix):] for t in tags or [] if t.startswith(prefix)), "unknown")
+
+
+class Recorder:
+    """
+    Captures a session as events.jsonl under recordings/<session>/: every turn input,
+    every LLM call's rendered messages and response, and
+    every Stability request and response. Image bytes go to recordings/blobs/ keyed
+    by sha256, so a mask or init image sent a hundred times is stored once.
+    """
+
+    def __init__(self, session, root=None):
+        self.root = root or RECORDINGS_DIR
+        self.session_dir = os.path.join(self.root, str(session))
+        self.blob_dir = os.path.join(self.root, "blobs")
+        os.makedirs(self.session_dir, exist_ok=True)
+        self.path = os.path.join(self.session_dir, "events.jsonl")
+        self.started = time.monotonic()
+        self.turn = 0
+        self._lock = threading.Lock()
+        self._runs = {}
+
+    def blob(self, data):
+        digest = _digest(data)
+        path = os.path.join(self.blob_dir, digest[:2], digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def event(self, kind, **fields):
+        record = {"type": kind, "turn": self.turn, "t": round(time.monotonic() - self.started, 4), **fields}
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def wrap_input(self, input_fn):
+        def recorded_input(prompt=""):
+            answer = input_fn(prompt)
+            self.turn += 1
+            self.event("input", prompt=prompt.strip(), answer=answer)
+            return answer
+        return recorded_input
+
+    # ------------------ LLM calls (callback) ------------------
+    def llm_start(self, run_id, messages, tags):
+        self._runs[run_id] = (time.monotonic(), [message_to_dict(m) for m in messages], tags)
+
+    def llm_end(self, run_id, response, error=None):
+        started = self._runs.pop(run_id, None)
+        if started is None:
+            return
+        start, messages, tags = started
+        generation = response.generations[0][0] if response is not None and response.generations else None
+        message = getattr(generation, "message", None) or AIMessage(content=getattr(generation, "text", ""))
+        self.event(
+            "llm",
+            chain=_label(tags, "chain:"),
+            backend=_label(tags, "backend:"),
+            prompt_hash=_digest(json.dumps(messages, sort_keys=True).encode("utf-8"))[:16],
+            messages=messages,
+            response=message_to_dict(message) if error is None else None,
+            token_usage=((response.llm_output or {}).get("token_usage") if response is not None else None),
+            error=str(error) if error is not None else None,
+            latency_s=round(time.monotonic() - start, 4),
+        )
+
+    # ------------------ Stability calls ------------------
+    def tool(self, url, fields, files, response, latency_s):
+        self.event(
+            "tool",
+            endpoint=urlsplit(url).path,
+            fields={k: str(v) for k, v in (fields or {}).items() if v is not None},
+            files={name: {"filename": spec[0], "blob": self.blob(bytes(spec[1]))} for name, spec in (files or {}).items()},
+            status=getattr(response, "status_code", None),
+            headers={"Content-Type": response.headers.get("Content-Type", "")} if response is not None else {},
+            body=self.blob(response.content) if response is not None else None,
+            error=None if response is not None else "request failed",
+            latency_s=round(latency_s, 4),
+        )
+
+
+recorder = None
+
+
+def start_recording(session, root=None):
+    global recorder
+    recorder = Recorder(session, root)
+    print(f"⏺️  Recording session to {recorder.session_dir}")
+    return recorder
+
+
+def record_tool(url, fields, files, response, latency_s):
+    if recorder is not None:
+        recorder.tool(url, fields, files, response, latency_s)
+
+
+class LLMRecorderCallback(BaseCallbackHandler):
+    """
+    Attached to every routed model (llm_backends.get_llm); a no-op unless recording.
+    """
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        if recorder is not None:
+            recorder.llm_start(run_id, messages[0], tags)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if recorder is not None:
+            recorder.llm_end(run_id, response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if recorder is not None:
+            recorder.llm_end(run_id, None, error)
+
+
+llm_recorder = LLMRecorderCallback()
+
+
+# ------------------ Replay ------------------
+class Recording:
+    """
+    A recorded session, served back in order. LLM responses are matched by chain and
+    exact prompt first, then by chain in recorded order, so a replay still runs after
+    a prompt change; tool responses by endpoint in recorded order.
+    """
+
+    def __init__(self, session_dir, latency_scale=1.0):
+        self.session_dir = session_dir
+        self.blob_dir = os.path.join(os.path.dirname(os.path.abspath(session_dir)), "blobs")
+        self.latency_scale = latency_scale
+        self.seed = None
+        self.turn = 0
+        self.inputs = deque()
+        self.llm = {}
+        self.tools = {}
+        self.stats = {"llm_exact": 0, "llm_in_order": 0, "llm_missing": 0, "tool_replayed": 0, "tool_missing": 0}
+        self._lock = threading.Lock()
+        with open(os.path.join(session_dir, "events.jsonl"), "r") as f:
+            for line in f:
+                event = json.loads(line)
+                if event["type"] == "session":
+                    self.seed = event.get("seed")
+                elif event["type"] == "input":
+                    self.inputs.append(event)
+                elif event["type"] == "llm" and event.get("response") is not None:
+                    self.llm.setdefault(event["chain"], []).append(event)
+                elif event["type"] == "tool":
+                    self.tools.setdefault(event["endpoint"], deque()).append(event)
+
+    def read_blob(self, digest):
+        with open(os.path.join(self.blob_dir, digest[:2], digest), "rb") as f:
+            return f.read()
+
+    def wait(self, latency_s):
+        if latency_s and self.latency_scale > 0:
+            time.sleep(latency_s * self.latency_scale)
+
+    def next_input(self, prompt=""):
+        """
+        The next recorded turn input; "done" once the recording runs out.
+        """
+        print(prompt, end="")
+        with self._lock:
+            self.turn += 1
+            event = self.inputs.popleft() if self.inputs else {"answer": "done"}
+        print(event["answer"])
+        return event["answer"]
+
+    def next_llm(self, chain, messages_hash):
+        with self._lock:
+            events = self.llm.get(chain) or []
+            for i, event in enumerate(events):
+                if event["prompt_hash"] == messages_hash:
+                    self.stats["llm_exact"] += 1
+                    return events.pop(i)
+            if events:
+                self.stats["llm_in_order"] += 1
+                return events.pop(0)
+            self.stats["llm_missing"] += 1
+            return None
+
+    def next_tool(self, endpoint):
+        with self._lock:
+            queue = self.tools.get(endpoint)
+            if not queue:
+                self.stats["tool_missing"] += 1
+                return None
+            self.stats["tool_replayed"] += 1
+            return queue.popleft()
+
+
+playback = None
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Stands in for a backend model: answers from the active Recording after sleeping
+    the recorded latency (times the replay's latency scale).
+    """
+
+    backend: str = "unknown"
+
+    @property
+    def _llm_type(self):
+        return "replay"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        chain = _label(getattr(run_manager, "tags", None), "chain:")
+        event = playback.next_llm(chain, prompt_hash(messages)) if playback is not None else None
+        if event is None:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=""))])
+        playback.wait(event.get("latency_s"))
+        message = messages_from_dict([event["response"]])[0]
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": event.get("token_usage") or {}})
+
+
+def _replay_adapter():
+    import requests
+    from requests.adapters import BaseAdapter
+
+    class ReplayAdapter(BaseAdapter):
+        """
+        Fake transport for stability_client.session: recorded status and body per endpoint.
+        """
+
+        def send(self, request, **kwargs):
+            response = requests.models.Response()
+            response.request = request
+            response.url = request.url
+            event = None if request.method == "HEAD" else playback.next_tool(urlsplit(request.url).path)
+            if event is None:
+                response.status_code = 200 if request.method == "HEAD" else 599
+                response._content = b"" if request.method == "HEAD" else b'{"errors": ["no recorded response"]}'
+                return response
+            playback.wait(event.get("latency_s"))
+            if event.get("error"):
+                raise requests.ConnectionError(f"Recorded failure: {event['error']}", request=request)
+            response.status_code = event["status"]
+            response.headers.update(event.get("headers") or {})
+            response._content = playback.read_blob(event["body"]) if event.get("body") else b""
+            return response
+
+        def close(self):
+            pass
+
+    return ReplayAdapter()
+
+
+def install(recording):
+    """
+    Route every LLM backend and the Stability session to the recording. Must run
+    before image_agent is imported: its chains bind their models at import time.
+    """
+    global playback
+    import llm_backends
+    import stability_client
+
+    playback = recording
+    for backend in ["strong", "small", "local"]:
+        llm_backends._models[backend] = ReplayChatModel(backend=backend)
+    adapter = _replay_adapter()
+    stability_client.session.mount("https://", adapter)
+    stability_client.session.mount("http://", adapter)
+
+
+def isolate(image_agent, root):
+    """
+    Point the near-duplicate index, artifact store, suggestion cache, design history,
+    previews and job journal at an empty root, so a replay neither hits outputs or
+    batch jobs of live sessions (or of earlier replays) nor leaves files behind, and
+    runs before and after a change start from the same state.
+    """
+    import artifact_store
+    import design_history
+    import image_previews
+    import job_queue
+    import phash_index
+    from suggestion_cache import SuggestionCache
+
+    design_history.HISTORY_DIR = os.path.join(root, "history")
+    image_previews.PREVIEW_DIR = os.path.join(root, "preview")
+    if job_queue._queue is None:
+        job_queue._queue = job_queue.JobQueue(workers=int(os.getenv("IMAGE_JOB_WORKERS", "2")),
+                                              journal_path=os.path.join(root, "jobs", "batch_jobs.jsonl"), restore=False)
+    image_agent.artifacts = artifact_store.get_store()
+    image_agent.near_duplicate_index = phash_index.PerceptualIndex(os.path.join(root, "phash_index.jsonl"))
+    image_agent.suggestions = SuggestionCache(os.path.join(root, "suggestions.json"))
+
+
+def replay(session_dirs, latency_scale=1.0):
+    """
+    Drive recorded sessions through the full pipeline (planning, agent, reflection,
+    tools, post-processing) with recorded upstream latency, on a throwaway root (see
+    isolate) and with retention off. Returns per-turn seconds.
+    """
+    import shutil
+    import tempfile
+
+    os.environ["RETENTION"] = "0"
+    recording = Recording(session_dirs[0], latency_scale)
+    install(recording)
+    root = tempfile.mkdtemp(prefix="replay_")
+    import artifact_store
+    # Set before the import: image_agent opens the shared store at import time
+    artifact_store._store = artifact_store.ArtifactStore(os.path.join(root, "artifacts"))
+    import image_agent
+    import image_registry
+    import job_queue
+    import retention
+
+    isolate(image_agent, root)
+    try:
+        return _replay_sessions(image_agent, recording, session_dirs, latency_scale)
+    finally:
+        if retention._manager is not None:
+            retention._manager.stop()
+        if job_queue._queue is not None:
+            job_queue._queue.shutdown()
+        image_registry.registry.flush()
+        artifact_store.get_store().close()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _replay_sessions(image_agent, recording, session_dirs, latency_scale):
+    turn_seconds = []
+    for session_dir in session_dirs:
+        recording.__init__(session_dir, latency_scale)
+        last = [None]
+
+        def timed_input(prompt=""):
+            if last[0] is not None:
+                turn_seconds.append(time.perf_counter() - last[0])
+            last[0] = time.perf_counter()
+            return recording.next_input(prompt)
+
+        image_agent.run_agent_par_with_auto_retry(input_fn=timed_input, seed=recording.seed)
+        print(f"[Replay {session_dir}]: {recording.stats}")
+    return turn_seconds
+
+
+if __name__ == "__main__":
+    import sys
+
+    # python replay.py [--latency-scale 0.5] [--out result.json] recordings/<session> [...]
+    args = sys.argv[1:]
+    options = {}
+    while args and args[0].startswith("--"):
+        options[args[0]] = args[1]
+        args = args[2:]
+    if not args:
+        print("Usage: python replay.py [--latency-scale S] [--out result.json] <recording dir> [...]")
+        sys.exit(1)
+    start = time.perf_counter()
+    seconds = sorted(replay(args, latency_scale=float(options.get("--latency-scale", "1.0"))))
+    elapsed = time.perf_counter() - start
+    result = {"sessions": len(args), "turns": len(seconds), "wall_s": round(elapsed, 3)}
+    if seconds:
+        result.update({"turn_p50_s": round(seconds[len(seconds) // 2], 3),
+                       "turn_p95_s": round(seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))], 3),
+                       "turn_mean_s": round(sum(seconds) / len(seconds), 3)})
+    print(json.dumps(result, indent=2))
+    if "--out" in options:
+        with open(options["--out"], "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,327 @@
+import glob
+import json
+import os
+import threading
+import time
+import zipfile
+
+import artifact_store
+import design_history
+import image_previews
+import image_registry
+import job_queue
+
+# Artifact kinds derived from another output of the same session and turn
+DERIVED_KINDS = {"tile"} | {f"preview_{tier}" for tier in image_previews.PREVIEW_TIERS}
+
+
+def _sidecars(path, session):
+    """
+    Files derived from an output: print panels next to it, and previews written to
+    preview/<session>/ (older outputs; newer previews are store artifacts).
+    """
+    root, _ = os.path.splitext(path)
+    stem = os.path.basename(root)
+    found = glob.glob(f"{glob.escape(root)}_*")
+    preview_root = os.path.join(image_previews.PREVIEW_DIR, str(session))
+    found += glob.glob(os.path.join(glob.escape(preview_root), f"{glob.escape(stem)}_*"))
+    return found
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class RetentionManager:
+    """
+    Background clean-up of generated artifacts. An artifact is kept when a live
+    session references it (current image or any design-history node), when a
+    not-yet-archived session's saved history does (undo/goto must keep working until
+    the session is archived), when it is one of a tenant's `keep_recent` newest
+    outputs, or when it is younger than `min_age_s`;
+    other outputs (retries, superseded turns) are deleted with their previews and
+    print files. Sessions idle for `archive_after_s` are zipped to archive/ and removed
+    from the store, and each tenant is held under `tenant_quota_bytes`.
+
+    The work is done in small batches that wait while a turn is running or image
+    jobs are queued, so it never competes with the generation hot path.
+    """
+
+    def __init__(self, store=None, history_dir=None, archive_dir=None, interval_s=600.0, keep_recent=200,
+                 min_age_s=3600.0, archive_after_s=7 * 86400.0, tenant_quota_bytes=0,
+                 batch=50, page=2000, pause_s=0.05):
+        self.store = store or artifact_store.get_store()
+        self.history_dir = history_dir or design_history.HISTORY_DIR
+        self.archive_dir = archive_dir or os.path.join(os.getcwd(), "archive")
+        self.interval_s = interval_s
+        self.keep_recent = keep_recent
+        self.min_age_s = min_age_s
+        self.archive_after_s = archive_after_s
+        self.tenant_quota_bytes = tenant_quota_bytes
+        self.batch = batch
+        self.page = page
+        self.pause_s = pause_s
+        self._tracked = {}
+        self._busy = False
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"passes": 0, "deleted": 0, "deleted_bytes": 0, "archived_sessions": 0, "over_quota": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            interval_s=float(os.getenv("RETENTION_INTERVAL_S", "600")),
+            keep_recent=int(os.getenv("RETENTION_KEEP_RECENT", "200")),
+            min_age_s=float(os.getenv("RETENTION_MIN_AGE_S", "3600")),
+            archive_after_s=float(os.getenv("RETENTION_ARCHIVE_AFTER_DAYS", "7")) * 86400,
+            tenant_quota_bytes=int(float(os.getenv("RETENTION_TENANT_QUOTA_MB", "0")) * 1e6)
+        )
+
+    # ------------------ Hot-path coordination ------------------
+    def track(self, session_id, session_state, history=None):
+        """
+        Register an in-process session: its current image and history stay protected.
+        """
+        self._tracked[str(session_id)] = (session_state, history)
+
+    def untrack(self, session_id):
+        self._tracked.pop(str(session_id), None)
+
+    def turn_started(self):
+        with self._cond:
+            self._busy = True
+
+    def turn_finished(self):
+        with self._cond:
+            self._busy = False
+            self._cond.notify_all()
+
+    def _yield(self):
+        """
+        Between batches: wait until no turn is running and the job queue is empty.
+        """
+        time.sleep(self.pause_s)
+        with self._cond:
+            while not self._stop.is_set() and (self._busy or job_queue.pending_jobs()):
+                self._cond.wait(1.0)
+        return not self._stop.is_set()
+
+    # ------------------ Policy ------------------
+    def _history_images(self, session):
+        path = os.path.join(self.history_dir, f"{session}.json")
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        nodes = data.get("nodes", {}) if isinstance(data, dict) else {}
+        return {node.get("image_path") for node in nodes.values() if node.get("image_path")}
+
+    def live_references(self):
+        """
+        Images the tracked sessions point at right now (current image and history nodes).
+        """
+        keep = set()
+        for session, (state, history) in list(self._tracked.items()):
+            if state.get("last_image_url"):
+                keep.add(state.get("last_image_url"))
+            if history is not None:
+                keep.update(node.get("image_path") for node in list(history.nodes.values()) if node.get("image_path"))
+        return keep
+
+    def protected(self, entries, now):
+        keep = self.live_references()
+        newest = {}
+        for path, session, turn, kind, tenant, created in reversed(entries):  # newest first
+            if now - created < self.min_age_s:
+                keep.add(path)
+            kept = newest.setdefault(tenant, 0)
+            if kept < self.keep_recent:
+                keep.add(path)
+                newest[tenant] = kept + 1
+        # Every session still in the store is not archived yet: its history stays navigable
+        for session in {r[1] for r in entries}:
+            keep.update(self._history_images(session))
+        # Derived files (print tiles, previews) are kept as long as an output of their session and turn
+        kept_turns = {(r[1], r[2]) for r in entries if r[0] in keep and r[3] not in DERIVED_KINDS}
+        keep.update(r[0] for r in entries if r[3] in DERIVED_KINDS and (r[1], r[2]) in kept_turns)
+        return keep
+
+    def _delete(self, path, session):
+        image_registry.registry.invalidate(path)
+        freed = 0
+        for victim in [path] + _sidecars(path, session):
+            size = _size(victim)
+            try:
+                os.remove(victim)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def _delete_batch(self, rows):
+        # Re-checked at delete time: a turn since the scan may have made an old output
+        # current again (a fallback image, undo or goto)
+        live = self.live_references()
+        removed = []
+        for row in rows:
+            if row[0] in live:
+                continue
+            self.stats["deleted_bytes"] += self._delete(row[0], row[1])
+            removed.append(row[0])
+        self.store.remove(removed)
+        self.stats["deleted"] += len(removed)
+        return removed
+
+    def archive_session(self, session, tenant=None):
+        """
+        Zip a session's outputs, previews and history into archive/<tenant>/<session>.zip,
+        then remove them from the store.
+        """
+        rows = self.store.entries(session)
+        history_path = os.path.join(self.history_dir, f"{session}.json")
+        zip_path = os.path.join(self.archive_dir, str(tenant or "default"), f"{session}.zip")
+        os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+        tmp_path = zip_path + ".tmp"
+        # PNGs are already compressed: store them, deflate only the JSON
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+            for path, *_ in rows:
+                for member in [path] + _sidecars(path, session):
+                    if os.path.isfile(member):
+                        archive.write(member, os.path.basename(member))
+            if os.path.isfile(history_path):
+                archive.write(history_path, "history.json", compress_type=zipfile.ZIP_DEFLATED)
+        os.replace(tmp_path, zip_path)
+        for start in range(0, len(rows), self.batch):
+            self._delete_batch(rows[start:start + self.batch])
+        if os.path.isfile(history_path):
+            os.remove(history_path)
+        self.stats["archived_sessions"] += 1
+        return zip_path
+
+    def _scan(self):
+        """
+        Every index row, read a page at a time and only while no turn is running.
+        None if stopped midway.
+        """
+        rows, after = [], None
+        while True:
+            if not self._yield():
+                return None
+            page = self.store.entries(after=after, limit=self.page)
+            rows += page
+            if len(page) < self.page:
+                return rows
+            after = (page[-1][5], page[-1][0])
+
+    def _idle_sessions(self, now):
+        """
+        {session: tenant} of untracked sessions idle for archive_after_s. None if stopped midway.
+        """
+        idle, after = {}, None
+        while True:
+            if not self._yield():
+                return None
+            page = self.store.sessions(after=after, limit=self.page)
+            for session, (tenant, last_created) in page.items():
+                if session not in self._tracked and now - last_created > self.archive_after_s:
+                    idle[session] = tenant
+            if len(page) < self.page:
+                return idle
+            after = max(page)
+
+    def run_once(self):
+        """
+        One retention pass: archive idle sessions, delete unreferenced outputs,
+        then enforce tenant quotas. Returns False if stopped midway.
+        """
+        now = time.time()
+        idle = self._idle_sessions(now)
+        if idle is None:
+            return False
+        for session, tenant in idle.items():
+            if not self._yield():
+                return False
+            if session not in self._tracked:
+                print(f"🗄️  Archived idle session {session} -> {self.archive_session(session, tenant)}")
+
+        entries = self._scan()
+        if entries is None:
+            return False
+        keep = self.protected(entries, now)
+        doomed = [row for row in entries if row[0] not in keep]
+        for start in range(0, len(doomed), self.batch):
+            if not self._yield():
+                return False
+            self._delete_batch(doomed[start:start + self.batch])
+
+        if self.tenant_quota_bytes > 0:
+            usage = {}
+            remaining = [row for row in entries if row[0] in keep]
+            for index, row in enumerate(remaining):
+                if index % self.batch == 0 and not self._yield():
+                    return False
+                usage[row[4]] = usage.get(row[4], 0) + _size(row[0])
+            for tenant, used in usage.items():
+                if used <= self.tenant_quota_bytes:
+                    continue
+                self.stats["over_quota"] += 1
+                # Over quota only live references and in-flight outputs are spared
+                tracked_images = self.protected([r for r in remaining if now - r[5] < self.min_age_s], now)
+                for row in [r for r in remaining if r[4] == tenant and r[0] not in tracked_images]:  # oldest first
+                    if used <= self.tenant_quota_bytes:
+                        break
+                    if not self._yield():
+                        return False
+                    size = _size(row[0])
+                    if self._delete_batch([row]):
+                        used -= size
+                if used > self.tenant_quota_bytes:
+                    print(f"⚠️  Tenant {tenant} is over its quota ({used / 1e6:.1f} MB) with only live images left.")
+        self.stats["passes"] += 1
+        return True
+
+    # ------------------ Background thread ------------------
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️  Retention pass failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def summary(self):
+        return f"{self.stats}, {len(self._tracked)} live sessions tracked"
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = RetentionManager.from_env()
+        return _manager
+
+
+if __name__ == "__main__":
+    # python retention.py: one pass now (e.g. from cron when the agent is not running)
+    manager = get_manager()
+    manager.run_once()
+    print(manager.summary())
@@ -0,0 +1,95 @@
+import json
+from collections.abc import MutableMapping
+
+# Every field the agent keeps between turns, in prompt order
+FIELDS = (
+    "last_intent",
+    "last_image_url",
+    "last_prompt",
+    "last_pattern",
+    "last_color",
+    "last_style",
+    "last_object_name",
+    "last_request",
+    "last_part",
+)
+
+
+class SessionState(MutableMapping):
+    """
+    Fixed-field session state with dict-style access (state["last_color"], .get,
+    dict(state)). Unset fields are None and left out of iteration and rendering.
+    Every change bumps a version, so the compact prompt rendering is rebuilt only
+    after a field actually changed, and dirty_fields() tells what changed since
+    the last clear_dirty().
+    """
+
+    __slots__ = FIELDS + ("_version", "_dirty", "_rendered", "_rendered_version")
+
+    def __init__(self, values=None, **kwargs):
+        for name in FIELDS:
+            setattr(self, name, None)
+        self._version = 0
+        self._dirty = set()
+        self._rendered = None
+        self._rendered_version = -1
+        self.update(values or {}, **kwargs)
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in FIELDS:
+            raise KeyError(f"Unknown session state field '{key}'. Fields: {', '.join(FIELDS)}")
+        if getattr(self, key) != value:
+            setattr(self, key, value)
+            self._version += 1
+            self._dirty.add(key)
+
+    def __delitem__(self, key):
+        self[key]  # KeyError if unset
+        self[key] = None
+
+    def __iter__(self):
+        return (name for name in FIELDS if getattr(self, name) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return key in FIELDS and getattr(self, key) is not None
+
+    def clear(self):
+        for name in FIELDS:
+            self[name] = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def dirty_fields(self):
+        return set(self._dirty)
+
+    def clear_dirty(self):
+        self._dirty.clear()
+
+    def compact(self):
+        """
+        Minimal JSON of the set fields (no indentation, no nulls), cached per version.
+        """
+        if self._rendered_version != self._version:
+            self._rendered = json.dumps({name: getattr(self, name) for name in self}, separators=(",", ":"), default=str)
+            self._rendered_version = self._version
+        return self._rendered
+
+    def __str__(self):
+        # Prompt templates format their inputs with str(): they get the compact form
+        return self.compact()
+
+    def __repr__(self):
+        return f"SessionState({self.compact()})"
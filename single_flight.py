@@ -0,0 +1,98 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs the call,
+    callers arriving while it is in flight wait for and share its result (or error).
+    Nothing is cached after the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.stats = {"calls": 0, "executed": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self.stats["executed"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result(timeout)
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self.stats["errors"] += 1
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+        future.set_result(result)
+        return result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+
+def request_key(url, headers=None, fields=None, file_digests=None):
+    """
+    Identity of an API request: endpoint, credentials, parameters and input content hashes.
+    """
+    payload = json.dumps({
+        "url": url,
+        "auth": hashlib.sha256(str((headers or {}).get("Authorization", "")).encode()).hexdigest(),
+        "fields": {k: str(v) for k, v in (fields or {}).items() if v is not None},
+        "files": file_digests or {},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ------------------ Benchmark ------------------
+def benchmark(requests=400, distinct=20, concurrency=32, latency_s=0.05, seed=0):
+    """
+    Duplicate-heavy synthetic load: `requests` calls drawn from `distinct` parameter
+    sets, issued by `concurrency` threads against a fake endpoint.
+    """
+    rng = random.Random(seed)
+    flight = SingleFlight()
+    upstream = {"calls": 0}
+    lock = threading.Lock()
+
+    def fake_endpoint(params):
+        with lock:
+            upstream["calls"] += 1
+        time.sleep(latency_s)
+        return f"image-for-{params}"
+
+    def client(params):
+        key = request_key("https://api.stability.ai/v2beta/stable-image/generate/core", fields=params)
+        return flight.do(key, lambda: fake_endpoint(params))
+
+    workload = [{"prompt": f"red flames {rng.randrange(distinct)}", "seed": 42} for _ in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(client, workload))
+    elapsed = time.perf_counter() - start
+    assert all(r == f"image-for-{p}" for r, p in zip(results, workload))
+    print(f"{requests} requests ({distinct} distinct, {concurrency} concurrent): {upstream['calls']} upstream calls, "
+          f"{flight.stats['coalesced']} coalesced ({flight.stats['coalesced'] / requests:.0%}), {elapsed:.2f}s")
+    return flight.stats
+
+
+if __name__ == "__main__":
+    benchmark()
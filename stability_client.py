@@ -0,0 +1,75 @@
+import os
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import multipart
+import replay
+from circuit_breaker import breaker_for
+from single_flight import SingleFlight, request_key
+
+STABILITY_HOST = "https://api.stability.ai"
+
+# One pooled, keep-alive session shared by all Stability tools
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Identical concurrent requests (same endpoint, params and input bytes) share one call
+in_flight = SingleFlight()
+metrics.stats_counter("stability_coalesced_calls_total", "Stability calls by single-flight outcome", in_flight.stats)
+metrics.stats_counter("multipart_builder_total", "Multipart builder part cache and byte counters", multipart.builder.stats, label="stat")
+
+# (connect, read) seconds; a hung upstream must not hold a job worker forever
+DEFAULT_TIMEOUT = (float(os.getenv("STABILITY_CONNECT_TIMEOUT_S", "5")), float(os.getenv("STABILITY_READ_TIMEOUT_S", "120")))
+
+
+def _upstream_failed(response):
+    # Server errors and rate limiting mean the endpoint is degraded; other 4xx are our request
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def post(url, **kwargs):
+    return session.post(url, **kwargs)
+
+
+def post_multipart(url, headers=None, fields=None, files=None, timeout=None):
+    """
+    POST a multipart/form-data body built from cached parts (see multipart.MultipartBuilder).
+    files: {name: (filename, bytes[, content_type])}.
+    Each endpoint has a circuit breaker; raises circuit_breaker.CircuitOpen without
+    calling the API while that endpoint is failing.
+    """
+    timeout = timeout or DEFAULT_TIMEOUT
+    endpoint = urlsplit(url).path
+    breaker = breaker_for(f"stability:{endpoint}")
+    digests = {name: multipart.builder.content_digest(spec[1]) for name, spec in (files or {}).items()}
+    key = request_key(url, headers, fields, digests)
+
+    def call():
+        body = multipart.builder.build(fields, files)
+        start = time.perf_counter()
+        try:
+            response = session.post(url, headers={**(headers or {}), "Content-Type": body.content_type}, data=body, timeout=timeout)
+            response.content  # read the body once so every waiter can use it
+        except requests.RequestException:
+            metrics.stability_seconds.observe(endpoint, "error", value=time.perf_counter() - start)
+            replay.record_tool(url, fields, files, None, time.perf_counter() - start)
+            raise
+        metrics.stability_seconds.observe(endpoint, response.status_code, value=time.perf_counter() - start)
+        replay.record_tool(url, fields, files, response, time.perf_counter() - start)
+        return response
+
+    wait_s = sum(timeout) if isinstance(timeout, tuple) else timeout
+    return in_flight.do(key, lambda: breaker.call(call, is_failure=_upstream_failed), timeout=wait_s)
+
+
+def warm(timeout=5):
+    """
+    Open (DNS + TCP + TLS) a pooled connection to the Stability API ahead of the first call.
+    """
+    response = session.head(STABILITY_HOST, timeout=timeout)
+    response.close()
+    return response.status_code
@@ -0,0 +1,205 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Coarse buckets for the session-state signature. Suggestions only need the broad
+# direction of the design, so exact colors/patterns share one cache entry.
+PATTERN_BUCKETS = {
+    "flames": ["flame", "fire", "blaze", "inferno"],
+    "geometric": ["geometric", "line", "stripe", "hexagon", "triangle", "grid", "polygon", "chevron"],
+    "floral": ["floral", "flower", "rose", "leaf", "leaves", "vine", "botanical"],
+    "camo": ["camo", "camouflage"],
+    "animal": ["dragon", "tiger", "wolf", "eagle", "snake", "animal", "lion"],
+    "abstract": ["abstract", "wave", "swirl", "splash", "gradient", "fluid"],
+    "tech": ["circuit", "cyber", "digital", "neon", "tech", "matrix"],
+    "solid": ["solid", "plain", "matte", "gloss", "metallic", "chrome", "none"],
+}
+
+COLOR_BUCKETS = {
+    "red": ["red", "crimson", "scarlet", "maroon", "burgundy", "ruby"],
+    "orange": ["orange", "amber", "copper", "bronze"],
+    "yellow": ["yellow", "gold", "mustard", "lemon"],
+    "green": ["green", "emerald", "olive", "lime", "mint", "teal"],
+    "blue": ["blue", "navy", "cyan", "turquoise", "azure", "cobalt", "sky"],
+    "purple": ["purple", "violet", "magenta", "lavender", "pink"],
+    "black": ["black", "charcoal", "dark"],
+    "white": ["white", "silver", "grey", "gray", "pearl"],
+    "multi": ["rainbow", "multi", "colorful", "pastel"],
+}
+
+STYLE_BUCKETS = {
+    "realistic": ["photographic", "cinematic", "analog-film", "enhance"],
+    "illustrated": ["anime", "comic-book", "fantasy-art", "digital-art", "line-art"],
+    "3d": ["3d-model", "isometric", "low-poly", "origami", "modeling-compound", "tile-texture"],
+    "retro": ["pixel-art", "neon-punk"],
+}
+
+GUIDANCE_INTENTS = ["initial", "replace", "adjust", "edit"]
+
+
+def _bucket(value, buckets):
+    text = str(value or "").strip().lower()
+    if not text or text in ["unknown", "null", "none", "use last"]:
+        return "none"
+    for name, words in buckets.items():
+        if any(word in text for word in words):
+            return name
+    return "other"
+
+
+def signature(last_intent, state):
+    """
+    Cache key for guidance: last intent plus pattern/color/style buckets of the session state.
+    """
+    return "|".join([
+        str(last_intent or "unknown").lower(),
+        _bucket(state.get("last_pattern"), PATTERN_BUCKETS),
+        _bucket(state.get("last_color"), COLOR_BUCKETS),
+        _bucket(state.get("last_style"), STYLE_BUCKETS),
+    ])
+
+
+def representative_state(key):
+    """
+    Inverse of signature(): a concrete session state for offline generation of a key.
+    """
+    intent, pattern, color, style = key.split("|")
+    pick = lambda buckets, name: buckets[name][0] if name in buckets else None
+    return intent, {
+        "last_intent": intent,
+        "last_pattern": pick(PATTERN_BUCKETS, pattern),
+        "last_color": pick(COLOR_BUCKETS, color),
+        "last_style": pick(STYLE_BUCKETS, style),
+        "last_part": None,
+        "last_object_name": None,
+    }
+
+
+def all_guidance_keys():
+    patterns = list(PATTERN_BUCKETS) + ["none"]
+    colors = list(COLOR_BUCKETS) + ["none"]
+    styles = list(STYLE_BUCKETS) + ["none"]
+    return ["|".join(parts) for parts in itertools.product(GUIDANCE_INTENTS, patterns, colors, styles)]
+
+
+class SuggestionCache:
+    """
+    LRU cache of suggestion texts persisted to JSON. Entries older than ttl_s are still
+    served but refreshed in a background thread (stale-while-revalidate).
+    """
+
+    def __init__(self, path=None, capacity=2048, ttl_s=7 * 24 * 3600):
+        self.path = path or os.path.join(os.getcwd(), "cache", "suggestions.json")
+        self.capacity = capacity
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "refreshes": 0}
+        self._lock = threading.RLock()
+        self._refreshing = set()
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suggestion-refresh")
+        self.load()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  Ignoring unreadable suggestion cache {self.path}: {e}")
+            return
+        with self._lock:
+            for key, entry in data.items():
+                self.entries[key] = entry
+            self._evict()
+
+    def save(self):
+        with self._lock:
+            data = dict(self.entries)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _evict(self):
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        (value, is_stale) or (None, False) on a miss.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, False
+            self.entries.move_to_end(key)
+            return entry["value"], time.time() - entry["created_at"] > self.ttl_s
+
+    def put(self, key, value, persist=True):
+        with self._lock:
+            self.entries[key] = {"value": value, "created_at": time.time()}
+            self.entries.move_to_end(key)
+            self._evict()
+        if persist:
+            self.save()
+
+    def _refresh(self, key, compute):
+        try:
+            self.put(key, compute())
+            self.stats["refreshes"] += 1
+        except Exception as e:
+            print(f"⚠️  Suggestion refresh for '{key}' failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_compute(self, key, compute):
+        value, stale = self.get(key)
+        if value is None:
+            self.stats["misses"] += 1
+            value = compute()
+            self.put(key, value)
+            return value
+        if stale:
+            self.stats["stale"] += 1
+            with self._lock:
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._refresher.submit(self._refresh, key, compute)
+        else:
+            self.stats["hits"] += 1
+        return value
+
+    def populate(self, compute_for_key, keys, workers=4, skip_fresh=True):
+        """
+        Offline batch fill: compute_for_key(key) -> value, run concurrently for all keys.
+        """
+        todo = []
+        for key in keys:
+            value, stale = self.get(key)
+            if skip_fresh and value is not None and not stale:
+                continue
+            todo.append(key)
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for key, value in zip(todo, pool.map(lambda k: _safe(compute_for_key, k), todo)):
+                if value is not None:
+                    self.put(key, value, persist=False)
+                    done += 1
+        self.save()
+        print(f"✅ Suggestion cache populated: {done}/{len(todo)} computed, {len(self.entries)} entries in {self.path}")
+        return done
+
+
+def _safe(fn, key):
+    try:
+        return fn(key)
+    except Exception as e:
+        print(f"⚠️  Could not compute suggestions for '{key}': {e}")
+        return None
@@ -0,0 +1,29 @@
+import os
+
+from artifact_store import ArtifactStore
+from image_registry import ImageRegistry
+
+
+def test_reserved_paths_are_indexed_only_once_written(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    registry = ImageRegistry()
+    written = store.allocate("s1", 1, "initial")
+    failed = store.allocate("s1", 2, "initial")
+    assert os.path.dirname(written).startswith(store.root)
+    assert store.lookup("s1") == []
+
+    registry.put(written, b"png")
+    registry.when_written(written, store.commit, on_error=store.discard)
+    registry.flush()
+    store.discard(failed)  # e.g. the image job raised
+    assert store.lookup("s1") == [written]
+    assert store.lookup("s1", turn=2) == []
+    assert store._reserved == {}
+
+
+def test_unwritten_path_is_discarded(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    path = store.allocate("s1", 1, "edit")
+    ImageRegistry().when_written(path, store.commit, on_error=store.discard)
+    assert store.count() == 0
+    assert store._reserved == {}
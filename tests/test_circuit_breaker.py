@@ -0,0 +1,104 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def fail():
+    raise RuntimeError("Request failed: 503")
+
+
+def run(breaker, ok, seconds=0.1):
+    breaker.before_call()
+    breaker.record(ok, seconds)
+
+
+def test_stays_closed_below_min_calls():
+    breaker = CircuitBreaker("test", min_calls=5)
+    for _ in range(4):
+        run(breaker, False)
+    assert breaker.state == "closed"
+
+
+def test_trips_on_error_rate():
+    breaker = CircuitBreaker("test", min_calls=5, error_rate=0.5)
+    for ok in [True, False, True, False, False]:
+        run(breaker, ok)
+    assert breaker.state == "open"
+    assert breaker.stats["trips"] == 1
+
+
+def test_trips_on_slow_rate():
+    breaker = CircuitBreaker("test", min_calls=4, slow_call_s=10.0, slow_rate=0.5)
+    for seconds in [1.0, 12.0, 1.0, 15.0]:
+        run(breaker, True, seconds)
+    assert breaker.state == "open"
+
+
+def test_exceptions_and_failed_results_count_as_failures():
+    breaker = CircuitBreaker("test", min_calls=4)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    for _ in range(2):
+        breaker.call(lambda: 503, is_failure=lambda status: status >= 500)
+    assert breaker.state == "open"
+    assert breaker.stats["failures"] == 4
+
+
+def test_open_rejects_without_calling(clock):
+    breaker = CircuitBreaker("test", min_calls=1, open_s=30.0)
+    run(breaker, False)
+    calls = []
+    with pytest.raises(CircuitOpen) as raised:
+        breaker.call(lambda: calls.append(1))
+    assert calls == []
+    assert raised.value.retry_in == pytest.approx(30.0)
+    assert breaker.stats["rejected"] == 1
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker("test", min_calls=1, open_s=30.0)
+    run(breaker, False)
+    clock.now += 31.0
+    breaker.before_call()  # the probe
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()  # a second caller while the probe is in flight
+
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker("test", min_calls=1, open_s=30.0)
+    run(breaker, False)
+    clock.now += 31.0
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+    assert len(breaker.window) == 0
+    run(breaker, True)
+
+
+@pytest.mark.parametrize("ok, seconds", [(False, 0.1), (True, 60.0)])
+def test_failed_or_slow_probe_reopens(clock, ok, seconds):
+    breaker = CircuitBreaker("test", min_calls=1, open_s=30.0, slow_call_s=30.0)
+    run(breaker, False)
+    clock.now += 31.0
+    run(breaker, ok, seconds)
+    assert breaker.state == "open"
+    assert breaker.stats["trips"] == 2
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
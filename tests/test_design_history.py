@@ -0,0 +1,59 @@
+import pytest
+
+import image_registry
+from design_history import DesignHistory
+
+
+def write_image(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(name.encode())
+    return str(path)
+
+
+@pytest.fixture
+def history(tmp_path):
+    return DesignHistory("s1", base_dir=str(tmp_path / "history"))
+
+
+def record(history, tmp_path, name, prompt="red flames"):
+    path = write_image(tmp_path, name)
+    return history.record("initial", prompt, path, seed=1, state={"last_image_url": path})
+
+
+def test_undo_restores_the_parent_snapshot(history, tmp_path):
+    first = record(history, tmp_path, "a.png")
+    record(history, tmp_path, "b.png")
+    assert history.undo()["last_image_url"].endswith("a.png")
+    assert history.head == first
+    with pytest.raises(KeyError):
+        history.undo()
+
+
+def test_goto_then_record_branches(history, tmp_path):
+    first = record(history, tmp_path, "a.png")
+    second = record(history, tmp_path, "b.png")
+    history.checkout(first)
+    third = record(history, tmp_path, "c.png", prompt="blue waves")
+    assert history.children(first) == [second, third]
+    assert history.lineage() == [first, third]
+
+
+def test_goto_refuses_missing_or_modified_artifacts(history, tmp_path):
+    first = record(history, tmp_path, "a.png")
+    record(history, tmp_path, "b.png")
+    with pytest.raises(KeyError):
+        history.checkout("t99")
+    (tmp_path / "a.png").write_bytes(b"changed")
+    image_registry.registry.invalidate(str(tmp_path / "a.png"))
+    with pytest.raises(ValueError):
+        history.checkout(first)
+
+
+def test_render_and_reload(history, tmp_path):
+    record(history, tmp_path, "a.png")
+    record(history, tmp_path, "b.png", prompt=None)
+    rendered = history.render()
+    assert "t1 [initial] red flames" in rendered
+    assert "* " in rendered
+    reloaded = DesignHistory("s1", base_dir=str(tmp_path / "history"))
+    assert reloaded.head == history.head and reloaded.nodes.keys() == history.nodes.keys()
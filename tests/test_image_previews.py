@@ -0,0 +1,24 @@
+import cv2
+import numpy as np
+
+import image_previews
+import image_registry
+from artifact_store import ArtifactStore
+
+
+def test_previews_of_a_store_artifact_are_store_artifacts(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    output_path = store.allocate("s1", 3, "initial")
+    ok, buf = cv2.imencode(".png", np.zeros((600, 400, 3), np.uint8))
+    image_registry.registry.put(output_path, buf.tobytes())
+    entry = image_previews.write_previews(output_path, "s1", base_dir=str(tmp_path), store=store)
+    assert (entry["medium"]["width"], entry["medium"]["height"]) == (341, 512)
+    assert store.lookup("s1", turn=3, kind="preview_thumb") == [entry["thumb"]["path"]]
+    assert store.lookup("s1", turn=3, kind="preview_medium") == [entry["medium"]["path"]]
+
+
+def test_preview_failure_does_not_raise(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "broken.png")
+    image_registry.registry.put(path, b"not an image", write=False)
+    assert image_previews.try_write_previews(path, "s1") is None
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import image_workers
+from image_workers import ImageWorkerPool
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = ImageWorkerPool(workers=2).start()
+    yield pool
+    pool.shutdown()
+
+
+def test_ops_read_inputs_from_shared_memory(pool):
+    img = np.arange(300 * 200 * 3, dtype=np.uint8).reshape(300, 200, 3)
+    thumb = pool.run("image_workers:thumbnail", img, long_edge=30)
+    assert thumb.shape == (30, 20, 3)
+    np.testing.assert_array_equal(thumb, image_workers.thumbnail(img, 30))
+
+
+def test_op_returning_its_input_view(pool):
+    img = np.full((8, 8), 7, np.uint8)
+    np.testing.assert_array_equal(pool.run("image_workers:thumbnail", img, long_edge=128), img)
+
+
+def test_op_errors_reach_the_caller(pool):
+    with pytest.raises(Exception):
+        pool.run("image_workers:resize", np.zeros((4, 4), np.uint8), (0, -1))
+    assert pool.run("image_workers:resize", np.zeros((4, 4), np.uint8), (2, 2)).shape == (2, 2)
+
+
+def test_print_blend_runs_in_the_pool(pool):
+    import print_pipeline
+
+    rng = np.random.default_rng(0)
+    tile = rng.integers(0, 255, (128, 128, 3), dtype=np.uint8)
+    np.testing.assert_array_equal(pool.run("print_pipeline:blend_edges", tile), print_pipeline.blend_edges(tile))
+
+
+def test_feather_mask_reads_and_writes_in_the_pool(tmp_path):
+    import cv2
+
+    mask = np.zeros((64, 64), np.uint8)
+    mask[28:36, 28:36] = 255
+    mask_path, output_path = str(tmp_path / "mask.png"), str(tmp_path / "mask_feathered.png")
+    cv2.imwrite(mask_path, mask)
+    assert image_workers.feather_mask(mask_path, output_path, target_size=(32, 32), dilation_iterations=1,
+                                      blur_kernel_size=(5, 5), kernel_size=3) == output_path
+    np.testing.assert_array_equal(cv2.imread(output_path, cv2.IMREAD_GRAYSCALE),
+                                  image_workers.feather(mask, (32, 32), 1, (5, 5), 3))
+    with pytest.raises(FileNotFoundError):
+        image_workers.feather_mask(str(tmp_path / "missing.png"), output_path)
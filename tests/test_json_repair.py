@@ -0,0 +1,32 @@
+import pytest
+
+from json_repair import parse_llm_json, repair_json
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"result": "accept"}\n```', {"result": "accept"}),
+    ("Sure, here it is: {'result': 'retry', 'reason': 'wrong part'} Hope this helps.", {"result": "retry", "reason": "wrong part"}),
+    ('{result: clarify, hint: "Which part?",}', {"result": "clarify", "hint": "Which part?"}),
+    ('{"retry": False, "mask": None}', {"retry": False, "mask": None}),
+    ('{"result": "retry"\n"reason": "wrong intent"}', {"result": "retry", "reason": "wrong intent"}),
+    ('{"result": "retry", "reason": "the "hood" was not', {"result": "retry", "reason": 'the "hood" was not'}),
+])
+def test_repairs_common_llm_damage(text, expected):
+    assert parse_llm_json(text) == expected
+
+
+def test_missing_comma_between_strings_on_one_line():
+    # The quote after "accept" is followed by another string: a missing comma, not an inner quote
+    assert parse_llm_json('{"result": "accept" "reason": "matches the plan"}') == {"result": "accept", "reason": "matches the plan"}
+    assert parse_llm_json('["hood" "roof" "left_door"]') == ["hood", "roof", "left_door"]
+
+
+def test_inner_quotes_stay_in_the_string():
+    assert parse_llm_json('{"hint": "Try "sleek lines" in silver"}') == {"hint": 'Try "sleek lines" in silver'}
+
+
+def test_no_json_raises_value_error():
+    with pytest.raises(ValueError):
+        repair_json("I cannot help with that.")
+    with pytest.raises(ValueError):
+        parse_llm_json("I cannot help with that.")
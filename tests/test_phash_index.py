@@ -0,0 +1,54 @@
+from phash_index import PerceptualIndex, prompt_key, prompt_similarity
+
+
+def add(index, tmp_path, name, prompt, style="digital-art", **meta):
+    path = tmp_path / name
+    path.write_bytes(b"png")
+    return index.add(str(path), image_hash=0, prompt_key=prompt_key(prompt), style=style, **meta)
+
+
+def test_reworded_prompt_is_a_near_match(tmp_path):
+    index = PerceptualIndex()
+    add(index, tmp_path, "a.png", "Red flames, bold and aggressive", intent="initial")
+    candidate = index.candidate_for("bold and aggressive red flames", "digital-art", intent="initial")
+    assert candidate["path"].endswith("a.png")
+    assert candidate["similarity"] == 1.0
+
+
+def test_most_similar_prompt_wins_and_style_must_match(tmp_path):
+    index = PerceptualIndex()
+    add(index, tmp_path, "close.png", "red flames with black smoke accents", intent="initial")
+    add(index, tmp_path, "other_style.png", "red flames with black smoke", style="anime", intent="initial")
+    add(index, tmp_path, "far.png", "blue geometric lines", intent="initial")
+    candidate = index.candidate_for("red flames with black smoke", "digital-art", intent="initial")
+    assert candidate["path"].endswith("close.png")
+    assert index.candidate_for("blue waves", "digital-art", intent="initial") is None
+
+
+def test_prompt_similarity():
+    assert prompt_similarity("red flames", "flames red") == 1.0
+    assert prompt_similarity("red flames", "blue lines") == 0.0
+    assert prompt_similarity("", "") == 1.0
+
+
+def test_candidate_lookup_is_sub_millisecond_at_100k_entries(tmp_path):
+    import random
+    import time
+
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(3000)]
+    existing = tmp_path / "existing.png"
+    existing.write_bytes(b"png")
+    index = PerceptualIndex()
+    prompts = []
+    for i in range(100_000):
+        prompt = " ".join(rng.sample(vocabulary, 8))
+        prompts.append(prompt)
+        index._insert({"hash": rng.getrandbits(64), "path": str(existing), "prompt_key": prompt,
+                       "style": rng.choice(["digital-art", "anime", "photographic"]), "intent": "initial", "part": None})
+    queries = [" ".join(rng.sample(p.split(), 7) + ["extra"]) for p in rng.sample(prompts, 500)]
+    start = time.perf_counter()
+    found = sum(1 for q in queries if index.candidate_for(q, "digital-art", intent="initial"))
+    per_lookup = (time.perf_counter() - start) / len(queries)
+    assert found > 0
+    assert per_lookup < 0.001
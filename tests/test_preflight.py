@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+import img2img_tool
+import inpainting_tool
+import multipart
+
+
+def write_png(path, shape):
+    cv2.imwrite(str(path), np.full(shape, 128, np.uint8))
+    return str(path)
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    calls = []
+
+    def post_multipart(url, headers=None, fields=None, files=None, timeout=None):
+        calls.append({"url": url, "fields": fields, "body": b"".join(multipart.builder.build(fields, files).segments)})
+        return SimpleNamespace(status_code=200, content=b"png", text="")
+
+    monkeypatch.setattr("stability_client.post_multipart", post_multipart)
+    monkeypatch.setattr("image_registry.registry.put", lambda path, data, **kwargs: None)
+    return calls
+
+
+def test_img2img_without_style_drops_the_field(tmp_path, sent):
+    init = write_png(tmp_path / "init.png", (256, 256, 3))
+    img2img_tool.generate_img2img_adjust(init, "make it blue", str(tmp_path / "out.png"), "key", style_preset=None, seed=42)
+    assert sent[0]["fields"]["style_preset"] is None
+    assert b'name="style_preset"' not in sent[0]["body"]
+
+
+def test_inpainting_without_style_drops_the_field(tmp_path, sent):
+    init = write_png(tmp_path / "init.png", (256, 256, 3))
+    mask = write_png(tmp_path / "mask.png", (256, 256))
+    inpainting_tool.generate_background_image_inpainting("red hood", "key", str(tmp_path / "out.png"), None, init, mask, seed=42)
+    assert sent[0]["fields"]["style_preset"] is None
+    assert b'name="style_preset"' not in sent[0]["body"]
+
+
+def test_unknown_style_is_rejected_before_the_call(tmp_path, sent):
+    init = write_png(tmp_path / "init.png", (256, 256, 3))
+    with pytest.raises(ValueError, match="Invalid style_preset"):
+        img2img_tool.generate_img2img_adjust(init, "make it blue", str(tmp_path / "out.png"), "key", style_preset="watercolor", seed=42)
+    assert sent == []
@@ -0,0 +1,33 @@
+import os
+
+import cv2
+import numpy as np
+
+import image_registry
+import print_pipeline
+
+
+def test_blended_tile_written_atomically_to_the_given_path(tmp_path):
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 255, (64, 64, 3), dtype=np.uint8)
+    image_path = str(tmp_path / "out.png")
+    cv2.imwrite(image_path, img)
+    tile_path = str(tmp_path / "store" / "s1_1_tile_abcd.png")
+    result = print_pipeline.prepare_for_print(image_path, tile_path=tile_path)
+    image_registry.registry.flush()
+    assert result["tile_path"] == tile_path
+    assert os.path.isfile(tile_path)
+    assert not os.path.exists(str(tmp_path / "out_tile.png"))
+    assert [n for n in os.listdir(tmp_path / "store") if n.endswith(".tmp")] == []
+    assert cv2.imread(tile_path).shape == img.shape
+
+
+def test_panels_are_written_by_the_pool(tmp_path):
+    tile = np.full((32, 32, 3), 90, np.uint8)
+    image_path = str(tmp_path / "flat.png")
+    cv2.imwrite(image_path, tile)
+    result = print_pipeline.prepare_for_print(image_path, output_size=(100, 40), panel_width=60, overlap=10, scale=2)
+    assert result["tile_path"] == image_path  # a flat tile is already seamless
+    assert [os.path.basename(p) for p in result["panels"]] == ["panel_01.png", "panel_02.png"]
+    assert cv2.imread(result["panels"][0]).shape == (40, 60, 3)
+    assert cv2.imread(result["panels"][1]).shape == (40, 50, 3)
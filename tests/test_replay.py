@@ -0,0 +1,87 @@
+import os
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+import design_history
+import image_previews
+import job_queue
+import replay
+from replay import Recorder, Recording, prompt_hash
+
+
+def record_llm(recorder, run_id, chain, messages, answer):
+    recorder.llm_start(run_id, messages, [f"chain:{chain}", "backend:strong"])
+    response = LLMResult(generations=[[ChatGeneration(message=AIMessage(content=answer))]],
+                         llm_output={"token_usage": {"total_tokens": 10}})
+    recorder.llm_end(run_id, response)
+
+
+def record_session(root):
+    """
+    Two turns as the agent loop drives them: a "You:" prompt, the planning call,
+    the agent call and the image request of that turn, then "done".
+    """
+    answers = iter(["red flames", "make it blue", "done"])
+    recorder = Recorder("s1", root=str(root))
+    recorder.event("session", seed=7)
+    read_input = recorder.wrap_input(lambda prompt="": next(answers))
+    body = SimpleNamespace(status_code=200, headers={"Content-Type": "image/png"}, content=b"image-1")
+    for turn, (request, plan) in enumerate([("red flames", "initial"), ("make it blue", "adjust")], start=1):
+        assert read_input("\nYou: ") == request
+        record_llm(recorder, f"plan-{turn}", "planning", [SystemMessage(content="plan"), HumanMessage(content=request)], plan)
+        record_llm(recorder, f"agent-{turn}", "agent", [HumanMessage(content=f"{plan}: {request}")], f"calling {plan}")
+        recorder.tool("https://api.stability.ai/v2beta/stable-image/generate/core", {"prompt": request, "seed": None},
+                      {"image": ("init.png", b"init")} if turn == 2 else None, body, 0.5)
+    assert read_input("\nYou: ") == "done"
+    return recorder.session_dir
+
+
+def test_replays_a_multi_turn_recording(tmp_path):
+    recording = Recording(record_session(tmp_path), latency_scale=0)
+    assert recording.seed == 7
+
+    assert recording.next_input("\nYou: ") == "red flames"
+    planning = recording.next_llm("planning", prompt_hash([SystemMessage(content="plan"), HumanMessage(content="red flames")]))
+    assert planning["response"]["data"]["content"] == "initial"
+    # The agent prompt changed since the recording: served in recorded order instead
+    agent = recording.next_llm("agent", "changed-prompt")
+    assert agent["response"]["data"]["content"] == "calling initial"
+    tool = recording.next_tool("/v2beta/stable-image/generate/core")
+    assert tool["fields"] == {"prompt": "red flames"}
+    assert recording.read_blob(tool["body"]) == b"image-1"
+
+    assert recording.next_input("\nYou: ") == "make it blue"
+    planning = recording.next_llm("planning", prompt_hash([SystemMessage(content="plan"), HumanMessage(content="make it blue")]))
+    assert planning["response"]["data"]["content"] == "adjust"
+    assert recording.next_llm("agent", "changed-prompt")["response"]["data"]["content"] == "calling adjust"
+    tool = recording.next_tool("/v2beta/stable-image/generate/core")
+    assert recording.read_blob(tool["files"]["image"]["blob"]) == b"init"
+
+    assert recording.next_input("\nYou: ") == "done"
+    # Past the end of the recording every turn ends the session
+    assert recording.next_input("\nYou: ") == "done"
+    assert recording.next_llm("agent", "changed-prompt") is None
+    assert recording.next_tool("/v2beta/stable-image/generate/core") is None
+    assert recording.stats == {"llm_exact": 2, "llm_in_order": 2, "llm_missing": 1, "tool_replayed": 2, "tool_missing": 1}
+
+
+def test_isolate_moves_history_previews_and_job_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(design_history, "HISTORY_DIR", design_history.HISTORY_DIR)
+    monkeypatch.setattr(image_previews, "PREVIEW_DIR", image_previews.PREVIEW_DIR)
+    monkeypatch.setattr(job_queue, "_queue", None)
+    monkeypatch.setattr("artifact_store._store", None)
+    monkeypatch.chdir(tmp_path)
+    agent = SimpleNamespace()
+    root = str(tmp_path / "replay")
+
+    replay.isolate(agent, root)
+    try:
+        assert design_history.HISTORY_DIR == os.path.join(root, "history")
+        assert image_previews.PREVIEW_DIR == os.path.join(root, "preview")
+        assert job_queue._queue.journal_path == os.path.join(root, "jobs", "batch_jobs.jsonl")
+        assert design_history.DesignHistory("s1").path == os.path.join(root, "history", "s1.json")
+    finally:
+        job_queue._queue.shutdown()
+        agent.artifacts.close()
@@ -0,0 +1,84 @@
+import os
+import time
+
+from artifact_store import ArtifactStore
+from design_history import DesignHistory
+from retention import RetentionManager
+from session_state import SessionState
+
+
+def make_manager(tmp_path, **kwargs):
+    store = ArtifactStore(str(tmp_path / "artifacts"))
+    manager = RetentionManager(store=store, history_dir=str(tmp_path / "history"), archive_dir=str(tmp_path / "archive"),
+                               keep_recent=0, min_age_s=0, pause_s=0, **kwargs)
+    return store, manager
+
+
+def write_outputs(store, session, count):
+    paths = []
+    for turn in range(count):
+        path = store.allocate(session, turn, "initial")
+        with open(path, "wb") as f:
+            f.write(b"png")
+        paths.append(store.commit(path))
+    return paths
+
+
+def test_deletes_unreferenced_outputs_in_pages(tmp_path):
+    store, manager = make_manager(tmp_path, page=3, batch=2)
+    state = SessionState()
+    manager.track("s1", state)
+    paths = write_outputs(store, "s1", 7)
+    state["last_image_url"] = paths[-1]
+    assert manager.run_once()
+    assert store.lookup("s1") == [paths[-1]]
+    assert [os.path.exists(p) for p in paths] == [False] * 6 + [True]
+
+
+def test_output_made_live_after_the_scan_is_kept(tmp_path):
+    store, manager = make_manager(tmp_path, batch=1)
+    state = SessionState()
+    manager.track("s1", state)
+    paths = write_outputs(store, "s1", 3)
+    yields = []
+
+    def turn_in_between():
+        # A turn between two batches makes an already scanned output current again
+        yields.append(time.time())
+        if len(yields) == 3:
+            state["last_image_url"] = paths[2]
+        return True
+
+    manager._yield = turn_in_between
+    assert manager.run_once()
+    assert os.path.exists(paths[2])
+    assert store.lookup("s1") == [paths[2]]
+
+
+def test_print_tile_lives_as_long_as_its_output(tmp_path):
+    store, manager = make_manager(tmp_path)
+    state = SessionState()
+    manager.track("s1", state)
+    kept, dropped = write_outputs(store, "s1", 2)
+    tiles = []
+    for turn in range(2):
+        tile = store.allocate("s1", turn, "tile")
+        with open(tile, "wb") as f:
+            f.write(b"png")
+        tiles.append(store.commit(tile))
+    state["last_image_url"] = kept
+    assert manager.run_once()
+    assert sorted(store.lookup("s1")) == sorted([kept, tiles[0]])
+
+
+def test_history_of_an_idle_but_not_archived_session_is_kept(tmp_path, monkeypatch):
+    store, manager = make_manager(tmp_path)
+    paths = write_outputs(store, "s1", 3)
+    history = DesignHistory("s1", base_dir=str(tmp_path / "history"))
+    history.record(intent="initial", prompt="red flames", image_path=paths[0], seed=7)
+    # Three days later: the session has gone quiet but is not archived yet (7 days)
+    later = time.time() + 3 * 86400
+    monkeypatch.setattr("retention.time.time", lambda: later)
+    assert manager.run_once()
+    assert store.lookup("s1") == [paths[0]]
+    assert os.path.exists(paths[0])
@@ -0,0 +1,30 @@
+import pytest
+
+from session_state import FIELDS, SessionState
+from suggestion_cache import all_guidance_keys, representative_state
+
+
+def test_representative_states_are_valid_session_states():
+    # Regression: a key outside FIELDS made every guidance key fail in warm-suggestions
+    for key in all_guidance_keys():
+        intent, state = representative_state(key)
+        assert set(state) <= set(FIELDS)
+        assert SessionState(state)["last_intent"] == intent
+
+
+def test_unknown_field_raises():
+    with pytest.raises(KeyError):
+        SessionState({"last_object": "dog"})
+
+
+def test_dirty_tracking_and_compact_cache():
+    state = SessionState(last_color="red")
+    assert state.dirty_fields() == {"last_color"}
+    state.clear_dirty()
+    rendered = state.compact()
+    state["last_color"] = "red"  # same value: no change
+    assert state.dirty_fields() == set()
+    assert state.compact() is rendered
+    state["last_pattern"] = "flames"
+    assert state.dirty_fields() == {"last_pattern"}
+    assert state.compact() == '{"last_pattern":"flames","last_color":"red"}'
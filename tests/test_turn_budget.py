@@ -0,0 +1,44 @@
+import pytest
+
+import turn_budget
+from turn_budget import BudgetExceeded, TurnBudget
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(turn_budget.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_image_call_skipped_when_too_little_time_is_left(clock):
+    budget = TurnBudget(deadline_s=90.0, min_image_call_s=20.0)
+    clock[0] += 75.0
+    with pytest.raises(BudgetExceeded):
+        budget.charge_image_call()
+    assert budget.image_calls == 0
+
+
+def test_image_call_timeout_is_bounded_by_the_turn(clock):
+    budget = TurnBudget(deadline_s=90.0, min_image_call_s=20.0)
+    clock[0] += 60.0
+    budget.charge_image_call()
+    assert budget.timeout(120) == pytest.approx(30.0)
+    with pytest.raises(BudgetExceeded):
+        budget.charge_image_call()  # one image call per turn by default
+
+
+def test_nearly_spent_turn_still_affords_its_image_call(clock):
+    budget = TurnBudget(deadline_s=90.0, nearly_spent_ratio=0.8, min_image_call_s=20.0)
+    clock[0] += 60.0
+    # Nearly spent: the agent loop skips reflection and goes straight to the image call
+    assert budget.nearly_spent()
+    assert not budget.exhausted()
+    budget.charge_image_call()
+    assert budget.image_calls == 1
+
+
+def test_turn_is_exhausted_once_an_image_call_no_longer_fits(clock):
+    budget = TurnBudget(deadline_s=90.0, min_image_call_s=20.0)
+    clock[0] += 70.0
+    assert budget.exhausted()
@@ -1,23 +1,28 @@
-import requests
-def generate_background_image(prompt, api_key, output_path, style_type="enhance", seed=42):
+import stability_client
+import image_previews
+import image_registry
+import preflight
+def generate_background_image(prompt, api_key, output_path, style_type="enhance", seed=42, session_id=None, timeout=None):
+    prompt, style_type, seed = preflight.preflight_text2image(prompt, style_type, seed)
     host = "https://api.stability.ai/v2beta/stable-image/generate/core"
     headers = {"Authorization": f"Bearer {api_key}", "Accept": "image/*"}
     data = {
-        "prompt": (None, prompt),
-        "negative_prompt": (None, "character, human, figure, face, body, person, head, eyes, mouth, nose, text, animal, object, portrait, cartoon, cartoon character, anime, logo, signature, watermark, car, vehicle, automobile, wheel, tire, window, lights, branding, shadow, blurry, low quality"),
-        "output_format": (None, "png"),
-        "seed": (None, str(seed)),
-        "aspect_ratio": (None, "1:1"),
-        "style_preset": (None, style_type),
-        "denoising_strength": (None, "0.9"),
-        "guidance_scale": (None, "30"),
-        "num_inference_steps": (None, "60")
+        "prompt": prompt,
+        "negative_prompt": "character, human, figure, face, body, person, head, eyes, mouth, nose, text, animal, object, portrait, cartoon, cartoon character, anime, logo, signature, watermark, car, vehicle, automobile, wheel, tire, window, lights, branding, shadow, blurry, low quality",
+        "output_format": "png",
+        "seed": str(seed),
+        "aspect_ratio": "1:1",
+        "style_preset": style_type,
+        "denoising_strength": "0.9",
+        "guidance_scale": "30",
+        "num_inference_steps": "60"
     }
-    response = requests.post(host, headers=headers, files=data)
+    response = stability_client.post_multipart(host, headers=headers, fields=data, timeout=timeout)
     if response.status_code == 200:
-        with open(output_path, "wb") as out_file:
-            out_file.write(response.content)
+        image_registry.registry.put(output_path, response.content)
         print(f"✅ Image saved to: {output_path}")
+        if session_id is not None:
+            image_previews.try_write_previews(output_path, session_id)
         return output_path
     else:
         raise RuntimeError(f"Request failed: {response.status_code} - {response.text}")
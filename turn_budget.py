@@ -0,0 +1,106 @@
+import contextvars
+import os
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+class TurnBudget:
+    """
+    Per-turn limits on wall-clock time, LLM tokens and image generation calls.
+    The reflection loop and the tools consult it to degrade instead of running long.
+    """
+
+    def __init__(self, deadline_s=90.0, max_tokens=40000, max_image_calls=1, nearly_spent_ratio=0.8, min_image_call_s=20.0):
+        self.started = time.monotonic()
+        self.deadline_s = deadline_s
+        self.max_tokens = max_tokens
+        self.max_image_calls = max_image_calls
+        self.min_image_call_s = min_image_call_s
+        self.nearly_spent_ratio = nearly_spent_ratio
+        self.tokens_used = 0
+        self.image_calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            deadline_s=float(os.getenv("TURN_DEADLINE_S", "90")),
+            max_tokens=int(os.getenv("TURN_MAX_TOKENS", "40000")),
+            max_image_calls=int(os.getenv("TURN_MAX_IMAGE_CALLS", "1")),
+            min_image_call_s=float(os.getenv("TURN_MIN_IMAGE_CALL_S", "20"))
+        )
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining_time(self):
+        return max(0.0, self.deadline_s - self.elapsed())
+
+    def timeout(self, default):
+        """
+        Network timeout for the next call: never longer than what is left of the turn.
+        Image calls are only started with at least min_image_call_s left (charge_image_call).
+        """
+        return max(1.0, min(default, self.remaining_time()))
+
+    def charge_tokens(self, tokens):
+        self.tokens_used += tokens
+
+    def charge_image_call(self):
+        if self.image_calls >= self.max_image_calls:
+            raise BudgetExceeded(f"Image call budget of {self.max_image_calls} spent for this turn.")
+        # A generation takes 5-15s: starting one with less time left would only time out
+        if self.remaining_time() < self.min_image_call_s:
+            raise BudgetExceeded(f"Only {self.remaining_time():.0f}s left in this turn, not enough for an image generation.")
+        self.image_calls += 1
+
+    def spent_ratio(self):
+        # Time is measured against the deadline minus the image call reserve, so a turn
+        # that is "nearly spent" (and skips reflection) can still afford its image call
+        usable_s = max(1.0, self.deadline_s - self.min_image_call_s)
+        return max(self.elapsed() / usable_s, self.tokens_used / float(self.max_tokens))
+
+    def nearly_spent(self):
+        return self.spent_ratio() >= self.nearly_spent_ratio
+
+    def exhausted(self):
+        return self.spent_ratio() >= 1.0
+
+    def can_afford(self, seconds, tokens=0):
+        return seconds <= self.remaining_time() and self.tokens_used + tokens <= self.max_tokens
+
+    def summary(self):
+        return f"{self.elapsed():.1f}/{self.deadline_s:.0f}s, {self.tokens_used}/{self.max_tokens} tokens, {self.image_calls}/{self.max_image_calls} image calls"
+
+
+_current_budget = contextvars.ContextVar("current_turn_budget", default=None)
+
+
+def start_turn(budget=None):
+    budget = budget or TurnBudget.from_env()
+    _current_budget.set(budget)
+    return budget
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+class TokenMeter(BaseCallbackHandler):
+    """
+    Charges the token usage reported by every LLM call to the active turn budget.
+    """
+
+    def on_llm_end(self, response, **kwargs):
+        budget = current_budget()
+        if budget is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        budget.charge_tokens(usage.get("total_tokens", 0))
+
+
+token_meter = TokenMeter()
@@ -0,0 +1,83 @@
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import preflight
+import stability_client
+
+
+def load_masks(mask_dir=None):
+    """
+    Decode every mask once so the first edit turn finds them in the preflight cache.
+    """
+    if mask_dir is None:
+        mask_dir = os.path.join(os.getcwd(), "mask")
+    paths = sorted(glob.glob(os.path.join(mask_dir, "*.png")))
+    for path in paths:
+        preflight.image_info(path)
+    return len(paths)
+
+
+def warm_llm(model):
+    """
+    One-token completion to open the provider connection (TLS + HTTP keep-alive).
+    """
+    return model.bind(max_tokens=1).invoke("ping")
+
+
+class Warmup:
+    """
+    Runs cold-start work in background threads while the session waits for the
+    user's first input, so the first turn costs the same as the steady state.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup")
+        self.futures = {}
+        self.timings = {}
+        self.started = time.perf_counter()
+
+    def submit(self, name, fn, *args):
+        def timed():
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.timings[name] = time.perf_counter() - start
+
+        self.futures[name] = self.executor.submit(timed)
+        self.futures[name].add_done_callback(lambda f: self._report_failure(name, f))
+        return self.futures[name]
+
+    @staticmethod
+    def _report_failure(name, future):
+        if future.exception() is not None:
+            print(f"⚠️  Warmup '{name}' failed: {future.exception()}")
+
+    def wait(self, timeout=None):
+        for future in self.futures.values():
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+        self.executor.shutdown(wait=False)
+        return dict(self.timings)
+
+    def summary(self):
+        done = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in sorted(self.timings.items()))
+        return f"[Warmup]: {done}"
+
+
+def start_warmup(models, extra_tasks=None):
+    """
+    models: LLM backends the session will use; extra_tasks: {name: callable}.
+    """
+    warmup = Warmup()
+    warmup.submit("stability_connection", stability_client.warm)
+    warmup.submit("masks", load_masks)
+    for name, model in models.items():
+        warmup.submit(f"llm_{name}", warm_llm, model)
+    for name, fn in (extra_tasks or {}).items():
+        warmup.submit(name, fn)
+    return warmup